@@ -2,25 +2,103 @@ import argparse
 import subprocess
 import sys
 from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+import catalog  # noqa: E402
+import gazeProcess  # noqa: E402
+import match  # noqa: E402
+import visualizations  # noqa: E402
+from instrument import span, tracing  # noqa: E402
+from steps import is_up_to_date, record_step  # noqa: E402
 
 
 def run_step(cmd: list[str], description: str) -> None:
     """Run a pipeline step and exit on failure."""
     print(f"\n--- {description} ---")
-    result = subprocess.run(cmd, check=False)
+    with span(f"pipeline.{description}"):
+        result = subprocess.run(cmd, check=False)
     if result.returncode != 0:
         print(f"ERROR: {description} failed (exit code {result.returncode})")
         sys.exit(result.returncode)
 
 
+def run_cached_step(
+    cmd: list[str], description: str, step: str, name: str, params: dict[str, Any], force: bool = False
+) -> None:
+    """Run a pipeline step unless its outputs are up to date with its inputs."""
+    base = Path("data") / name
+    if not force and is_up_to_date(base, name, step, params):
+        print(f"\n--- {description} --- (up to date, skipped)")
+        return
+    run_step(cmd, description)
+    record_step(base, name, step, params)
+
+
+def run_in_memory(name: str, width: int, height: int, checkpoints: bool = False) -> None:
+    """Run process -> match -> visualize in this process, passing DataFrames between stages.
+
+    Only the final artifacts (renamed screenshots, heatmaps, scanpaths) are
+    written; with ``checkpoints`` the intermediate gaze_clean.csv and
+    gaze_posts/*.csv are written too, in the same format as the scripts.
+    """
+    base = Path("data") / name
+
+    print("\n--- Processing gaze data (in memory) ---")
+    clean = gazeProcess.clean_gaze_frame(str(base / "gaze.csv"), width, height)
+    if checkpoints:
+        gazeProcess.write_clean_frame(clean, str(base / "gaze_clean.csv"))
+
+    print("\n--- Matching data with post metadata (in memory) ---")
+    posts = match.match_frame(clean, name, f"{base}/")
+    if checkpoints:
+        match.save_split_files(pd.concat(posts.values()), f"{base}/gaze_posts/", name)
+
+    print("\n--- Generating visualizations (in memory) ---")
+    failed = visualizations.create_visualizations(list(posts), name, base, width, height, frames=posts)
+    visualizations.record_renders(name, list(posts))
+    with catalog.open_catalog(Path("data")) as conn:
+        catalog.register(conn, Path("data"), name, "gaze")
+        # only written with --checkpoints; register() skips files that do not exist
+        catalog.register(conn, Path("data"), name, "gaze_clean")
+        catalog.register(conn, Path("data"), name, "gaze_posts", posts)
+    if failed:
+        sys.exit(f"ERROR: visualizations failed for posts {', '.join(str(post_id) for post_id in failed)}")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Eye-tracking data collection and visualization pipeline")
     parser.add_argument("--duration", type=int, required=True, help="Recording duration in seconds")
     parser.add_argument("--name", type=str, required=True, help="Participant identifier")
     parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
     parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument("--force", action="store_true", help="Re-run steps even if their outputs are up to date")
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Run processing, matching and visualization in this process without intermediate CSVs",
+    )
+    parser.add_argument(
+        "--checkpoints",
+        action="store_true",
+        help="With --in-memory, also write gaze_clean.csv and gaze_posts/ for debugging",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Write a Chrome trace-event JSON of every stage to this file and print a summary table",
+    )
 
     args = parser.parse_args()
+    with tracing(args.trace):
+        run_pipeline(args)
+
+
+def run_pipeline(args: argparse.Namespace) -> None:
 
     # Create output directories
     base = Path("data") / args.name
@@ -35,7 +113,12 @@ def main() -> None:
         "Collecting eye-tracking data",
     )
 
-    run_step(
+    if args.in_memory:
+        run_in_memory(args.name, args.width, args.height, args.checkpoints)
+        print(f"\nPipeline completed for {args.name}")
+        return
+
+    run_cached_step(
         [
             sys.executable,
             "scripts/gazeProcess.py",
@@ -45,16 +128,28 @@ def main() -> None:
             str(args.height),
         ],
         "Processing gaze data",
+        "process",
+        args.name,
+        {"width": args.width, "height": args.height},
+        args.force,
     )
 
-    run_step(
+    run_cached_step(
         [sys.executable, "scripts/match.py", args.name],
         "Matching data with post metadata",
+        "match",
+        args.name,
+        {},
+        args.force,
     )
 
-    run_step(
+    run_cached_step(
         [sys.executable, "scripts/visualizations.py", args.name],
         "Generating visualizations",
+        "visualize",
+        args.name,
+        {},
+        args.force,
     )
 
     print(f"\nPipeline completed for {args.name}")
@@ -0,0 +1,259 @@
+"""
+Areas of interest (AOIs) and per-AOI gaze metrics for the whole cohort.
+
+AOIs are defined per post in a sidecar JSON file, ``data/aois.json``, in
+screen pixels, as rectangles ``[x0, y0, x1, y1]`` or polygons::
+
+    {
+        "20": [
+            {"name": "headline", "rect": [560, 140, 1360, 220]},
+            {"name": "image", "polygon": [[560, 240], [1360, 240], [1360, 900], [560, 900]]}
+        ]
+    }
+
+A participant folder can hold its own ``data/<name>/aois.json`` in the same
+format (layout.py writes the AOIs it proposes from that participant's
+screenshots there); its posts override the cohort file for that participant.
+
+The AOIs of a post are indexed in a grid of square cells, so the exact
+rectangle/polygon test only runs on the points whose cell overlaps the AOI's
+bounding box. ``aoi_metrics`` takes the per-post gaze of every participant,
+detects the fixations of all of them in one call and reports, per
+participant, post and AOI: fixation count, dwell time (summed fixation
+duration), time to first fixation from the first gaze sample of the post,
+revisits (entries after the first) and raw gaze samples.
+"""
+
+import argparse
+import json
+import math
+import sys
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import catalog
+import numpy
+import pandas as pd
+from fixations import detect_fixations
+
+
+AOI_FILE = "aois.json"
+CELL_SIZE = 64
+METRIC_COLUMNS = ["participant", "post_id", "aoi", "fixations", "dwell", "first_fixation", "revisits", "samples"]
+
+
+def parse_aoi(entry: dict[str, Any]) -> dict[str, Any]:
+    """Validate one sidecar entry and add its bounding box ``(x0, y0, x1, y1)``."""
+    if "rect" in entry:
+        x0, y0, x1, y1 = (float(value) for value in entry["rect"])
+        rect = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+        return {"name": entry["name"], "rect": rect, "bbox": rect}
+    if "polygon" in entry:
+        polygon = numpy.asarray(entry["polygon"], dtype=float)
+        if polygon.ndim != 2 or polygon.shape[0] < 3 or polygon.shape[1] != 2:
+            raise ValueError(f"AOI {entry.get('name')!r}: a polygon needs at least 3 [x, y] vertices")
+        return {"name": entry["name"], "polygon": polygon, "bbox": (*polygon.min(axis=0), *polygon.max(axis=0))}
+    raise ValueError(f"AOI {entry.get('name')!r} needs a 'rect' or a 'polygon'")
+
+
+def load_aois(path: Path = Path("data") / AOI_FILE) -> dict[int, list[dict[str, Any]]]:
+    """AOIs of every post in the sidecar file, keyed by post ID."""
+    with open(path) as f:
+        raw = json.load(f)
+    return {int(post_id): [parse_aoi(entry) for entry in entries] for post_id, entries in raw.items()}
+
+
+def load_participant_aois(
+    names: Iterable[str], data_dir: Path = Path("data")
+) -> dict[str, dict[int, list[dict[str, Any]]]]:
+    """Participant-specific AOIs of ``names`` that have a sidecar file in their folder."""
+    return {name: load_aois(data_dir / name / AOI_FILE) for name in names if (data_dir / name / AOI_FILE).is_file()}
+
+
+def aoi_sets(
+    gaze: pd.DataFrame,
+    aois: dict[int, list[dict[str, Any]]],
+    participant_aois: dict[str, dict[int, list[dict[str, Any]]]],
+) -> list[tuple[int, list[str], list[dict[str, Any]]]]:
+    """(post ID, participants, AOIs) groups: participant-specific AOIs first, the cohort AOIs for the rest."""
+    sets = []
+    seen = gaze[["participant", "postID"]].drop_duplicates()
+    for post_id, group in seen.groupby("postID"):
+        own = [name for name in group["participant"] if post_id in participant_aois.get(name, {})]
+        sets += [(post_id, [name], participant_aois[name][post_id]) for name in own]
+        rest = [name for name in group["participant"] if name not in own]
+        if rest and post_id in aois:
+            sets.append((post_id, rest, aois[post_id]))
+    return sets
+
+
+def build_index(
+    aois: list[dict[str, Any]], width: int = 1920, height: int = 1080, cell: int = CELL_SIZE
+) -> dict[str, Any]:
+    """Grid index of one post's AOIs: for each AOI, the cells its bounding box overlaps."""
+    cols, rows = math.ceil(width / cell), math.ceil(height / cell)
+    cells = numpy.zeros((len(aois), rows, cols), dtype=bool)
+    for a, aoi in enumerate(aois):
+        x0, y0, x1, y1 = aoi["bbox"]
+        c0, c1 = (int(numpy.clip(value // cell, 0, cols - 1)) for value in (x0, x1))
+        r0, r1 = (int(numpy.clip(value // cell, 0, rows - 1)) for value in (y0, y1))
+        if x1 >= 0 and y1 >= 0 and x0 < width and y0 < height:
+            cells[a, r0 : r1 + 1, c0 : c1 + 1] = True
+    return {"aois": aois, "cell": cell, "cols": cols, "rows": rows, "cells": cells.reshape(len(aois), -1)}
+
+
+def contains(aoi: dict[str, Any], x: numpy.ndarray, y: numpy.ndarray) -> numpy.ndarray:
+    """Which points lie inside the AOI (polygons use the even-odd rule)."""
+    if "rect" in aoi:
+        x0, y0, x1, y1 = aoi["rect"]
+        return (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+    inside = numpy.zeros(len(x), dtype=bool)
+    polygon = aoi["polygon"]
+    for (xa, ya), (xb, yb) in zip(polygon, numpy.roll(polygon, -1, axis=0), strict=True):
+        crosses = (ya > y) != (yb > y)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            edge_x = xa + (y - ya) * (xb - xa) / (yb - ya)
+        inside ^= crosses & (x < edge_x)
+    return inside
+
+
+def hit_test(index: dict[str, Any], x: Any, y: Any) -> numpy.ndarray:
+    """(points, AOIs) boolean matrix of which AOIs contain each point."""
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    hits = numpy.zeros((len(x), len(index["aois"])), dtype=bool)
+    col = numpy.floor(x / index["cell"])
+    row = numpy.floor(y / index["cell"])
+    on_grid = numpy.flatnonzero((col >= 0) & (col < index["cols"]) & (row >= 0) & (row < index["rows"]))
+    cell_ids = (row[on_grid] * index["cols"] + col[on_grid]).astype(numpy.int64)
+    for a, aoi in enumerate(index["aois"]):
+        # exact test only on the points in cells the AOI overlaps
+        candidates = on_grid[index["cells"][a][cell_ids]]
+        hits[candidates[contains(aoi, x[candidates], y[candidates])], a] = True
+    return hits
+
+
+def gaze_post_files(name: str, data_dir: Path = Path("data")) -> list[Path]:
+    """Per-post gaze CSVs of ``name``, from the catalogue when it matches the gaze_posts folder."""
+    with catalog.open_catalog(data_dir) as conn:
+        return catalog.listed_files(conn, data_dir, name, "gaze_posts")
+
+
+def load_cohort_gaze(
+    names: Iterable[str], data_dir: Path = Path("data"), posts: Iterable[int] | None = None
+) -> pd.DataFrame:
+    """Matched gaze of every participant in one frame, with a ``participant`` column."""
+    wanted = None if posts is None else {int(post) for post in posts}
+    frames = []
+    for name in names:
+        for path in gaze_post_files(name, data_dir):
+            frame = pd.read_csv(path, usecols=["x", "y", "time_seconds", "postID"])
+            if wanted is None or int(frame["postID"].iloc[0]) in wanted:
+                frames.append(frame.assign(participant=name))
+    if not frames:
+        return pd.DataFrame(columns=["x", "y", "time_seconds", "postID", "participant"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def aoi_metrics(
+    gaze: pd.DataFrame,
+    aois: dict[int, list[dict[str, Any]]],
+    width: int = 1920,
+    height: int = 1080,
+    participant_aois: dict[str, dict[int, list[dict[str, Any]]]] | None = None,
+) -> pd.DataFrame:
+    """Per participant, post and AOI metrics of the cohort's gaze (see the module docstring).
+
+    ``participant_aois`` maps participant names to AOIs that replace ``aois`` for their posts.
+    """
+    participant_aois = participant_aois or {}
+    post_ids = set(aois).union(*participant_aois.values())
+    gaze = gaze[gaze["postID"].isin(post_ids)].sort_values(["participant", "postID", "time_seconds"], kind="stable")
+    gaze = gaze.reset_index(drop=True)
+    keys = gaze.groupby(["participant", "postID"], sort=False).ngroup().to_numpy()
+    post_start = gaze.groupby(["participant", "postID"], sort=False)["time_seconds"].transform("min").to_numpy()
+
+    fixations = detect_fixations(gaze["x"], gaze["y"], gaze["time_seconds"], groups=keys)
+    first = fixations["first"]
+    fix = pd.DataFrame(
+        {
+            "participant": gaze["participant"].to_numpy()[first],
+            "post_id": gaze["postID"].to_numpy()[first],
+            "x": fixations["x"],
+            "y": fixations["y"],
+            "since_start": fixations["start"] - post_start[first],
+            "duration": fixations["duration"],
+        }
+    )
+
+    results = []
+    for post_id, participants, post_aois in aoi_sets(gaze, aois, participant_aois):
+        post_gaze = gaze[(gaze["postID"] == post_id) & gaze["participant"].isin(participants)]
+        post_fix = fix[(fix["post_id"] == post_id) & fix["participant"].isin(participants)]
+        index = build_index(post_aois, width, height)
+        fix_hits = hit_test(index, post_fix["x"], post_fix["y"])
+        sample_hits = hit_test(index, post_gaze["x"], post_gaze["y"])
+        # a visit starts at an in-AOI fixation whose predecessor (of the same participant) was outside
+        new_participant = (post_fix["participant"] != post_fix["participant"].shift()).to_numpy()
+
+        for a, aoi in enumerate(post_aois):
+            inside = fix_hits[:, a]
+            previous = numpy.concatenate(([False], inside[:-1]))
+            per_fixation = pd.DataFrame(
+                {
+                    "participant": post_fix["participant"].to_numpy(),
+                    "fixations": inside,
+                    "dwell": numpy.where(inside, post_fix["duration"], 0.0),
+                    "first_fixation": numpy.where(inside, post_fix["since_start"], numpy.nan),
+                    "visits": inside & (~previous | new_participant),
+                }
+            )
+            table = per_fixation.groupby("participant").agg(
+                fixations=("fixations", "sum"),
+                dwell=("dwell", "sum"),
+                first_fixation=("first_fixation", "min"),
+                visits=("visits", "sum"),
+            )
+            table = table.reindex(participants).fillna({"fixations": 0, "dwell": 0.0, "visits": 0})
+            table["samples"] = pd.Series(sample_hits[:, a], index=post_gaze["participant"]).groupby(level=0).sum()
+            table["revisits"] = (table["visits"] - 1).clip(lower=0)
+            results.append(table.rename_axis("participant").reset_index().assign(post_id=post_id, aoi=aoi["name"]))
+
+    if not results:
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+    metrics = pd.concat(results, ignore_index=True)[METRIC_COLUMNS]
+    return metrics.astype({"fixations": int, "revisits": int, "samples": int})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Dwell, first fixation and revisits per area of interest")
+    parser.add_argument("names", nargs="*", help="Participants (default: every participant with gaze_posts/)")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument(
+        "--aois", type=str, default=None, help=f"Cohort AOI sidecar file (default: <data-dir>/{AOI_FILE})"
+    )
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the metrics to this CSV file")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    aoi_file = Path(args.aois) if args.aois else data_dir / AOI_FILE
+    aois = load_aois(aoi_file) if aoi_file.is_file() else {}
+    names = args.names or sorted(path.parent.name for path in data_dir.glob("*/gaze_posts"))
+    participant_aois = load_participant_aois(names, data_dir)
+    if not aois and not participant_aois:
+        sys.exit(f"ERROR: no AOIs found; write {aoi_file} or propose them with scripts/layout.py")
+    gaze = load_cohort_gaze(names, data_dir, set(aois).union(*participant_aois.values()))
+    metrics = aoi_metrics(gaze, aois, args.width, args.height, participant_aois)
+
+    if args.output:
+        metrics.to_csv(args.output, index=False)
+        print(f"{len(metrics)} rows written to {args.output}")
+    else:
+        print(metrics.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
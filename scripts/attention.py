@@ -0,0 +1,264 @@
+"""
+Time-binned attention curves per post.
+
+Heatmaps collapse time; this stage keeps it. The gaze of every participant
+and post is cut into fixed windows (``--bin``, 250 ms by default) from the
+first sample of the post. The samples of each window are counted per region,
+either the cells of a coarse screen grid (``--grid 4x3``) or the AOIs of the
+post (``--aois``, see aoi.py; samples outside every AOI go to ``other``).
+The result is a (participants x posts, bins, regions) tensor of sample counts,
+stored ragged: each participant and post only keeps the bins it covers.
+
+The whole cohort is counted with one ``bincount`` over the combined
+(participant and post, bin, region) index. Cohort curves are the mean over
+participants of each bin's region shares. The tensors can be exported as a
+tidy CSV (one row per participant, post, bin and region) or an ``.npz``, and
+the cohort curves plotted as one stacked-area chart per post.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Any
+
+import matplotlib
+
+
+matplotlib.use("Agg")
+
+import numpy  # noqa: E402
+import pandas as pd  # noqa: E402
+from aoi import (  # noqa: E402
+    AOI_FILE,
+    aoi_sets,
+    build_index,
+    hit_test,
+    load_aois,
+    load_cohort_gaze,
+    load_participant_aois,
+)
+from matplotlib import pyplot  # noqa: E402
+
+
+BIN_SECONDS = 0.25
+GRID = (4, 3)
+
+
+def grid_regions(
+    x: Any, y: Any, width: int = 1920, height: int = 1080, grid: tuple[int, int] = GRID
+) -> tuple[numpy.ndarray, list[str]]:
+    """Region index of every sample in a ``columns x rows`` screen grid, and the region names (``r<row>c<col>``)."""
+    columns, rows = grid
+    col = numpy.clip((numpy.asarray(x, dtype=float) * columns / width).astype(int), 0, columns - 1)
+    row = numpy.clip((numpy.asarray(y, dtype=float) * rows / height).astype(int), 0, rows - 1)
+    return row * columns + col, [f"r{r}c{c}" for r in range(rows) for c in range(columns)]
+
+
+def aoi_regions(
+    gaze: pd.DataFrame,
+    aois: dict[int, list[dict[str, Any]]],
+    participant_aois: dict[str, dict[int, list[dict[str, Any]]]],
+    width: int = 1920,
+    height: int = 1080,
+) -> tuple[numpy.ndarray, list[str]]:
+    """Region index of every sample: the first AOI of its post containing it, by AOI name, else ``other``."""
+    names: list[str] = []
+    for _, _, post_aois in aoi_sets(gaze, aois, participant_aois):
+        names += [aoi["name"] for aoi in post_aois if aoi["name"] not in names]
+    names.append("other")
+    regions = numpy.full(len(gaze), len(names) - 1)
+    for post_id, participants, post_aois in aoi_sets(gaze, aois, participant_aois):
+        rows = numpy.flatnonzero(((gaze["postID"] == post_id) & gaze["participant"].isin(participants)).to_numpy())
+        hits = hit_test(build_index(post_aois, width, height), gaze["x"].to_numpy()[rows], gaze["y"].to_numpy()[rows])
+        ids = numpy.array([names.index(aoi["name"]) for aoi in post_aois])
+        inside = hits.any(axis=1)
+        regions[rows[inside]] = ids[hits[inside].argmax(axis=1)]
+    return regions, names
+
+
+def attention_tensors(
+    gaze: pd.DataFrame, regions: numpy.ndarray, region_count: int, bin_seconds: float = BIN_SECONDS
+) -> dict[str, Any]:
+    """Sample counts per (participant and post, time bin, region) of the cohort's gaze.
+
+    Groups cover different numbers of bins, so the tensor is stored ragged:
+    ``counts`` is (bins of all groups, regions) and the bins of group ``g`` are
+    the rows ``offsets[g]:offsets[g + 1]``. Also returns ``keys`` (the
+    participant and post of each group), ``bins`` (the number of bins of each
+    group) and ``bin_seconds``.
+    """
+    grouped = gaze.groupby(["participant", "postID"], sort=True)
+    group = grouped.ngroup().to_numpy()
+    since_start = gaze["time_seconds"].to_numpy(dtype=float) - grouped["time_seconds"].transform("min").to_numpy()
+    bins = (since_start / bin_seconds).astype(numpy.int64)
+    groups = int(group.max()) + 1 if len(group) else 0
+
+    covered = numpy.zeros(groups, dtype=numpy.int64)
+    numpy.maximum.at(covered, group, bins + 1)
+    offsets = numpy.concatenate(([0], numpy.cumsum(covered)))
+    index = (offsets[group] + bins) * region_count + regions
+    counts = numpy.bincount(index, minlength=int(offsets[-1]) * region_count)
+    return {
+        "counts": counts.reshape(int(offsets[-1]), region_count),
+        "offsets": offsets,
+        "keys": list(grouped.groups.keys()),
+        "bins": covered,
+        "bin_seconds": bin_seconds,
+    }
+
+
+def bin_rows(tensors: dict[str, Any]) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Group and bin index of every row of the ragged ``counts``."""
+    group = numpy.repeat(numpy.arange(len(tensors["bins"])), tensors["bins"])
+    return group, numpy.arange(len(group)) - tensors["offsets"][group]
+
+
+def shares(counts: numpy.ndarray) -> numpy.ndarray:
+    """Share of each bin's samples per region; NaN for bins without samples."""
+    totals = counts.sum(axis=-1, keepdims=True)
+    return numpy.divide(counts, totals, out=numpy.full(counts.shape, numpy.nan), where=totals > 0)
+
+
+def cohort_curves(tensors: dict[str, Any]) -> dict[int, numpy.ndarray]:
+    """Per post, the (bins, regions) mean over participants of the region shares of each bin.
+
+    A curve is as long as the post's longest group; bins where no participant
+    has samples stay NaN.
+    """
+    post_ids = numpy.array([post_id for _, post_id in tensors["keys"]])
+    counts = tensors["counts"]
+    region_count = counts.shape[1]
+    group, bin_index = bin_rows(tensors)
+    per_row = shares(counts)
+    sampled = counts.sum(axis=1) > 0
+    curves = {}
+    for post_id in numpy.unique(post_ids):
+        rows = numpy.flatnonzero((post_ids[group] == post_id) & sampled)
+        length = int(tensors["bins"][post_ids == post_id].max())
+        cells = (bin_index[rows, None] * region_count + numpy.arange(region_count)).ravel()
+        total = numpy.bincount(cells, weights=per_row[rows].ravel(), minlength=length * region_count)
+        members = numpy.bincount(bin_index[rows], minlength=length)[:, None]
+        curves[int(post_id)] = numpy.divide(
+            total.reshape(length, region_count),
+            members,
+            out=numpy.full((length, region_count), numpy.nan),
+            where=members > 0,
+        )
+    return curves
+
+
+def to_frame(tensors: dict[str, Any], region_names: list[str]) -> pd.DataFrame:
+    """Tidy table of the tensors: participant, post_id, bin, start, region, samples and share."""
+    counts = tensors["counts"]
+    rows, region_count = counts.shape
+    group, bin_index = (numpy.repeat(values, region_count) for values in bin_rows(tensors))
+    region = numpy.tile(numpy.arange(region_count), rows)
+    keys = numpy.array(tensors["keys"], dtype=object).reshape(-1, 2)
+    return pd.DataFrame(
+        {
+            "participant": keys[group, 0],
+            "post_id": keys[group, 1].astype(int),
+            "bin": bin_index,
+            "start": bin_index * tensors["bin_seconds"],
+            "region": numpy.array(region_names)[region],
+            "samples": counts.ravel(),
+            "share": shares(counts).ravel(),
+        }
+    )
+
+
+def plot_curves(curves: dict[int, numpy.ndarray], region_names: list[str], bin_seconds: float, out_dir: Path) -> None:
+    """One stacked-area chart of the cohort's region shares over time per post."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for post_id, curve in curves.items():
+        fig, ax = pyplot.subplots(figsize=(10, 4))
+        ax.stackplot(
+            numpy.arange(len(curve)) * bin_seconds,
+            numpy.nan_to_num(curve).T,
+            labels=region_names,
+            colors=pyplot.get_cmap("tab20").colors[: len(region_names)],
+            step="post",
+        )
+        ax.set_xlabel("seconds since the post appeared")
+        ax.set_ylabel("share of gaze")
+        ax.set_ylim(0, 1)
+        ax.set_title(f"Post {post_id}")
+        ax.legend(loc="center left", bbox_to_anchor=(1, 0.5), fontsize="small")
+        fig.savefig(out_dir / f"attention_{post_id}.png", dpi=120, bbox_inches="tight")
+        pyplot.close(fig)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time-binned attention per screen region or AOI, per participant and post",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # 250 ms bins over a 4x3 screen grid, tidy CSV of every participant and post
+  python scripts/attention.py --output attention.csv
+
+  # 500 ms bins over the AOIs, cohort curves plotted per post
+  python scripts/attention.py alice bob --bin 0.5 --aois --plot attention_plots
+        """,
+    )
+    parser.add_argument("names", nargs="*", help="Participants (default: every participant with gaze_posts/)")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--bin", type=float, default=BIN_SECONDS, help="Bin width in seconds (default: 0.25)")
+    parser.add_argument("--grid", type=str, default="4x3", help="Screen grid COLUMNSxROWS (default: 4x3)")
+    parser.add_argument("--aois", action="store_true", help=f"Count per AOI ({AOI_FILE}) instead of grid cell")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the tidy table to this CSV file")
+    parser.add_argument("--npz", type=str, default=None, help="Write the ragged count tensor and its keys to this .npz")
+    parser.add_argument("--plot", type=str, default=None, help="Write the cohort curves of every post to this folder")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    names = args.names or sorted(path.parent.name for path in data_dir.glob("*/gaze_posts"))
+    if args.aois:
+        aois = load_aois(data_dir / AOI_FILE) if (data_dir / AOI_FILE).is_file() else {}
+        participant_aois = load_participant_aois(names, data_dir)
+        gaze = load_cohort_gaze(names, data_dir, set(aois).union(*participant_aois.values()))
+        regions, region_names = aoi_regions(gaze, aois, participant_aois, args.width, args.height)
+    else:
+        columns, rows = (int(value) for value in args.grid.lower().split("x"))
+        gaze = load_cohort_gaze(names, data_dir)
+        regions, region_names = grid_regions(gaze["x"], gaze["y"], args.width, args.height, (columns, rows))
+    if gaze.empty:
+        sys.exit("ERROR: no matched gaze found")
+
+    tensors = attention_tensors(gaze, regions, len(region_names), args.bin)
+    counts = tensors["counts"]
+    print(
+        f"{len(tensors['keys'])} participant-posts, {counts.shape[0]} bins of {args.bin:g}s in total "
+        f"x {counts.shape[1]} regions"
+    )
+
+    if args.output:
+        table = to_frame(tensors, region_names)
+        table.to_csv(args.output, index=False)
+        print(f"{len(table)} rows written to {args.output}")
+    if args.npz:
+        keys = numpy.array(tensors["keys"], dtype=object).reshape(-1, 2)
+        numpy.savez_compressed(
+            args.npz,
+            counts=counts,
+            offsets=tensors["offsets"],
+            participants=keys[:, 0].astype(str),
+            post_ids=keys[:, 1].astype(int),
+            bins=tensors["bins"],
+            regions=numpy.array(region_names),
+            bin_seconds=args.bin,
+        )
+        print(f"Tensor written to {args.npz}")
+    curves = cohort_curves(tensors)
+    if args.plot:
+        plot_curves(curves, region_names, args.bin, Path(args.plot))
+        print(f"{len(curves)} cohort curves written to {args.plot}")
+    for post_id, curve in curves.items():
+        peak = numpy.nanargmax(numpy.nanmean(curve, axis=0)) if len(curve) else 0
+        print(f"Post {post_id}: {len(curve)} bins, most watched region {region_names[peak]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+SQLite catalogue of participants, sessions, posts and artifacts.
+
+The stages record what they read and write in ``data/catalog.db``: every
+participant, its session (experiment start, sample count), the time window of
+every post it saw, and every artifact (raw gaze, cleaned gaze, per-post gaze,
+screenshots, heatmaps, scanpaths) with its size, mtime and sha256. Lookups
+such as "participants who saw post 20", "post IDs with gaze for alice" or
+"heatmaps older than their gaze" are indexed queries instead of directory
+scans. The database runs in WAL mode so parallel batch jobs can write while
+others read; every update happens in one transaction.
+
+Participants processed before the catalogue existed can be indexed with
+``python scripts/catalog.py sync``.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+
+CATALOG_NAME = "catalog.db"
+
+# Conventional location of each artifact kind under data/<participant>/.
+ARTIFACT_PATHS = {
+    "gaze": "gaze.csv",
+    "gaze_clean": "gaze_clean.csv",
+    "times": "times/{name}_posts_times.json",
+    "gaze_posts": "gaze_posts/{name}_gaze_{post_id}.csv",
+    "screenshot": "screenshots/{name}_screenshot_{post_id}.png",
+    "heatmap": "heatmaps/{name}_heatmap_{post_id}.png",
+    "scanpath": "scanpath/{name}_scanpath_{post_id}.png",
+}
+# Timestamped frames not yet assigned to a post: screenshots/screenshot_<time>.png
+FRAME_KIND = "frame"
+FRAME_PATTERN = "screenshots/screenshot_*.png"
+
+# Cohort-wide folders of the data directory; every other folder is a participant.
+DATASET_DIR = "gaze_dataset"  # dataset.py
+INDEX_DIR = "gaze_index"  # gaze_index.py
+SIMILARITY_DIR = "similarity"  # tools/scanpath_similarity.py
+NON_PARTICIPANT_DIRS = {DATASET_DIR, INDEX_DIR, SIMILARITY_DIR}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    name TEXT PRIMARY KEY,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    participant TEXT PRIMARY KEY REFERENCES participants(name) ON DELETE CASCADE,
+    initial_date TEXT,
+    samples INTEGER,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posts (
+    participant TEXT NOT NULL REFERENCES participants(name) ON DELETE CASCADE,
+    post_id INTEGER NOT NULL,
+    start_seconds REAL NOT NULL,
+    end_seconds REAL NOT NULL,
+    start_time TEXT,
+    end_time TEXT,
+    PRIMARY KEY (participant, post_id)
+);
+CREATE INDEX IF NOT EXISTS posts_by_post ON posts(post_id);
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    participant TEXT NOT NULL REFERENCES participants(name) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    post_id INTEGER,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_by_participant ON artifacts(participant, kind, post_id);
+CREATE INDEX IF NOT EXISTS artifacts_by_post ON artifacts(post_id, kind);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def connect(data_dir: Path = Path("data")) -> sqlite3.Connection:
+    """Open (and create if needed) the catalogue of ``data_dir``."""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(data_dir / CATALOG_NAME, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+@contextmanager
+def open_catalog(data_dir: Path = Path("data")) -> Iterator[sqlite3.Connection]:
+    """Connection whose changes are committed together on success and rolled back on error."""
+    conn = connect(data_dir)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def artifact_path(name: str, kind: str, post_id: Any = None) -> str:
+    """Path of an artifact relative to the data directory, e.g. 'alice/heatmaps/alice_heatmap_20.png'."""
+    return f"{name}/" + ARTIFACT_PATHS[kind].format(name=name, post_id=post_id)
+
+
+def participant_names(data_dir: Path = Path("data")) -> list[str]:
+    """Names of the participant folders of the data directory."""
+    return sorted(
+        path.name
+        for path in data_dir.iterdir()
+        if path.is_dir() and path.name not in NON_PARTICIPANT_DIRS and not path.name.startswith(".")
+    )
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _ensure_participant(conn: sqlite3.Connection, name: str) -> None:
+    conn.execute(
+        "INSERT INTO participants (name, updated_at) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET updated_at = excluded.updated_at",
+        (name, _now()),
+    )
+
+
+def register_files(
+    conn: sqlite3.Connection,
+    data_dir: Path,
+    name: str,
+    kind: str,
+    files: Iterable[tuple[str, Any]],
+) -> int:
+    """Upsert ``(relative path, post_id)`` artifacts that exist on disk; returns how many were recorded.
+
+    A file is only re-hashed when its size or mtime changed since it was recorded.
+    """
+    _ensure_participant(conn, name)
+    recorded = 0
+    for rel, post_id in files:
+        path = data_dir / rel
+        if not path.is_file():
+            continue
+        stat = path.stat()
+        row = conn.execute("SELECT size, mtime_ns, sha256 FROM artifacts WHERE path = ?", (rel,)).fetchone()
+        unchanged = row is not None and row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns
+        sha256 = row["sha256"] if unchanged else _sha256(path)
+        conn.execute(
+            "INSERT INTO artifacts (path, participant, kind, post_id, size, mtime_ns, sha256, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET participant = excluded.participant, kind = excluded.kind, "
+            "post_id = excluded.post_id, size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "sha256 = excluded.sha256, updated_at = excluded.updated_at",
+            (
+                rel,
+                name,
+                kind,
+                None if post_id is None else int(post_id),
+                stat.st_size,
+                stat.st_mtime_ns,
+                sha256,
+                _now(),
+            ),
+        )
+        recorded += 1
+    return recorded
+
+
+def register(
+    conn: sqlite3.Connection, data_dir: Path, name: str, kind: str, post_ids: Iterable[Any] | None = None
+) -> int:
+    """Record the conventional artifacts of ``kind`` for ``name`` (one per post for per-post kinds)."""
+    if "{post_id}" not in ARTIFACT_PATHS[kind]:
+        return register_files(conn, data_dir, name, kind, [(artifact_path(name, kind), None)])
+    return register_files(
+        conn, data_dir, name, kind, [(artifact_path(name, kind, post_id), post_id) for post_id in post_ids or []]
+    )
+
+
+def forget(conn: sqlite3.Connection, paths: Iterable[str]) -> None:
+    """Remove artifacts (relative paths) from the catalogue."""
+    conn.executemany("DELETE FROM artifacts WHERE path = ?", [(path,) for path in paths])
+
+
+def prune_missing(conn: sqlite3.Connection, data_dir: Path, name: str) -> int:
+    """Forget the artifacts of ``name`` whose files no longer exist; returns how many."""
+    rows = conn.execute("SELECT path FROM artifacts WHERE participant = ?", (name,)).fetchall()
+    missing = [row["path"] for row in rows if not (data_dir / row["path"]).is_file()]
+    forget(conn, missing)
+    return len(missing)
+
+
+def record_session(conn: sqlite3.Connection, name: str, json_data: list[Any], samples: int | None = None) -> None:
+    """Store the session of ``name`` and the time window of every post from its times JSON."""
+    _ensure_participant(conn, name)
+    initial_date = json_data[0]["initialDate"] if json_data else None
+    conn.execute(
+        "INSERT INTO sessions (participant, initial_date, samples, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(participant) DO UPDATE SET initial_date = excluded.initial_date, "
+        "samples = COALESCE(excluded.samples, sessions.samples), updated_at = excluded.updated_at",
+        (name, initial_date, samples, _now()),
+    )
+    rows = []
+    for obj in json_data:
+        start = datetime.strptime(obj["initialDate"], "%Y-%m-%dT%H:%M:%S.%fZ")
+        rows.append(
+            (
+                name,
+                int(obj["postID"]),
+                obj["PostStartTime"],
+                obj["PostEndTime"],
+                (start + timedelta(seconds=obj["PostStartTime"])).isoformat(),
+                (start + timedelta(seconds=obj["PostEndTime"])).isoformat(),
+            )
+        )
+    conn.executemany(
+        "INSERT OR REPLACE INTO posts (participant, post_id, start_seconds, end_seconds, start_time, end_time) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def post_ids(conn: sqlite3.Connection, name: str, kind: str = "gaze_posts") -> list[int]:
+    """Post IDs of ``name`` that have an artifact of ``kind``."""
+    rows = conn.execute(
+        "SELECT post_id FROM artifacts WHERE participant = ? AND kind = ? AND post_id IS NOT NULL ORDER BY post_id",
+        (name, kind),
+    )
+    return [row["post_id"] for row in rows]
+
+
+def artifacts(conn: sqlite3.Connection, name: str, kind: str) -> list[sqlite3.Row]:
+    """Catalogued artifacts of ``kind`` for ``name``."""
+    return conn.execute(
+        "SELECT * FROM artifacts WHERE participant = ? AND kind = ? ORDER BY path", (name, kind)
+    ).fetchall()
+
+
+def listed_files(conn: sqlite3.Connection, data_dir: Path, name: str, kind: str) -> list[Path]:
+    """Files of ``kind`` for ``name``: the catalogued ones when they match the disk, else the folder listing.
+
+    Files copied in or deleted by hand make the two disagree; the disk wins and
+    the rows whose file is gone are forgotten.
+    """
+    pattern = FRAME_PATTERN if kind == FRAME_KIND else ARTIFACT_PATHS[kind].format(name=name, post_id="*")
+    on_disk = sorted((data_dir / name).glob(pattern))
+    catalogued = [data_dir / row["path"] for row in artifacts(conn, name, kind)]
+    if sorted(catalogued) == on_disk:
+        return catalogued
+    forget(conn, [path.relative_to(data_dir).as_posix() for path in catalogued if not path.is_file()])
+    return on_disk
+
+
+def participants_for_post(conn: sqlite3.Connection, post_id: int) -> list[str]:
+    """Participants whose session showed ``post_id``."""
+    rows = conn.execute("SELECT participant FROM posts WHERE post_id = ? ORDER BY participant", (post_id,))
+    return [row["participant"] for row in rows]
+
+
+def stale_artifacts(conn: sqlite3.Connection, kind: str = "heatmap", source: str = "gaze_posts") -> list[sqlite3.Row]:
+    """Posts whose ``kind`` artifact is missing or older than its ``source`` artifact."""
+    return conn.execute(
+        "SELECT s.participant, s.post_id, s.path AS source, a.path AS path "
+        "FROM artifacts s LEFT JOIN artifacts a "
+        "ON a.participant = s.participant AND a.post_id = s.post_id AND a.kind = ? "
+        "WHERE s.kind = ? AND s.post_id IS NOT NULL AND (a.path IS NULL OR a.mtime_ns < s.mtime_ns) "
+        "ORDER BY s.participant, s.post_id",
+        (kind, source),
+    ).fetchall()
+
+
+def sync_participant(conn: sqlite3.Connection, data_dir: Path, name: str) -> int:
+    """Index an existing participant folder by the file-name conventions; returns the artifacts recorded."""
+    base = data_dir / name
+    recorded = 0
+    for kind, pattern in ARTIFACT_PATHS.items():
+        if "{post_id}" not in pattern:
+            recorded += register(conn, data_dir, name, kind)
+            continue
+        template = re.escape(pattern.format(name=name, post_id="\0")).replace("\0", r"(\d+)")
+        files = []
+        for path in base.glob(pattern.format(name=name, post_id="*")):
+            found = re.fullmatch(template, path.relative_to(base).as_posix())
+            if found:
+                files.append((f"{name}/{found.group(0)}", int(found.group(1))))
+        recorded += register_files(conn, data_dir, name, kind, files)
+
+    frames = [(f"{name}/screenshots/{path.name}", None) for path in base.glob(FRAME_PATTERN)]
+    recorded += register_files(conn, data_dir, name, FRAME_KIND, frames)
+    prune_missing(conn, data_dir, name)
+
+    times = base / ARTIFACT_PATHS["times"].format(name=name)
+    if times.is_file():
+        with open(times) as f:
+            record_session(conn, name, json.load(f))
+    return recorded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query or rebuild the data catalogue")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sync = commands.add_parser("sync", help="Index existing participant folders")
+    sync.add_argument("names", nargs="*", help="Participants to index (default: every participant folder)")
+    post = commands.add_parser("post", help="Participants who saw a post")
+    post.add_argument("post_id", type=int)
+    stale = commands.add_parser("stale", help="Visualizations missing or older than their gaze")
+    stale.add_argument("--kind", choices=["heatmap", "scanpath"], default="heatmap")
+    listing = commands.add_parser("list", help="Artifacts of a participant")
+    listing.add_argument("name")
+    listing.add_argument("--kind", choices=[*ARTIFACT_PATHS, FRAME_KIND], default="gaze_posts")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    with open_catalog(data_dir) as conn:
+        if args.command == "sync":
+            names = args.names or participant_names(data_dir)
+            for name in names:
+                print(f"{name}: {sync_participant(conn, data_dir, name)} artifacts")
+        elif args.command == "post":
+            print("\n".join(participants_for_post(conn, args.post_id)))
+        elif args.command == "stale":
+            rows = stale_artifacts(conn, args.kind)
+            for row in rows:
+                print(f"{row['participant']} post {row['post_id']}: {row['path'] or 'missing'}")
+            if not rows:
+                print(f"No stale {args.kind}s")
+        elif args.command == "list":
+            for row in artifacts(conn, args.name, args.kind):
+                print(f"{row['path']}\t{row['size']}\t{row['sha256'][:12]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Columnar cohort dataset of the matched gaze of every participant.
+
+Exports the per-post gaze CSVs (``data/<name>/gaze_posts/``) into one Parquet
+dataset under ``data/gaze_dataset``, hive-partitioned by participant and
+post::
+
+    data/gaze_dataset/participant=alice/post_id=20/part-0.parquet
+
+Columns use compact dtypes (int16 screen coordinates, millisecond
+timestamps, dictionary-encoded screenshot names). ``time_seconds`` stays
+float64: float32 rounding moves fixation boundaries, and reads must give the
+same metrics as the CSVs. Exporting a participant only replaces that
+participant's partitions, so new participants are appended without rewriting
+the others. Reads push participant/post
+filters down to the partition directories and other predicates down to the
+Parquet row groups, so a cross-participant query only opens the files it needs.
+
+Requires pyarrow, which the rest of the pipeline does not need
+(``uv sync --extra dataset``). It is imported on first use.
+"""
+
+import argparse
+import sys
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import catalog
+import pandas as pd
+
+
+DATASET_NAME = catalog.DATASET_DIR
+
+
+def _require_pyarrow() -> tuple[Any, Any]:
+    """The ``pyarrow`` and ``pyarrow.dataset`` modules, imported on first use."""
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError("the gaze dataset needs pyarrow: install it with `uv sync --extra dataset`") from e
+    return pa, ds
+
+
+def partition_schema() -> Any:
+    pa, _ = _require_pyarrow()
+    return pa.schema([("participant", pa.string()), ("post_id", pa.int32())])
+
+
+def gaze_schema() -> Any:
+    """Schema of the dataset; the partition keys are stored in the directory names, not the files."""
+    pa, _ = _require_pyarrow()
+    columns = pa.schema(
+        [
+            ("x", pa.int16()),
+            ("y", pa.int16()),
+            ("time_seconds", pa.float64()),
+            ("current_time", pa.timestamp("ms")),
+            ("screenshot_filename", pa.dictionary(pa.int32(), pa.string())),
+        ]
+    )
+    return pa.unify_schemas([columns, partition_schema()])
+
+
+def partitioning() -> Any:
+    _, ds = _require_pyarrow()
+    return ds.partitioning(partition_schema(), flavor="hive")
+
+
+def compact_frame(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Per-post gaze as written by match.py, converted to the dataset's columns and dtypes."""
+    return pd.DataFrame(
+        {
+            "x": df["x"].astype("int16"),
+            "y": df["y"].astype("int16"),
+            "time_seconds": df["time_seconds"].astype("float64"),
+            "current_time": pd.to_datetime(df["current_time"]).astype("datetime64[ms]"),
+            "screenshot_filename": df.get("screenshot_filename", pd.Series(None, index=df.index, dtype=object))
+            .astype("string")
+            .astype("category"),
+            "participant": name,
+            "post_id": df["postID"].astype("int32"),
+        }
+    )
+
+
+def export_participant(name: str, data_dir: Path = Path("data"), dataset_dir: Path | None = None) -> int:
+    """Write the matched gaze of ``name`` into the dataset, replacing only its own partitions.
+
+    Returns the number of rows written.
+    """
+    pa, ds = _require_pyarrow()
+    dataset_dir = dataset_dir or data_dir / DATASET_NAME
+    with catalog.open_catalog(data_dir) as conn:
+        files = catalog.listed_files(conn, data_dir, name, "gaze_posts")
+    if not files:
+        return 0
+
+    frame = pd.concat([compact_frame(pd.read_csv(path), name) for path in files], ignore_index=True)
+    table = pa.Table.from_pandas(frame, schema=gaze_schema(), preserve_index=False)
+    ds.write_dataset(
+        table,
+        dataset_dir,
+        format="parquet",
+        partitioning=partitioning(),
+        basename_template="part-{i}.parquet",
+        # only the participant/post directories present in this table are replaced
+        existing_data_behavior="delete_matching",
+    )
+    return table.num_rows
+
+
+def open_dataset(dataset_dir: Path = Path("data") / DATASET_NAME) -> Any:
+    """The gaze dataset as a pyarrow Dataset, for custom scans."""
+    _, ds = _require_pyarrow()
+    return ds.dataset(dataset_dir, format="parquet", partitioning=partitioning())
+
+
+def read_gaze(
+    dataset_dir: Path = Path("data") / DATASET_NAME,
+    participants: Iterable[str] | None = None,
+    posts: Iterable[int] | None = None,
+    columns: list[str] | None = None,
+    where: Any = None,
+) -> pd.DataFrame:
+    """Read gaze rows, pruning partitions by participant/post and row groups by ``where``.
+
+    ``where`` is an optional ``pyarrow.dataset`` expression, e.g.
+    ``ds.field("time_seconds") < 5``.
+    """
+    _, ds = _require_pyarrow()
+    dataset = open_dataset(dataset_dir)
+    predicate = where
+    if participants is not None:
+        term = ds.field("participant").isin(list(participants))
+        predicate = term if predicate is None else predicate & term
+    if posts is not None:
+        term = ds.field("post_id").isin([int(post) for post in posts])
+        predicate = term if predicate is None else predicate & term
+    return dataset.to_table(columns=columns, filter=predicate).to_pandas()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export or read the partitioned gaze dataset")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write participants' matched gaze into the dataset")
+    export.add_argument("names", nargs="*", help="Participants (default: every participant with gaze_posts/)")
+    read = commands.add_parser("read", help="Summarize the rows matching a filter")
+    read.add_argument("--participant", "-p", nargs="+", default=None)
+    read.add_argument("--post", nargs="+", type=int, default=None)
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    try:
+        if args.command == "export":
+            names = args.names or sorted(path.parent.name for path in data_dir.glob("*/gaze_posts"))
+            for name in names:
+                print(f"{name}: {export_participant(name, data_dir)} rows")
+        else:
+            gaze = read_gaze(data_dir / DATASET_NAME, args.participant, args.post)
+            print(gaze.groupby(["participant", "post_id"], observed=True).size().rename("rows").to_string())
+    except ImportError as e:
+        sys.exit(f"ERROR: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Blink and track-loss events of a recorded session.
+
+Every run of raw samples (``gaze.csv``) where an eye is not tracked is an
+event. Runs are found by run-length encoding the validity mask, and the
+per-run sample counts come from cumulative sums, so detection is one pass of
+array operations over the session. Each run is classified by its duration and
+which eyes were lost:
+
+- blink: both eyes lost for BLINK_MIN_DURATION to BLINK_MAX_DURATION seconds,
+  inside the recording
+- loss: both eyes lost for a shorter or longer time (dropout, looking away)
+- monocular: only one eye lost for the whole run
+
+Events are assigned to the post shown when they started and written to
+``data/<name>/events.csv``. The per-post summary includes the blink rate
+(blinks per minute of the post), a common engagement signal.
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any
+
+import catalog
+import numpy as np
+import pandas as pd
+from match import raw_post_ids
+
+
+EVENTS_FILE = "events.csv"
+# Typical blink durations; shorter binocular runs are dropouts, longer ones track loss
+BLINK_MIN_DURATION = 0.05
+BLINK_MAX_DURATION = 0.5
+EVENT_COLUMNS = ["post_id", "kind", "eye", "start", "duration", "samples"]
+
+
+def runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """``[start, end)`` indices of the runs of True in a 1-D mask."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_events(
+    t: Any,
+    left: Any,
+    right: Any,
+    blink_min: float = BLINK_MIN_DURATION,
+    blink_max: float = BLINK_MAX_DURATION,
+) -> pd.DataFrame:
+    """Events of a session from the sample times and the per-sample validity of each eye.
+
+    Returns one row per run of samples missing at least one eye, with ``kind``
+    (blink, loss or monocular), ``eye`` (both, left or right: the eye lost in
+    most of the run), ``start`` (time of the first missing sample), ``duration``
+    (seconds, including one sample interval), ``samples`` and ``first`` (index
+    of the first missing sample).
+    """
+    t = np.asarray(t, dtype=float)
+    left = np.asarray(left, dtype=bool)
+    right = np.asarray(right, dtype=bool)
+    starts, ends = runs(~(left & right))
+    if len(starts) == 0:
+        return pd.DataFrame(columns=EVENT_COLUMNS[1:])
+
+    def per_run(lost: np.ndarray) -> np.ndarray:
+        total = np.concatenate(([0], np.cumsum(lost)))
+        return total[ends] - total[starts]
+
+    # samples of each run with both eyes lost and with only the left or the right eye lost
+    counts = {"both": per_run(~left & ~right), "left": per_run(~left & right), "right": per_run(left & ~right)}
+    interval = float(np.median(np.diff(t))) if len(t) > 1 else 0.0
+    duration = t[ends - 1] - t[starts] + interval
+    binocular = counts["both"] > 0
+    # a run cut by the start or end of the recording has no known duration, so it is never a blink
+    bounded = (starts > 0) & (ends < len(t))
+    blink = binocular & bounded & (duration >= blink_min) & (duration <= blink_max)
+    kind = np.where(blink, "blink", np.where(binocular, "loss", "monocular"))
+    eye = np.where(binocular, "both", np.where(counts["left"] >= counts["right"], "left", "right"))
+    return pd.DataFrame(
+        {"kind": kind, "eye": eye, "start": t[starts], "duration": duration, "samples": ends - starts}
+    ).assign(first=starts)
+
+
+def session_events(name: str, data_dir: Path = Path("data")) -> pd.DataFrame:
+    """Events of a participant's raw gaze, with the post each one started in; written to events.csv."""
+    columns = ["time_seconds", "current_time", "left_x", "left_y", "right_x", "right_y"]
+    raw = pd.read_csv(data_dir / catalog.artifact_path(name, "gaze"), usecols=columns)
+    left_x, left_y, right_x, right_y = (
+        pd.to_numeric(raw[column], errors="coerce").to_numpy(dtype=float)
+        for column in ["left_x", "left_y", "right_x", "right_y"]
+    )
+    left = ~np.isnan(left_x) & ~np.isnan(left_y)
+    right = ~np.isnan(right_x) & ~np.isnan(right_y)
+    events = detect_events(raw["time_seconds"], left, right)
+
+    times_file = data_dir / catalog.artifact_path(name, "times")
+    post_ids = np.full(len(events), None, dtype=object)
+    if times_file.is_file() and len(events):
+        with open(times_file) as f:
+            posts = json.load(f)
+        post_ids = raw_post_ids(raw["current_time"].iloc[events["first"]].reset_index(drop=True), posts)
+    events = events.drop(columns="first", errors="ignore")
+    events.insert(0, "post_id", pd.array(post_ids, dtype="Int64"))
+    events.to_csv(data_dir / name / EVENTS_FILE, index=False)
+    return events
+
+
+def post_summary(events: pd.DataFrame, times_file: Path) -> pd.DataFrame:
+    """Blinks, blink rate per minute, losses and lost seconds of every post of the times JSON."""
+    with open(times_file) as f:
+        posts = json.load(f)
+    summary = pd.DataFrame(
+        {"post_id": [int(post["postID"]) for post in posts], "seconds": [post["PostTimeSpent"] for post in posts]}
+    ).set_index("post_id")
+    in_posts = events.dropna(subset=["post_id"])
+    counts = in_posts.groupby(["post_id", "kind"]).size().unstack(fill_value=0)
+    for kind, column in [("blink", "blinks"), ("loss", "losses"), ("monocular", "monocular")]:
+        summary[column] = counts[kind].reindex(summary.index, fill_value=0) if kind in counts else 0
+    summary["blink_rate"] = summary["blinks"] / summary["seconds"].where(summary["seconds"] > 0) * 60
+    lost = in_posts[in_posts["kind"] == "loss"].groupby("post_id")["duration"].sum()
+    summary["lost_seconds"] = lost.reindex(summary.index, fill_value=0.0)
+    return summary.reset_index()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Blink and track-loss events of recorded sessions")
+    parser.add_argument("names", nargs="+", help="Participant names")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    for name in args.names:
+        events = session_events(name, data_dir)
+        kinds = events["kind"].value_counts()
+        print(
+            f"{name}: {kinds.get('blink', 0)} blinks, {kinds.get('loss', 0)} losses, "
+            f"{kinds.get('monocular', 0)} monocular runs -> {data_dir / name / EVENTS_FILE}"
+        )
+        times_file = data_dir / catalog.artifact_path(name, "times")
+        if times_file.is_file():
+            with pd.option_context("display.width", 200, "display.float_format", "{:.2f}".format):
+                print(post_summary(events, times_file).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
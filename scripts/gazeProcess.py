@@ -1,10 +1,16 @@
 import argparse
 import csv
 import math
+from pathlib import Path
 
+import catalog
+import numpy as np
+import pandas as pd
+from instrument import span, traced
 from utils import linear_interpolate, try_float
 
 
+@traced("gazeProcess.process_gaze_data")
 def process_gaze_data(input_file: str, output_file: str, width: int, height: int) -> None:
     rows = []
 
@@ -12,7 +18,11 @@ def process_gaze_data(input_file: str, output_file: str, width: int, height: int
     Read the data obtained by the generate.py
     clean the data, avergae left and right and int values
     """
-    with open(input_file) as infile, open(output_file, mode="w", newline="") as outfile:
+    with (
+        span("gazeProcess.read") as read_span,
+        open(input_file) as infile,
+        open(output_file, mode="w", newline="") as outfile,
+    ):
         reader = csv.DictReader(infile)
         fieldnames = ["time_seconds", "current_time", "x", "y"]
 
@@ -45,10 +55,12 @@ def process_gaze_data(input_file: str, output_file: str, width: int, height: int
                     "time_seconds": row["time_seconds"],
                 }
             )
+        read_span["rows"] = len(rows)
 
     process_nans(rows, output_file)
 
 
+@traced("gazeProcess.process_nans", rows=lambda rows, *_: len(rows))
 def process_nans(rows: list[dict[str, str | int | float]], output_file: str) -> None:
     problems = []
     is_in_nans = False
@@ -101,6 +113,81 @@ def process_nans(rows: list[dict[str, str | int | float]], output_file: str) ->
             writer.writerow(row)
 
 
+@traced("gazeProcess.clean_gaze_frame")
+def clean_gaze_frame(input_file: str, width: int, height: int) -> pd.DataFrame:
+    """
+    In-memory, vectorized equivalent of process_gaze_data + process_nans.
+
+    Returns the cleaned gaze as a DataFrame with the columns of gaze_clean.csv
+    (x, y, time_seconds, current_time) and the same values: missing eyes are
+    filled from the other eye, NaN runs in x are linearly interpolated from
+    their neighbours (truncated to int), the leading NaN run is dropped and
+    time_seconds starts at 0 on the first valid sample. x and y are int64
+    unless an unclosed trailing NaN run leaves them float64 with NaNs.
+    """
+    raw = pd.read_csv(input_file, dtype=str, keep_default_na=False)
+    left_x, left_y, right_x, right_y = (
+        pd.to_numeric(raw[column], errors="coerce").to_numpy(dtype=float)
+        for column in ["left_x", "left_y", "right_x", "right_y"]
+    )
+
+    left_x = np.where(np.isnan(left_x), right_x, left_x)
+    left_y = np.where(np.isnan(left_y), right_y, left_y)
+    right_x = np.where(np.isnan(right_x), left_x, right_x)
+    right_y = np.where(np.isnan(right_y), left_y, right_y)
+    x = np.trunc((left_x + right_x) / 2 * width)
+    y = np.trunc((left_y + right_y) / 2 * height)
+
+    # previous and next valid x around every sample
+    index = np.arange(len(x))
+    valid = ~np.isnan(x)
+    before = np.maximum.accumulate(np.where(valid, index, -1))
+    after = np.minimum.accumulate(np.where(valid, index, len(x))[::-1])[::-1]
+    closed = ~valid & (before >= 0) & (after < len(x))
+
+    # interpolate closed runs from their endpoints, as linear_interpolate does
+    b, a = before[closed], after[closed]
+    steps = (index[closed] - b).astype(float)
+    distance = (a - b).astype(float)
+    for values in (x, y):
+        filled = values[b] + (values[a] - values[b]) * steps / distance
+        values[closed] = np.trunc(filled)
+
+    first = int(np.argmax(valid)) if valid.any() else 0
+    time_seconds = np.array([float(value) for value in raw["time_seconds"]])
+    clean = pd.DataFrame(
+        {
+            "x": x[first:],
+            "y": y[first:],
+            "time_seconds": time_seconds[first:] - time_seconds[first],
+            "current_time": raw["current_time"].to_numpy()[first:],
+        }
+    )
+    for column in ["x", "y"]:
+        if not clean[column].isna().any():
+            clean[column] = clean[column].astype(np.int64)
+    return clean
+
+
+def write_clean_frame(clean: pd.DataFrame, output_file: str) -> None:
+    """Write a frame from clean_gaze_frame in the exact format of process_nans."""
+
+    def cell(value: float) -> int | float:
+        return value if math.isnan(value) else int(value)
+
+    with open(output_file, mode="w", newline="") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["x", "y", "time_seconds", "current_time"])
+        for x, y, time_seconds, current_time in zip(
+            clean["x"].tolist(),
+            clean["y"].tolist(),
+            clean["time_seconds"].tolist(),
+            clean["current_time"].tolist(),
+            strict=True,
+        ):
+            writer.writerow([cell(x), cell(y), time_seconds, current_time])
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process gaze data")
     parser.add_argument("input_file", type=str, help="Path to the input file")
@@ -115,3 +202,16 @@ if __name__ == "__main__":
     height = args.height
 
     process_gaze_data(input_file, output_file, width, height)
+
+    # data/<name>/gaze.csv -> data/<name>/gaze_clean.csv is participant <name> in the data/ catalogue;
+    # files cleaned anywhere else are not tracked
+    participant_dir = Path(output_file).parent
+    name, data_dir = participant_dir.name, participant_dir.parent
+    if (
+        name
+        and Path(output_file) == data_dir / catalog.artifact_path(name, "gaze_clean")
+        and Path(input_file) == data_dir / catalog.artifact_path(name, "gaze")
+    ):
+        with catalog.open_catalog(data_dir) as conn:
+            catalog.register(conn, data_dir, name, "gaze")
+            catalog.register(conn, data_dir, name, "gaze_clean")
@@ -0,0 +1,262 @@
+"""
+Persistent spatial-temporal index over the matched gaze of the whole cohort.
+
+Answers questions such as "which participants looked at region R of post P
+within the first 2 seconds" without loading every ``gaze_posts`` CSV. For
+every post, the samples of all participants are stored as memory-mapped
+columns under ``data/gaze_index/post_<id>/``:
+
+- ``x.npy`` / ``y.npy``: screen coordinates floored to whole pixels (int16), off-screen ones included
+- ``t.npy``: seconds since the participant's first sample of the post (float32)
+- ``participant.npy``: index into the participant list of ``meta.json`` (int32)
+- ``offsets.npy``: start of every grid cell in the columns (int64, cells + 1)
+
+Samples are sorted by uniform grid cell (``CELL_SIZE`` pixels, row-major;
+off-screen samples go to the nearest border cell) and, within a cell, by
+time, so the cells of a grid row covered by a region are one contiguous slice
+of the columns. A region and time-window query reads
+one slice per grid row the region overlaps and filters it with the exact
+bounds, so it touches a few pages of the memory-mapped columns instead of the
+whole cohort.
+
+``build`` re-indexes only the posts whose gaze changed, comparing the sha256
+of every participant's CSV recorded in the data catalogue. Participants
+already in the index stay in it: building for a few names adds or refreshes
+them, and a post is dropped only once no participant has gaze for it.
+"""
+
+import argparse
+import hashlib
+import json
+import shutil
+import sys
+import time
+from collections.abc import Iterable
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import catalog
+import numpy as np
+import pandas as pd
+from aoi import gaze_post_files
+
+
+INDEX_NAME = catalog.INDEX_DIR
+# Bump when the layout changes, so every post is re-indexed.
+INDEX_VERSION = 2
+CELL_SIZE = 32
+COLUMNS = ["x", "y", "t", "participant"]
+
+
+def _grid(width: int, height: int, cell_size: int) -> tuple[int, int]:
+    return -(-width // cell_size), -(-height // cell_size)
+
+
+def _is_complete(post_dir: Path) -> bool:
+    # cleanup.py --budget may evict single column files
+    return all((post_dir / f"{column}.npy").is_file() for column in [*COLUMNS, "offsets"])
+
+
+def _load_meta(index_dir: Path) -> dict[str, Any]:
+    path = index_dir / "meta.json"
+    if not path.is_file():
+        return {"version": INDEX_VERSION, "posts": {}}
+    with open(path) as f:
+        meta = json.load(f)
+    return meta if meta.get("version") == INDEX_VERSION else {"version": INDEX_VERSION, "posts": {}}
+
+
+def index_post(
+    post_dir: Path, gaze: pd.DataFrame, participants: list[str], width: int, height: int, cell_size: int
+) -> int:
+    """Write the sorted columns and cell offsets of one post's cohort gaze; returns the sample count."""
+    gaze = gaze.dropna(subset=["x", "y"])
+    columns, rows = _grid(width, height, cell_size)
+    limits = np.iinfo(np.int16)
+    x = np.floor(gaze["x"].to_numpy(dtype=np.float64)).clip(limits.min, limits.max)
+    y = np.floor(gaze["y"].to_numpy(dtype=np.float64)).clip(limits.min, limits.max)
+    code = pd.Categorical(gaze["participant"], categories=participants).codes.astype(np.int32)
+    start = gaze.groupby("participant")["time_seconds"].transform("min").to_numpy()
+    t = (gaze["time_seconds"].to_numpy(dtype=np.float64) - start).astype(np.float32)
+    # only the cell is clipped to the screen: a query's bounds test sees the unclipped whole-pixel coordinates
+    cell_row = (y // cell_size).astype(np.int64).clip(0, rows - 1)
+    cell = cell_row * columns + (x // cell_size).astype(np.int64).clip(0, columns - 1)
+
+    order = np.lexsort((t, cell))
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(cell, minlength=columns * rows))))
+    tmp = post_dir.with_name(post_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "x.npy", x[order].astype(np.int16))
+    np.save(tmp / "y.npy", y[order].astype(np.int16))
+    np.save(tmp / "t.npy", t[order])
+    np.save(tmp / "participant.npy", code[order])
+    np.save(tmp / "offsets.npy", offsets.astype(np.int64))
+    # swap the finished post in, so a reader never sees half-written columns
+    shutil.rmtree(post_dir, ignore_errors=True)
+    tmp.rename(post_dir)
+    return len(order)
+
+
+def build_index(
+    names: Iterable[str],
+    data_dir: Path = Path("data"),
+    width: int = 1920,
+    height: int = 1080,
+    cell_size: int = CELL_SIZE,
+    force: bool = False,
+) -> dict[int, int | None]:
+    """Index every post of ``names`` and of the participants already indexed.
+
+    Returns the samples of each re-indexed post (None when up to date). Posts
+    none of these participants has gaze for any more are removed.
+    """
+    index_dir = data_dir / INDEX_NAME
+    meta = _load_meta(index_dir)
+    # a post holds the whole cohort, so the participants indexed before are re-read, not replaced by ``names``
+    indexed = {participant for entry in meta["posts"].values() for participant in entry["participants"]}
+    files: dict[int, dict[str, Path]] = {}
+    for name in sorted(indexed.union(names)):
+        for path in gaze_post_files(name, data_dir):
+            files.setdefault(int(path.stem.rsplit("_", 1)[1]), {})[name] = path
+
+    results: dict[int, int | None] = {}
+    params = {"width": width, "height": height, "cell_size": cell_size}
+    with catalog.open_catalog(data_dir) as conn:
+        for post_id, sources in sorted(files.items()):
+            hashes = {}
+            for name, path in sorted(sources.items()):
+                rel = path.relative_to(data_dir).as_posix()
+                catalog.register_files(conn, data_dir, name, "gaze_posts", [(rel, post_id)])
+                row = conn.execute("SELECT sha256 FROM artifacts WHERE path = ?", (rel,)).fetchone()
+                hashes[name] = row["sha256"]
+            key = hashlib.sha256(json.dumps({"params": params, "gaze": hashes}, sort_keys=True).encode()).hexdigest()
+            entry = meta["posts"].get(str(post_id))
+            if not force and entry is not None and entry["key"] == key and _is_complete(index_dir / f"post_{post_id}"):
+                results[post_id] = None
+                continue
+
+            participants = sorted(sources)
+            gaze = pd.concat(
+                [
+                    pd.read_csv(sources[name], usecols=["x", "y", "time_seconds"]).assign(participant=name)
+                    for name in participants
+                ],
+                ignore_index=True,
+            )
+            samples = index_post(index_dir / f"post_{post_id}", gaze, participants, width, height, cell_size)
+            meta["posts"][str(post_id)] = {"key": key, "participants": participants, "samples": samples, **params}
+            results[post_id] = samples
+
+    for stale in set(meta["posts"]) - {str(post_id) for post_id in files}:
+        del meta["posts"][stale]
+        shutil.rmtree(index_dir / f"post_{stale}", ignore_errors=True)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with open(index_dir / "meta.json", "w") as f:
+        json.dump(meta, f, indent=4)
+    open_post.cache_clear()
+    return results
+
+
+@lru_cache(maxsize=64)
+def open_post(index_dir: Path, post_id: int) -> dict[str, Any]:
+    """Memory-mapped columns and metadata of one indexed post."""
+    entry = _load_meta(index_dir)["posts"].get(str(post_id))
+    post_dir = index_dir / f"post_{post_id}"
+    if entry is None or not _is_complete(post_dir):
+        raise KeyError(f"post {post_id} is not indexed; run `python scripts/gaze_index.py build`")
+    columns = {column: np.load(post_dir / f"{column}.npy", mmap_mode="r") for column in [*COLUMNS, "offsets"]}
+    return {**entry, **columns}
+
+
+def query(
+    post_id: int,
+    rect: tuple[float, float, float, float],
+    start: float = 0.0,
+    end: float = float("inf"),
+    index_dir: Path = Path("data") / INDEX_NAME,
+) -> pd.DataFrame:
+    """Participants with gaze in ``rect`` = (x0, y0, x1, y1) of ``post_id`` between ``start`` and ``end`` seconds.
+
+    Times count from each participant's first sample of the post. Returns one
+    row per participant with the matching ``samples`` and the ``first`` time
+    they looked at the region.
+    """
+    post = open_post(index_dir, int(post_id))
+    cell_size, width, height = post["cell_size"], post["width"], post["height"]
+    columns, rows = _grid(width, height, cell_size)
+    x0, y0, x1, y1 = rect
+    col0, col1 = max(int(x0 // cell_size), 0), min(int(x1 // cell_size), columns - 1)
+    row0, row1 = max(int(y0 // cell_size), 0), min(int(y1 // cell_size), rows - 1)
+
+    offsets = post["offsets"]
+    found_participant, found_t = [], []
+    for row in range(row0, row1 + 1):
+        # the cells of a grid row are one contiguous slice of the columns
+        lo, hi = int(offsets[row * columns + col0]), int(offsets[row * columns + col1 + 1])
+        if lo == hi:
+            continue
+        t, x, y = (np.asarray(post[column][lo:hi]) for column in ["t", "x", "y"])
+        keep = (t >= start) & (t <= end) & (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        found_participant.append(np.asarray(post["participant"][lo:hi])[keep])
+        found_t.append(t[keep])
+
+    participants = np.array(post["participants"])
+    code = np.concatenate(found_participant) if found_participant else np.zeros(0, dtype=np.int32)
+    samples = np.bincount(code, minlength=len(participants))
+    first = np.full(len(participants), np.inf, dtype=np.float32)
+    np.minimum.at(first, code, np.concatenate(found_t) if found_t else np.zeros(0, dtype=np.float32))
+    seen = np.flatnonzero(samples)
+    table = pd.DataFrame({"participant": participants[seen], "samples": samples[seen], "first": first[seen]})
+    return table.sort_values("first", kind="stable").reset_index(drop=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build or query the spatial-temporal gaze index",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Index every participant with gaze_posts/ (only changed posts are rebuilt)
+  python scripts/gaze_index.py build
+
+  # Who looked at the headline of post 20 within the first 2 seconds?
+  python scripts/gaze_index.py query --post 20 --rect 560 140 1360 220 --start 0 --end 2
+        """,
+    )
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index the matched gaze of participants")
+    build.add_argument("names", nargs="*", help="Participants (default: every participant with gaze_posts/)")
+    build.add_argument("--cell-size", type=int, default=CELL_SIZE, help=f"Grid cell in pixels (default: {CELL_SIZE})")
+    build.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    build.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    build.add_argument("--force", action="store_true", help="Re-index every post")
+    ask = commands.add_parser("query", help="Participants with gaze in a region and time window")
+    ask.add_argument("--post", type=int, required=True, help="Post ID")
+    ask.add_argument("--rect", type=float, nargs=4, required=True, metavar=("X0", "Y0", "X1", "Y1"))
+    ask.add_argument("--start", type=float, default=0.0, help="Window start, seconds since the post appeared")
+    ask.add_argument("--end", type=float, default=float("inf"), help="Window end, seconds since the post appeared")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if args.command == "build":
+        names = args.names or sorted(path.parent.name for path in data_dir.glob("*/gaze_posts"))
+        results = build_index(names, data_dir, args.width, args.height, args.cell_size, args.force)
+        built = {post_id: samples for post_id, samples in results.items() if samples is not None}
+        print(f"{len(built)} posts indexed ({sum(built.values())} samples), {len(results) - len(built)} up to date")
+        return
+
+    began = time.perf_counter()
+    try:
+        table = query(args.post, tuple(args.rect), args.start, args.end, data_dir / INDEX_NAME)
+    except KeyError as e:
+        sys.exit(f"ERROR: {e.args[0]}")
+    elapsed = (time.perf_counter() - began) * 1000
+    print(table.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+    print(f"{len(table)} participants, {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
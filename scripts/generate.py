@@ -5,6 +5,7 @@ import sys
 from typing import Any
 
 import tobii_research as tr
+from screenshot import take_screenshots
 from utils import get_current_time_iso8601, make_beep
 
 
@@ -104,7 +105,8 @@ def main() -> None:
 
     print(f"Collecting gaze data for {collection_duration} seconds...")
 
-    subprocess.run(["python", "scripts/screenshot.py", name, str(collection_duration)])
+    # captured in this process so frames and gaze samples share one clock
+    take_screenshots(name, collection_duration)
 
     # time.sleep(collection_duration)
     print(f"Unsubscribing from gaze data for eye tracker with serial number {eyetracker.serial_number}.")
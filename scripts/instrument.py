@@ -0,0 +1,249 @@
+"""
+Lightweight timing, memory and throughput instrumentation for the pipeline.
+
+Wrap a stage in ``span(name, rows=...)`` or decorate it with ``traced(name)``
+to record its wall time, the process peak RSS, the tracemalloc peak (only when
+``EYETRACKER_TRACEMALLOC=1``, since tracing allocations slows Python down) and
+rows per second. Spans are only recorded while ``EYETRACKER_TRACE_DIR`` is set
+(or after ``keep_events``); every process writes its spans there on exit as
+Chrome trace-event JSON, and ``merge_traces`` combines them into one file that
+loads in chrome://tracing or Perfetto. ``summary_table`` aggregates the spans per stage. ``tracing`` wires
+this up for a whole run, including the scripts started as subprocesses.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+
+TRACE_DIR_ENV = "EYETRACKER_TRACE_DIR"
+TRACEMALLOC_ENV = "EYETRACKER_TRACEMALLOC"
+
+_events: list[dict[str, Any]] = []
+_keep = False
+_local = threading.local()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB (0 when unavailable)."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()  # type: ignore[attr-defined]
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):  # type: ignore[attr-defined]
+            return 0.0
+        return counters.PeakWorkingSetSize / 2**20
+
+    if sys.platform.startswith("linux"):
+        # ru_maxrss survives execve, so a freshly spawned process would report its parent's peak
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 2**10
+        except OSError:
+            pass
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def keep_events() -> None:
+    """Record spans in this process even when no trace directory is set, for callers reading ``events()``."""
+    global _keep
+    _keep = True
+
+
+def _recording() -> bool:
+    return _keep or bool(os.environ.get(TRACE_DIR_ENV))
+
+
+def _tracemalloc_enabled() -> bool:
+    if os.environ.get(TRACEMALLOC_ENV) == "1" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return tracemalloc.is_tracing()
+
+
+@contextmanager
+def span(name: str, rows: int | None = None, **args: Any) -> Iterator[dict[str, Any]]:
+    """Record the duration and memory of the enclosed block under ``name``.
+
+    Yields the span's args dict, so the block can fill in ``rows`` once it
+    knows how many rows it handled. Without a trace directory nothing is
+    measured or kept, so long-lived workers don't accumulate spans.
+    """
+    record: dict[str, Any] = {"rows": rows, **args}
+    if not _recording():
+        yield record
+        return
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+
+    memory = _tracemalloc_enabled()
+    if memory:
+        # fold the running peak into the enclosing span before resetting it
+        if stack:
+            stack[-1]["_peak"] = max(stack[-1].get("_peak", 0), tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    stack.append(record)
+
+    ts = time.time_ns() // 1000
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        if memory:
+            peak = max(record.pop("_peak", 0), tracemalloc.get_traced_memory()[1])
+            record["tracemalloc_peak_mb"] = round(peak / 2**20, 3)
+            if stack:
+                stack[-1]["_peak"] = max(stack[-1].get("_peak", 0), peak)
+        record["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        if record.get("rows") is not None and duration > 0:
+            record["rows_per_s"] = round(record["rows"] / duration, 1)
+        _events.append(
+            {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": ts,
+                "dur": round(duration * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {key: value for key, value in record.items() if value is not None},
+            }
+        )
+
+
+def traced(name: str, rows: Callable[..., int] | None = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator version of span; ``rows`` computes the row count from the call arguments."""
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name, rows=rows(*args, **kwargs) if rows is not None else None):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def events() -> list[dict[str, Any]]:
+    """Spans recorded so far in this process, as Chrome trace events."""
+    # a forked child inherits its parent's spans; keep only its own
+    pid = os.getpid()
+    return [event for event in _events if event["pid"] == pid]
+
+
+def write_trace(path: str | Path, trace_events: list[dict[str, Any]] | None = None) -> None:
+    """Write trace events (default: this process's spans) as Chrome trace-event JSON."""
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events() if trace_events is None else trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def merge_traces(trace_dir: str | Path, output_file: str | Path) -> list[dict[str, Any]]:
+    """Combine the per-process trace files in ``trace_dir`` into ``output_file``."""
+    merged: list[dict[str, Any]] = []
+    for path in sorted(Path(trace_dir).glob("trace-*.json")):
+        with open(path) as f:
+            merged.extend(json.load(f)["traceEvents"])
+    merged.sort(key=lambda event: event["ts"])
+    write_trace(output_file, merged)
+    return merged
+
+
+def summary_table(trace_events: list[dict[str, Any]] | None = None) -> str:
+    """Per-stage totals: calls, wall time, rows, rows/s and peak memory."""
+    stages: dict[str, dict[str, Any]] = {}
+    for event in events() if trace_events is None else trace_events:
+        stage = stages.setdefault(event["name"], {"calls": 0, "seconds": 0.0, "rows": 0, "rss": 0.0, "malloc": 0.0})
+        stage["calls"] += 1
+        stage["seconds"] += event["dur"] / 1e6
+        stage["rows"] += event["args"].get("rows", 0)
+        stage["rss"] = max(stage["rss"], event["args"].get("peak_rss_mb", 0.0))
+        stage["malloc"] = max(stage["malloc"], event["args"].get("tracemalloc_peak_mb", 0.0))
+
+    header = f"{'stage':<40} {'calls':>5} {'total s':>9} {'mean ms':>9} {'rows':>10} {'rows/s':>11}"
+    header += f" {'rss MB':>8} {'py MB':>7}"
+    lines = [header, "-" * len(header)]
+    for name, stage in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+        rate = f"{stage['rows'] / stage['seconds']:.0f}" if stage["rows"] and stage["seconds"] else "-"
+        lines.append(
+            f"{name:<40} {stage['calls']:>5} {stage['seconds']:>9.3f} {stage['seconds'] / stage['calls'] * 1e3:>9.1f} "
+            f"{stage['rows'] or '-':>10} {rate:>11} {stage['rss']:>8.1f} {stage['malloc'] or '-':>7}"
+        )
+    return "\n".join(lines)
+
+
+def flush() -> None:
+    """Write this process's spans to ``EYETRACKER_TRACE_DIR``, if set.
+
+    Runs at exit; pool workers that exit without running atexit handlers call
+    it after each task instead.
+    """
+    trace_dir = os.environ.get(TRACE_DIR_ENV)
+    if trace_dir and events():
+        write_trace(Path(trace_dir) / f"trace-{os.getpid()}.json")
+
+
+@contextmanager
+def tracing(output_file: str | Path | None) -> Iterator[None]:
+    """Trace the enclosed run, subprocesses included, into ``output_file`` and print the summary.
+
+    Does nothing when ``output_file`` is None.
+    """
+    if output_file is None:
+        yield
+        return
+
+    previous = os.environ.get(TRACE_DIR_ENV)
+    with tempfile.TemporaryDirectory(prefix="eyetracker_trace_") as trace_dir:
+        os.environ[TRACE_DIR_ENV] = trace_dir
+        try:
+            yield
+        finally:
+            flush()
+            if previous is None:
+                del os.environ[TRACE_DIR_ENV]
+            else:
+                os.environ[TRACE_DIR_ENV] = previous
+            merged = merge_traces(trace_dir, output_file)
+            print(f"\n{summary_table(merged)}")
+            print(f"Trace written to {output_file} (open in chrome://tracing or https://ui.perfetto.dev)")
+
+
+atexit.register(flush)
@@ -0,0 +1,225 @@
+"""
+Automatic AOI proposals from the per-post screenshots.
+
+A CPU-only layout analyser that finds the post card in a feed screenshot and
+splits it into the areas the AOI metrics (aoi.py) work with: ``header``
+(author and date), ``text`` (post body), ``media`` (photo, video or link
+preview) and ``reactions`` (reaction and comment bar). It works on a
+downsampled greyscale copy of the screenshot:
+
+1. a background/foreground map and its column and row projection profiles
+   give the card, the tallest run of foreground rows in the densest columns;
+2. an ink map (pixels off the card colour, on an edge or with a high variance)
+   projected on the rows splits the card into bands separated by blank gaps;
+3. the densely filled band is the media, the first band above it the header,
+   the rest above it the text, and the last band below it the reaction bar.
+
+Analyses are cached in the ``layout_proposals`` table of the data catalogue
+by the screenshot's sha256, so participants who were shown the same post
+reuse one analysis. The proposals of each participant are written to
+``data/<name>/aois.json``, which aoi.py picks up.
+"""
+
+import argparse
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+import catalog
+import numpy
+from aoi import AOI_FILE
+from matplotlib import image as mpimg
+
+
+# Bump when the analysis changes, so cached proposals are recomputed.
+LAYOUT_VERSION = 1
+DOWNSAMPLE = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS layout_proposals (
+    sha256 TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    aois TEXT NOT NULL,
+    PRIMARY KEY (sha256, version)
+);
+"""
+
+
+def connect(data_dir: Path = Path("data")) -> sqlite3.Connection:
+    """Catalogue connection with the proposals table created."""
+    conn = catalog.connect(data_dir)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def downsample(img: numpy.ndarray, factor: int = DOWNSAMPLE) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Greyscale mean and variance of each ``factor`` x ``factor`` block of an RGB(A) image."""
+    img = numpy.asarray(img, dtype=numpy.float32)
+    if img.max(initial=0) > 1:
+        img = img / 255
+    gray = img[..., :3] @ numpy.array([0.299, 0.587, 0.114], dtype=numpy.float32) if img.ndim == 3 else img
+    h, w = gray.shape[0] // factor * factor, gray.shape[1] // factor * factor
+    blocks = gray[:h, :w].reshape(h // factor, factor, w // factor, factor)
+    mean = blocks.mean(axis=(1, 3))
+    return mean, (blocks**2).mean(axis=(1, 3)) - mean**2
+
+
+def runs(mask: numpy.ndarray, max_gap: int = 0) -> list[tuple[int, int]]:
+    """``[start, end)`` runs of True in a 1-D mask, joining runs separated by at most ``max_gap`` False."""
+    edges = numpy.diff(numpy.concatenate(([0], mask.astype(numpy.int8), [0])))
+    starts, ends = numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)
+    joined: list[tuple[int, int]] = []
+    for start, end in zip(starts.tolist(), ends.tolist(), strict=True):
+        if joined and start - joined[-1][1] <= max_gap:
+            joined[-1] = (joined[-1][0], end)
+        else:
+            joined.append((start, end))
+    return joined
+
+
+def find_card(gray: numpy.ndarray, threshold: float = 0.02) -> tuple[int, int, int, int]:
+    """``(top, bottom, left, right)`` of the largest card, in downsampled pixels."""
+    border = numpy.concatenate((gray[0], gray[-1], gray[:, 0], gray[:, -1]))
+    foreground = numpy.abs(gray - numpy.median(border)) > threshold
+    columns = runs(foreground.mean(axis=0) > 0.1, max_gap=2)
+    if not columns:
+        return 0, gray.shape[0], 0, gray.shape[1]
+    left, right = max(columns, key=lambda run: run[1] - run[0])
+    rows = runs(foreground[:, left:right].mean(axis=1) > 0.5, max_gap=1)
+    if not rows:
+        return 0, gray.shape[0], left, right
+    top, bottom = max(rows, key=lambda run: run[1] - run[0])
+    return top, bottom, left, right
+
+
+def propose_layout(img: numpy.ndarray, factor: int = DOWNSAMPLE) -> list[dict[str, Any]]:
+    """AOI rectangles (image pixels) of the post card in a screenshot."""
+    gray, variance = downsample(img, factor)
+    top, bottom, left, right = find_card(gray)
+    card = gray[top:bottom, left:right]
+    if card.size == 0:
+        return []
+    # a small margin keeps the card's own border out of the ink map
+    margin = 2 if card.shape[1] > 8 else 0
+    inner = card[:, margin : card.shape[1] - margin]
+    inner_variance = variance[top:bottom, left + margin : right - margin]
+    # the card colour is the most common grey level, even when a photo covers most of the card
+    counts, levels = numpy.histogram(inner, bins=64, range=(0, 1))
+    off_colour = numpy.abs(inner - levels[counts.argmax()] - 0.5 / 64) > 0.08
+    edges = numpy.abs(numpy.diff(inner, axis=0, prepend=inner[:1]))
+    edges += numpy.abs(numpy.diff(inner, axis=1, prepend=inner[:, :1]))
+    ink = off_colour | (edges > 0.1) | (inner_variance > 0.002)
+
+    bands = runs(ink.mean(axis=1) > 0.005, max_gap=max(1, 12 // factor))
+    if not bands:
+        return []
+    heights = [end - start for start, end in bands]
+    media = [
+        i
+        for i, (start, end) in enumerate(bands)
+        if off_colour[start:end].mean() > 0.5 and heights[i] >= 0.15 * len(card)
+    ]
+
+    named: dict[str, tuple[int, int]] = {}
+    if media:
+        m = max(media, key=lambda i: heights[i])
+        named["media"] = bands[m]
+        above, below = bands[:m], bands[m + 1 :]
+    else:
+        # without media the last band is the reaction bar once there is a body between it and the header
+        above, below = (bands[:-1], bands[-1:]) if len(bands) >= 3 else (bands, [])
+    if above:
+        named["header"] = above[0]
+    if len(above) >= 2:
+        named["text"] = (above[1][0], above[-1][1])
+    if below:
+        named["reactions"] = (below[0][0], below[-1][1])
+
+    aois = []
+    for name in ["header", "text", "media", "reactions"]:
+        if name in named:
+            start, end = named[name]
+            rect = [left * factor, (top + start) * factor, right * factor, (top + end) * factor]
+            aois.append({"name": name, "rect": rect})
+    return aois
+
+
+def cached_layout(conn: sqlite3.Connection, path: Path, sha256: str) -> dict[str, Any]:
+    """Proposal for the screenshot at ``path``, analysed only if its hash is not cached yet."""
+    row = conn.execute(
+        "SELECT width, height, aois FROM layout_proposals WHERE sha256 = ? AND version = ?", (sha256, LAYOUT_VERSION)
+    ).fetchone()
+    if row is not None:
+        return {"width": row["width"], "height": row["height"], "aois": json.loads(row["aois"]), "cached": True}
+    img = mpimg.imread(path)
+    aois = propose_layout(img)
+    conn.execute(
+        "INSERT OR REPLACE INTO layout_proposals (sha256, version, width, height, aois) VALUES (?, ?, ?, ?, ?)",
+        (sha256, LAYOUT_VERSION, img.shape[1], img.shape[0], json.dumps(aois)),
+    )
+    return {"width": img.shape[1], "height": img.shape[0], "aois": aois, "cached": False}
+
+
+def propose_participant(
+    name: str, data_dir: Path = Path("data"), width: int = 1920, height: int = 1080
+) -> dict[int, list[dict[str, Any]]]:
+    """Propose AOIs for every post screenshot of ``name`` and write them to ``data/<name>/aois.json``.
+
+    Rectangles are scaled from screenshot pixels to the ``width`` x ``height`` screen of the gaze data.
+    """
+    proposals: dict[int, list[dict[str, Any]]] = {}
+    analysed = 0
+    conn = connect(data_dir)
+    try:
+        with conn:
+            found = catalog.listed_files(conn, data_dir, name, "screenshot")
+            post_ids = sorted(int(path.stem.rsplit("_", 1)[1]) for path in found)
+            # registering re-hashes only the screenshots whose size or mtime changed
+            catalog.register(conn, data_dir, name, "screenshot", post_ids)
+            for post_id in post_ids:
+                rel = catalog.artifact_path(name, "screenshot", post_id)
+                row = conn.execute("SELECT sha256 FROM artifacts WHERE path = ?", (rel,)).fetchone()
+                if row is None:
+                    continue
+                layout = cached_layout(conn, data_dir / rel, row["sha256"])
+                analysed += not layout["cached"]
+                scales = [width / layout["width"], height / layout["height"]] * 2
+                proposals[post_id] = [
+                    {
+                        "name": aoi["name"],
+                        "rect": [round(value * scale) for value, scale in zip(aoi["rect"], scales, strict=True)],
+                    }
+                    for aoi in layout["aois"]
+                ]
+    finally:
+        conn.close()
+
+    with open(data_dir / name / AOI_FILE, "w") as f:
+        json.dump({str(post_id): aois for post_id, aois in proposals.items()}, f, indent=4)
+    print(f"{name}: {len(proposals)} posts, {analysed} analysed, {len(proposals) - analysed} from cache")
+    return proposals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Propose header/text/media/reactions AOIs from the post screenshots")
+    parser.add_argument("names", nargs="*", help="Participants (default: every participant with screenshots/)")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument("--force", action="store_true", help="Overwrite existing, possibly hand-edited, aois.json")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    names = args.names or sorted(path.parent.name for path in data_dir.glob("*/screenshots"))
+    for name in names:
+        if (data_dir / name / AOI_FILE).exists() and not args.force:
+            print(f"{name}: {data_dir / name / AOI_FILE} exists, skipping (use --force to overwrite)")
+            continue
+        propose_participant(name, data_dir, args.width, args.height)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,15 @@ import argparse
 import json
 import os
 from datetime import datetime, timedelta
+from pathlib import Path
 from typing import Any, cast
 
+import catalog
+import numpy as np
 import pandas as pd
 import requests
+from instrument import traced
+from utils import screenshot_time
 
 
 def download_and_filter_json(user_name: str, root: str) -> None:
@@ -35,8 +40,13 @@ def download_and_filter_json(user_name: str, root: str) -> None:
         print(f"Error decoding JSON: {e}")
 
 
+@traced("match.load_gaze_data")
 def load_gaze_data(file_path: str) -> pd.DataFrame:
-    df = pd.read_csv(file_path)
+    return prepare_gaze_frame(pd.read_csv(file_path))
+
+
+def prepare_gaze_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse the current_time column of a cleaned gaze frame into datetimes."""
     df["current_time"] = pd.to_datetime(df["current_time"], format="%Y-%m-%dT%H:%M:%S.%fZ")
     return df
 
@@ -47,7 +57,48 @@ def load_json_data(file_path: str) -> list[Any]:
     return json_data
 
 
-def process_gaze_data(df: pd.DataFrame, json_data: list[Any]) -> pd.DataFrame:
+def assign_post_ids(time_seconds: pd.Series, json_data: list[Any]) -> np.ndarray:
+    """postID of every sample from the post windows, or None outside all of them.
+
+    Same result as assigning each window in JSON order (later posts win), but
+    with one binary search per sample instead of one pass per post. Windows
+    that overlap or touch would need the JSON order to break ties, so those
+    fall back to the per-post loop.
+    """
+    starts = np.array([obj["PostStartTime"] for obj in json_data], dtype=float)
+    ends = np.array([obj["PostEndTime"] for obj in json_data], dtype=float)
+    post_ids = np.empty(len(json_data), dtype=object)
+    post_ids[:] = [obj["postID"] for obj in json_data]
+    times = time_seconds.to_numpy(dtype=float)
+    assigned = np.full(len(times), None, dtype=object)
+
+    order = np.argsort(starts, kind="stable")
+    if np.any(starts[order][1:] <= ends[order][:-1]):
+        for start, end, post_id in zip(starts, ends, post_ids, strict=True):
+            assigned[(times >= start) & (times <= end)] = post_id
+        return assigned
+
+    starts, ends, post_ids = starts[order], ends[order], post_ids[order]
+    window = np.searchsorted(starts, times, side="right") - 1
+    inside = (window >= 0) & (times <= ends[np.maximum(window, 0)])
+    assigned[inside] = post_ids[window[inside]]
+    return assigned
+
+
+def raw_post_ids(current_time: pd.Series, json_data: list[Any]) -> np.ndarray:
+    """postID of raw gaze samples (gaze.csv) from their current_time, or None outside all windows.
+
+    The post windows count seconds from the session's initialDate, which is
+    where process_gaze_data puts time 0 of the cleaned gaze.
+    """
+    initial_date = pd.Timestamp(json_data[0]["initialDate"]).tz_localize(None)
+    current = pd.to_datetime(current_time, format="%Y-%m-%dT%H:%M:%S.%fZ", errors="coerce")
+    elapsed = pd.Series((current - initial_date).dt.total_seconds().to_numpy())
+    return assign_post_ids(elapsed, json_data)
+
+
+@traced("match.process_gaze_data", rows=lambda df, *_, **__: len(df))
+def process_gaze_data(df: pd.DataFrame, json_data: list[Any], vectorized: bool = False) -> pd.DataFrame:
     # Step 1: initial date and first time
     initial_date = datetime.strptime(json_data[0]["initialDate"], "%Y-%m-%dT%H:%M:%S.%fZ")
     last_time_seconds = df[df["current_time"] - initial_date < timedelta(seconds=0)]
@@ -63,15 +114,18 @@ def process_gaze_data(df: pd.DataFrame, json_data: list[Any]) -> pd.DataFrame:
     df["postID"] = None
 
     # Step 3: Assign postID based on PostStartTime and PostEndTime
-    for obj in json_data:
-        post_start_time = obj["PostStartTime"]
-        post_end_time = obj["PostEndTime"]
-        post_id = obj["postID"]
+    if vectorized:
+        df["postID"] = assign_post_ids(df["time_seconds"], json_data)
+    else:
+        for obj in json_data:
+            post_start_time = obj["PostStartTime"]
+            post_end_time = obj["PostEndTime"]
+            post_id = obj["postID"]
 
-        df.loc[
-            (df["time_seconds"] >= post_start_time) & (df["time_seconds"] <= post_end_time),
-            "postID",
-        ] = post_id
+            df.loc[
+                (df["time_seconds"] >= post_start_time) & (df["time_seconds"] <= post_end_time),
+                "postID",
+            ] = post_id
 
     # Step 4: Remove all rows where `postID` is None
     df = df[df["postID"].notna()].reset_index(drop=True)
@@ -79,30 +133,37 @@ def process_gaze_data(df: pd.DataFrame, json_data: list[Any]) -> pd.DataFrame:
     return df
 
 
-def process_screenshots(screenshots_folder: str, json_data: list[Any]) -> pd.DataFrame:
-    # Step 1: Get the list of screenshot files
-    screenshot_files = os.listdir(screenshots_folder)
+@traced("match.process_screenshots")
+def process_screenshots(
+    screenshots_folder: str, json_data: list[Any], screenshot_files: list[str] | None = None
+) -> pd.DataFrame:
+    # Step 1: Get the list of screenshot files, from the catalogue when the caller has it
+    if screenshot_files is None:
+        screenshot_files = os.listdir(screenshots_folder)
     screenshot_files = [file for file in screenshot_files if file.endswith(".png")]
     screenshot_assignments = []
 
     # Step 2: Assign postID based on screenshot timestamp
     for file in screenshot_files:
-        timestamp_str = file.replace("screenshot_", "").replace(".png", "").replace("_", ":")
-        screenshot_time = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S")
+        try:
+            captured_at = screenshot_time(file)
+        except ValueError:
+            # already renamed by collect_screenshots on a previous run
+            continue
         assigned_post_id = None
         for obj in json_data:
             initial_date = datetime.strptime(obj["initialDate"], "%Y-%m-%dT%H:%M:%S.%fZ")
             post_start_time = initial_date + timedelta(seconds=obj["PostStartTime"])
             post_end_time = initial_date + timedelta(seconds=obj["PostEndTime"])
 
-            if post_start_time <= screenshot_time <= post_end_time:
+            if post_start_time <= captured_at <= post_end_time:
                 assigned_post_id = obj["postID"]
                 break
 
         screenshot_assignments.append(
             {
                 "filename": file,
-                "screenshot_time": screenshot_time,
+                "screenshot_time": captured_at,
                 "postID": assigned_post_id,
             }
         )
@@ -122,24 +183,42 @@ def assign_screenshot_filenames(df: pd.DataFrame, screenshot_df: pd.DataFrame) -
     return df
 
 
+@traced("match.split_posts", rows=lambda df: len(df))
+def split_posts(df: pd.DataFrame) -> dict[Any, pd.DataFrame]:
+    """Split the matched gaze into one frame per postID, with integer x and y."""
+    posts = {}
+    for post_id in df["postID"].unique():
+        df_filtered = df[df["postID"] == post_id].copy()
+        df_filtered["x"] = df_filtered["x"].astype(int)
+        df_filtered["y"] = df_filtered["y"].astype(int)
+        posts[post_id] = df_filtered
+    return posts
+
+
+@traced("match.save_split_files", rows=lambda df, *_: len(df))
 def save_split_files(df: pd.DataFrame, output_folder: str, name: str) -> None:
     os.makedirs(output_folder, exist_ok=True)
-    unique_post_ids = df["postID"].unique()
 
-    for post_id in unique_post_ids:
-        df_filtered = df[df["postID"] == post_id]
+    for post_id, df_filtered in split_posts(df).items():
         filename = f"{name}_gaze_{post_id}.csv"
-        df_filtered["x"] = df_filtered["x"].astype(int)
-        df_filtered["y"] = df_filtered["y"].astype(int)
         df_filtered.to_csv(os.path.join(output_folder, filename), index=False)
 
     print(f"Archivos CSV creados en la carpeta {output_folder}")
 
 
+@traced("match.collect_screenshots")
 def collect_screenshots(unique_post_ids: Any, name: str, root: str) -> None:
+    screenshot_filenames = {}
     for post_id in unique_post_ids:
         df_file = pd.read_csv(root + f"gaze_posts/{name}_gaze_{post_id}.csv")
-        image_screenshot = root + f"screenshots/{df_file['screenshot_filename'].iloc[0]}"
+        screenshot_filenames[post_id] = df_file["screenshot_filename"].iloc[0]
+    rename_screenshots(screenshot_filenames, name, root)
+
+
+def rename_screenshots(screenshot_filenames: dict[Any, Any], name: str, root: str) -> None:
+    """Rename the screenshot chosen for each post to '<name>_screenshot_<postID>.png'."""
+    for post_id, screenshot_filename in screenshot_filenames.items():
+        image_screenshot = root + f"screenshots/{screenshot_filename}"
 
         new_screenshot_filename = f"{name}_screenshot_{post_id}.png"
         new_screenshot_path = root + f"screenshots/{new_screenshot_filename}"
@@ -148,6 +227,48 @@ def collect_screenshots(unique_post_ids: Any, name: str, root: str) -> None:
             os.rename(image_screenshot, new_screenshot_path)
 
 
+def catalogued_frames(name: str, data_dir: Path = Path("data")) -> list[str] | None:
+    """Filenames of the unassigned screenshots of ``name`` (checked against the disk), or None if there are none."""
+    with catalog.open_catalog(data_dir) as conn:
+        frames = [path.name for path in catalog.listed_files(conn, data_dir, name, catalog.FRAME_KIND)]
+    return frames or None
+
+
+def record_match(
+    name: str,
+    json_data: list[Any],
+    screenshot_filenames: dict[Any, Any],
+    samples: int,
+    data_dir: Path = Path("data"),
+) -> None:
+    """Record the session, its posts and the match outputs in the catalogue in one transaction."""
+    with catalog.open_catalog(data_dir) as conn:
+        catalog.record_session(conn, name, json_data, samples)
+        catalog.register(conn, data_dir, name, "times")
+        catalog.register(conn, data_dir, name, "gaze_posts", screenshot_filenames)
+        catalog.register(conn, data_dir, name, "screenshot", screenshot_filenames)
+        # the chosen frames were renamed to <name>_screenshot_<postID>.png
+        catalog.forget(conn, [f"{name}/screenshots/{filename}" for filename in screenshot_filenames.values()])
+
+
+def match_frame(df_clean: pd.DataFrame, name: str, root: str) -> dict[Any, pd.DataFrame]:
+    """In-memory match stage: cleaned gaze frame in, one gaze frame per post out.
+
+    Downloads the times JSON if needed and renames the chosen screenshots, like
+    main(), but does not write the per-post CSVs.
+    """
+    download_and_filter_json(name, root)
+
+    json_data = load_json_data(root + f"times/{name}_posts_times.json")
+    df_processed = process_gaze_data(prepare_gaze_frame(df_clean.copy()), json_data)
+    screenshot_df = process_screenshots(root + "screenshots/", json_data, catalogued_frames(name))
+    posts = split_posts(assign_screenshot_filenames(df_processed, screenshot_df))
+    screenshot_filenames = {post_id: df["screenshot_filename"].iloc[0] for post_id, df in posts.items()}
+    rename_screenshots(screenshot_filenames, name, root)
+    record_match(name, json_data, screenshot_filenames, len(df_clean))
+    return posts
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
 
@@ -165,11 +286,13 @@ def main() -> None:
     df_initial = load_gaze_data(input_file)
     json_data = load_json_data(json_file)
     df_processed = process_gaze_data(df_initial, json_data)
-    screenshot_df = process_screenshots(screenshot_folder, json_data)
+    screenshot_df = process_screenshots(screenshot_folder, json_data, catalogued_frames(name))
     df = assign_screenshot_filenames(df_processed, screenshot_df)
     save_split_files(df, root + "gaze_posts/", name)
     unique_post_ids = df["postID"].unique()
     collect_screenshots(unique_post_ids, name=name, root=root)
+    screenshot_filenames = df.drop_duplicates("postID").set_index("postID")["screenshot_filename"].to_dict()
+    record_match(name, json_data, screenshot_filenames, len(df_initial))
 
 
 if __name__ == "__main__":
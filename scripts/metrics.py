@@ -0,0 +1,154 @@
+"""
+Per-post scanpath metrics of every participant.
+
+Rendering a scanpath stores its metrics in the ``scanpath_metrics`` table of
+the data catalogue (``data/catalog.db``), one row per (participant, post):
+
+- fixations: fixations found by fixations.detect_fixations
+- path_length: summed distance between consecutive fixations, in pixels
+- mean_dwell / total_dwell: fixation durations, in seconds
+- points: points of the drawn scanpath (the former ``length_plot_x`` of scans.csv)
+- samples: gaze samples of the post
+
+Each row is written with a single upsert, so parallel render workers and
+batch jobs can record at the same time and re-rendering a post replaces its
+row instead of adding another. ``python scripts/metrics.py export scans.csv``
+writes the table as a CSV for analysis.
+"""
+
+import argparse
+import csv
+import sqlite3
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import catalog
+import numpy
+import pandas as pd
+from fixations import detect_fixations
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scanpath_metrics (
+    participant TEXT NOT NULL REFERENCES participants(name) ON DELETE CASCADE,
+    post_id INTEGER NOT NULL,
+    fixations INTEGER NOT NULL,
+    path_length REAL NOT NULL,
+    mean_dwell REAL NOT NULL,
+    total_dwell REAL NOT NULL,
+    points INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (participant, post_id)
+);
+"""
+COLUMNS = [
+    "participant",
+    "post_id",
+    "fixations",
+    "path_length",
+    "mean_dwell",
+    "total_dwell",
+    "points",
+    "samples",
+    "updated_at",
+]
+
+
+def connect(data_dir: Path = Path("data")) -> sqlite3.Connection:
+    """Catalogue connection with the metrics table created."""
+    conn = catalog.connect(data_dir)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def scanpath_metrics(data: pd.DataFrame, points: int) -> dict[str, Any]:
+    """Metrics of one post's gaze; ``points`` is the length of the scanpath drawn from it."""
+    fixations = detect_fixations(data["x"], data["y"], data["time_seconds"])
+    steps = numpy.hypot(numpy.diff(fixations["x"]), numpy.diff(fixations["y"]))
+    return {
+        "fixations": len(fixations["duration"]),
+        "path_length": float(steps.sum()),
+        "mean_dwell": float(fixations["duration"].mean()) if len(fixations["duration"]) else 0.0,
+        "total_dwell": float(fixations["duration"].sum()),
+        "points": int(points),
+        "samples": len(data),
+    }
+
+
+def record_scanpath(name: str, post_id: Any, metrics: dict[str, Any], data_dir: Path = Path("data")) -> None:
+    """Insert or replace the metrics of one post in a single transaction."""
+    conn = connect(data_dir)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO participants (name, updated_at) VALUES (?, ?) ON CONFLICT(name) DO NOTHING",
+                (name, datetime.now(timezone.utc).isoformat(timespec="seconds")),
+            )
+            conn.execute(
+                "INSERT INTO scanpath_metrics "
+                "(participant, post_id, fixations, path_length, mean_dwell, total_dwell, points, samples, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(participant, post_id) DO UPDATE SET fixations = excluded.fixations, "
+                "path_length = excluded.path_length, mean_dwell = excluded.mean_dwell, "
+                "total_dwell = excluded.total_dwell, points = excluded.points, samples = excluded.samples, "
+                "updated_at = excluded.updated_at",
+                (
+                    name,
+                    int(post_id),
+                    metrics["fixations"],
+                    metrics["path_length"],
+                    metrics["mean_dwell"],
+                    metrics["total_dwell"],
+                    metrics["points"],
+                    metrics["samples"],
+                    datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                ),
+            )
+    finally:
+        conn.close()
+
+
+def scanpath_rows(conn: sqlite3.Connection, names: Sequence[str] | None = None) -> list[sqlite3.Row]:
+    """Stored metrics, optionally only of ``names``, ordered by participant and post."""
+    rows = conn.execute("SELECT * FROM scanpath_metrics ORDER BY participant, post_id").fetchall()
+    return [row for row in rows if not names or row["participant"] in names]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show or export the per-post scanpath metrics")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="Print the metrics")
+    show.add_argument("names", nargs="*", help="Participants (default: all)")
+    export = commands.add_parser("export", help="Write the metrics to a CSV file")
+    export.add_argument("output", type=str, help="CSV file to write")
+    export.add_argument("names", nargs="*", help="Participants (default: all)")
+    args = parser.parse_args()
+
+    conn = connect(Path(args.data_dir))
+    try:
+        rows = scanpath_rows(conn, args.names)
+    finally:
+        conn.close()
+
+    if args.command == "export":
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows([row[column] for column in COLUMNS] for row in rows)
+        print(f"{len(rows)} rows written to {args.output}")
+        return
+
+    print(f"{'participant':<16} {'post':>6} {'fixations':>9} {'path px':>10} {'mean dwell s':>13} {'samples':>8}")
+    for row in rows:
+        print(
+            f"{row['participant']:<16} {row['post_id']:>6} {row['fixations']:>9} {row['path_length']:>10.0f} "
+            f"{row['mean_dwell']:>13.3f} {row['samples']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
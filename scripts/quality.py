@@ -0,0 +1,287 @@
+"""
+Data-quality metrics of a recorded session, per session and per post.
+
+gazeProcess.py fills in missing eyes and interpolates track loss without
+saying how much there was. This stage reads the raw ``gaze.csv`` once, in
+chunks, and reports for the whole session and for every post window of the
+times JSON:
+
+- track_loss: share of samples with neither eye tracked
+- longest_gap: longest time between two tracked samples, in seconds
+- disparity_mean / disparity_std / disparity_max: distance between the left
+  and right eye gaze where both are tracked, in pixels
+- precision_rms: RMS sample-to-sample distance of the averaged gaze within
+  fixations (consecutive tracked samples fixations.fixation_ids keeps in one
+  fixation), in pixels; saccades would otherwise dominate it
+- sample_rate / effective_rate: samples and tracked samples per second
+- interval_mean / jitter / interval_max: mean, standard deviation and maximum
+  of the timestamp intervals, in seconds
+
+Each chunk is reduced to running sums, moments, maxima and the last sample,
+so memory does not grow with the session. The report is written to
+``data/<name>/quality.json`` together with the threshold checks, which
+batch_process.py uses to skip or flag bad sessions before they are rendered.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+import catalog
+import numpy as np
+import pandas as pd
+from fixations import fixation_ids
+from match import raw_post_ids
+
+
+QUALITY_FILE = "quality.json"
+CHUNK_ROWS = 100_000
+
+# option: (metric, "max" or "min", default); a session fails when a metric is past its limit
+THRESHOLDS = {
+    "max_track_loss": ("track_loss", "max", 0.3),
+    "max_gap": ("longest_gap", "max", 5.0),
+    "max_precision": ("precision_rms", "max", 25.0),
+    "min_rate": ("effective_rate", "min", 20.0),
+    "max_jitter": ("jitter", "max", 0.02),
+}
+
+# running sums, (count, mean, M2) moments and maxima of one session or post
+SUMS = ["samples", "lost", "steps", "step_sq"]
+MOMENTS = ["disparity", "dt"]
+MAXIMA = ["disparity_max", "gap_max", "interval_max", "last_time"]
+
+
+def new_state(posts: int) -> dict[str, Any]:
+    """Accumulators for the session (slot 0) and ``posts`` post windows (slots 1..posts)."""
+    state: dict[str, Any] = {key: np.zeros(posts + 1) for key in SUMS}
+    state.update({key: np.zeros((3, posts + 1)) for key in MOMENTS})
+    state.update({key: np.full(posts + 1, -np.inf) for key in MAXIMA})
+    state["first_time"] = np.full(posts + 1, np.inf)
+    # last sample seen, then last tracked sample: (time, x, y, tracked, slot)
+    state["previous"] = None
+    state["previous_tracked"] = None
+    return state
+
+
+def _add(state: dict[str, Any], key: str, slots: np.ndarray, values: Any) -> None:
+    """Add ``values`` to the session and to the post slot of each value (slot 0: no post)."""
+    values = np.broadcast_to(np.asarray(values, dtype=float), slots.shape)
+    inside = slots > 0
+    state[key] += np.bincount(slots[inside], weights=values[inside], minlength=len(state[key]))
+    state[key][0] += values.sum()
+
+
+def _moments(state: dict[str, Any], key: str, slots: np.ndarray, values: np.ndarray) -> None:
+    """Merge the count, mean and M2 of ``values`` into the running moments (Chan et al.), per slot.
+
+    Merging centred moments instead of summing squares keeps the standard
+    deviation of near-constant values, such as the timestamp intervals, exact.
+    """
+    for slot_ids, chunk_values in (
+        (np.zeros(len(values), dtype=np.int64), values),
+        (slots[slots > 0], values[slots > 0]),
+    ):
+        count = np.bincount(slot_ids, minlength=state[key].shape[1]).astype(float)
+        total = np.bincount(slot_ids, weights=chunk_values, minlength=state[key].shape[1])
+        mean = np.divide(total, count, out=np.zeros_like(count), where=count > 0)
+        m2 = np.bincount(slot_ids, weights=(chunk_values - mean[slot_ids]) ** 2, minlength=state[key].shape[1])
+        n, running_mean, running_m2 = state[key]
+        merged = n + count
+        delta = mean - running_mean
+        share = np.divide(count, merged, out=np.zeros_like(merged), where=merged > 0)
+        state[key] = np.array([merged, running_mean + delta * share, running_m2 + m2 + delta**2 * n * share])
+
+
+def _max(state: dict[str, Any], key: str, slots: np.ndarray, values: np.ndarray) -> None:
+    """Running maximum of ``values`` for the session and each post slot."""
+    if len(values):
+        state[key][0] = max(state[key][0], values.max())
+    inside = slots > 0
+    np.maximum.at(state[key], slots[inside], values[inside])
+
+
+def accumulate(state: dict[str, Any], chunk: pd.DataFrame, slots: np.ndarray, width: int, height: int) -> None:
+    """Fold one chunk of raw samples into ``state``; ``slots`` is each sample's post slot (0: no post)."""
+    t = pd.to_numeric(chunk["time_seconds"], errors="coerce").to_numpy(dtype=float)
+    left_x, left_y, right_x, right_y = (
+        pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=float)
+        for column in ["left_x", "left_y", "right_x", "right_y"]
+    )
+    left = ~np.isnan(left_x) & ~np.isnan(left_y)
+    right = ~np.isnan(right_x) & ~np.isnan(right_y)
+    both = left & right
+    tracked = left | right
+    x = np.where(both, (left_x + right_x) / 2, np.where(left, left_x, right_x)) * width
+    y = np.where(both, (left_y + right_y) / 2, np.where(left, left_y, right_y)) * height
+
+    _add(state, "samples", slots, 1)
+    _add(state, "lost", slots, ~tracked)
+    disparity = np.hypot((left_x - right_x)[both] * width, (left_y - right_y)[both] * height)
+    _moments(state, "disparity", slots[both], disparity)
+    _max(state, "disparity_max", slots[both], disparity)
+    _max(state, "last_time", slots, t)
+    inside = slots > 0
+    if len(t):
+        state["first_time"][0] = min(state["first_time"][0], t.min())
+    np.minimum.at(state["first_time"], slots[inside], t[inside])
+
+    # pairs of consecutive samples, the first one carried over from the previous chunk
+    previous = state["previous"]
+    if previous is not None:
+        pt, px, py, ptracked, pslot = (np.array([value]) for value in previous)
+        t_all, x_all, y_all = np.concatenate((pt, t)), np.concatenate((px, x)), np.concatenate((py, y))
+        tracked_all, slots_all = np.concatenate((ptracked, tracked)), np.concatenate((pslot, slots))
+    else:
+        t_all, x_all, y_all, tracked_all, slots_all = t, x, y, tracked, slots
+    if len(t_all) >= 2:
+        pair_slots = np.where(slots_all[1:] == slots_all[:-1], slots_all[1:], 0)
+        dt = np.diff(t_all)
+        _moments(state, "dt", pair_slots, dt)
+        _max(state, "interval_max", pair_slots, dt)
+        # only steps inside a fixation measure precision, not saccade amplitude
+        fixation = fixation_ids(x_all, y_all, t_all)
+        pair_fixated = tracked_all[1:] & tracked_all[:-1] & (fixation[1:] == fixation[:-1])
+        step_sq = np.where(pair_fixated, np.diff(x_all) ** 2 + np.diff(y_all) ** 2, 0)
+        _add(state, "steps", pair_slots, pair_fixated)
+        _add(state, "step_sq", pair_slots, step_sq)
+    if len(t):
+        state["previous"] = (t[-1], x[-1], y[-1], tracked[-1], slots[-1])
+
+    # gaps between consecutive tracked samples, carried over chunks the same way
+    tracked_t, tracked_slots = t[tracked], slots[tracked]
+    if state["previous_tracked"] is not None:
+        tracked_t = np.concatenate(([state["previous_tracked"][0]], tracked_t))
+        tracked_slots = np.concatenate(([state["previous_tracked"][1]], tracked_slots))
+    if len(tracked_t) >= 2:
+        gap_slots = np.where(tracked_slots[1:] == tracked_slots[:-1], tracked_slots[1:], 0)
+        gaps = np.diff(tracked_t)
+        _max(state, "gap_max", gap_slots, gaps)
+    if len(tracked_t):
+        state["previous_tracked"] = (tracked_t[-1], tracked_slots[-1])
+
+
+def summarize(state: dict[str, Any], slot: int) -> dict[str, Any]:
+    """Final metrics of one slot of ``state``."""
+
+    def ratio(a: float, b: float) -> float | None:
+        return float(a / b) if b > 0 else None
+
+    def moments(key: str) -> tuple[float | None, float | None]:
+        count, mean, m2 = state[key][:, slot]
+        return (float(mean), float(np.sqrt(m2 / count))) if count > 0 else (None, None)
+
+    def maximum(key: str) -> float | None:
+        return float(state[key][slot]) if np.isfinite(state[key][slot]) else None
+
+    samples = state["samples"][slot]
+    tracked = samples - state["lost"][slot]
+    duration = state["last_time"][slot] - state["first_time"][slot] if samples else 0.0
+    precision = ratio(state["step_sq"][slot], state["steps"][slot])
+    disparity_mean, disparity_std = moments("disparity")
+    interval_mean, jitter = moments("dt")
+    return {
+        "samples": int(samples),
+        "duration": float(duration),
+        "track_loss": ratio(state["lost"][slot], samples),
+        "longest_gap": maximum("gap_max"),
+        "disparity_mean": disparity_mean,
+        "disparity_std": disparity_std,
+        "disparity_max": maximum("disparity_max"),
+        "precision_rms": None if precision is None else float(np.sqrt(precision)),
+        "sample_rate": ratio(samples, duration),
+        "effective_rate": ratio(tracked, duration),
+        "interval_mean": interval_mean,
+        "jitter": jitter,
+        "interval_max": maximum("interval_max"),
+    }
+
+
+def check(metrics: dict[str, Any], thresholds: dict[str, float]) -> list[str]:
+    """Descriptions of the metrics past their threshold (missing metrics do not fail)."""
+    failures = []
+    for option, limit in thresholds.items():
+        metric, kind, _ = THRESHOLDS[option]
+        value = metrics.get(metric)
+        if value is not None and (value > limit if kind == "max" else value < limit):
+            failures.append(f"{metric} {value:.4g} {'>' if kind == 'max' else '<'} {limit:g}")
+    return failures
+
+
+def session_quality(
+    name: str,
+    data_dir: Path = Path("data"),
+    width: int = 1920,
+    height: int = 1080,
+    thresholds: dict[str, float] | None = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> dict[str, Any]:
+    """Quality report of one participant's raw gaze, written to ``data/<name>/quality.json``."""
+    thresholds = thresholds or {option: default for option, (_, _, default) in THRESHOLDS.items()}
+    times_file = data_dir / catalog.artifact_path(name, "times")
+    posts: list[Any] = []
+    if times_file.is_file():
+        with open(times_file) as f:
+            posts = json.load(f)
+    post_ids = [post["postID"] for post in posts]
+    slot_of = {post_id: slot for slot, post_id in enumerate(post_ids, start=1)}
+
+    state = new_state(len(post_ids))
+    columns = ["time_seconds", "current_time", "left_x", "left_y", "right_x", "right_y"]
+    gaze_file = data_dir / catalog.artifact_path(name, "gaze")
+    for chunk in pd.read_csv(gaze_file, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        slots = np.zeros(len(chunk), dtype=np.int64)
+        if posts:
+            slots = np.array(
+                [slot_of.get(post_id, 0) for post_id in raw_post_ids(chunk["current_time"], posts)], dtype=np.int64
+            )
+        accumulate(state, chunk, slots, width, height)
+
+    session = summarize(state, 0)
+    failures = check(session, thresholds)
+    report = {
+        "participant": name,
+        "passed": not failures,
+        "failures": failures,
+        "thresholds": thresholds,
+        "session": session,
+        "posts": {str(post_id): summarize(state, slot) for post_id, slot in slot_of.items()},
+    }
+    with open(data_dir / name / QUALITY_FILE, "w") as f:
+        json.dump(report, f, indent=4)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Data-quality metrics of a recorded session, per session and post")
+    parser.add_argument("name", type=str, help="Participant name")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    for option, (metric, kind, default) in THRESHOLDS.items():
+        parser.add_argument(
+            f"--{option.replace('_', '-')}", type=float, default=default, help=f"{kind} {metric} (default: {default})"
+        )
+    parser.add_argument("--strict", action="store_true", help="Exit with status 3 when the session fails")
+    args = parser.parse_args()
+
+    thresholds = {option: getattr(args, option) for option in THRESHOLDS}
+    report = session_quality(args.name, Path(args.data_dir), args.width, args.height, thresholds)
+    session = report["session"]
+    print(f"{args.name}: {session['samples']} samples over {session['duration']:.1f}s")
+    for metric, value in session.items():
+        if metric not in ("samples", "duration"):
+            print(f"  {metric:<15} {'-' if value is None else f'{value:.4g}'}")
+    if report["passed"]:
+        print("Quality: passed")
+    else:
+        print(f"Quality: FAILED ({'; '.join(report['failures'])})")
+    print(f"Report written to {Path(args.data_dir) / args.name / QUALITY_FILE}")
+    if args.strict and not report["passed"]:
+        sys.exit(3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Animated gaze replay of a post.
+
+A static scanpath loses the order and timing of the gaze once it is busy.
+This renders the gaze of one participant and post as an animated GIF (or a
+PNG frame sequence) with a fading trail of the last ``--trail`` seconds over
+the post screenshot.
+
+The screenshot is decoded and scaled once and kept as an 8-bit background.
+Every frame only touches the bounding box of the previous and the current
+trail: that box is restored from the background, and the trail dots are
+composited in NumPy from one precomputed disc stamp. No matplotlib figure is
+drawn per frame. For GIFs, the background is quantized once to a fixed
+palette and only the changed box is re-quantized and written each frame, so
+frames are streamed to disk instead of being held in memory.
+
+Frames are sampled at ``--fps`` from the gaze timeline (at ``--speed``), so a
+lower frame rate decimates the 60 Hz stream into fewer frames.
+"""
+
+import argparse
+import sys
+import time
+from collections.abc import Iterator
+from itertools import chain
+from pathlib import Path
+from typing import Any
+
+import catalog
+import numpy
+import pandas as pd
+from matplotlib import image as mpimg
+from PIL import GifImagePlugin, Image
+
+
+FPS = 15
+TRAIL_SECONDS = 1.0
+RADIUS = 12
+COLOR = (230, 30, 30)
+# Oldest trail samples keep this much opacity
+MIN_ALPHA = 0.15
+
+Box = tuple[int, int, int, int]
+
+
+def load_background(screenshot: Any, scale: float = 1.0) -> numpy.ndarray:
+    """Decode a screenshot (path or array) once into an 8-bit RGB array, resized by ``scale``."""
+    img = mpimg.imread(screenshot) if isinstance(screenshot, str | Path) else numpy.asarray(screenshot)
+    if img.dtype != numpy.uint8:
+        img = numpy.rint(numpy.clip(img, 0, 1) * 255).astype(numpy.uint8)
+    if img.ndim == 2:
+        img = numpy.repeat(img[:, :, None], 3, axis=2)
+    img = numpy.ascontiguousarray(img[:, :, :3])
+    if scale != 1.0:
+        size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+        img = numpy.asarray(Image.fromarray(img).resize(size, Image.Resampling.BILINEAR))
+    return img
+
+
+def disc_stamp(radius: int) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Row offsets, column offsets and coverage (0-1, antialiased edge) of the pixels of a disc."""
+    dy, dx = numpy.mgrid[-radius : radius + 1, -radius : radius + 1]
+    coverage = numpy.clip(radius + 0.5 - numpy.hypot(dx, dy), 0, 1).astype(numpy.float32)
+    inside = coverage > 0
+    return dy[inside], dx[inside], coverage[inside]
+
+
+def frame_windows(t: numpy.ndarray, fps: float, speed: float, trail: float) -> tuple[numpy.ndarray, ...]:
+    """Session time of every frame and the ``[start, end)`` samples of its trail (``t`` sorted)."""
+    duration = t[-1] - t[0] if len(t) else 0.0
+    clock = t[0] + numpy.arange(int(duration * fps / speed) + 1) * speed / fps if len(t) else numpy.zeros(0)
+    return clock, numpy.searchsorted(t, clock - trail, side="right"), numpy.searchsorted(t, clock, side="right")
+
+
+def _union(a: Box | None, b: Box | None) -> Box | None:
+    if a is None or b is None:
+        return a or b
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def replay_frames(
+    x: Any,
+    y: Any,
+    t: Any,
+    background: numpy.ndarray,
+    fps: float = FPS,
+    speed: float = 1.0,
+    trail: float = TRAIL_SECONDS,
+    radius: int = RADIUS,
+    color: tuple[int, int, int] = COLOR,
+) -> Iterator[tuple[numpy.ndarray, Box | None]]:
+    """Yield every frame of the replay and the box ``(top, left, bottom, right)`` that changed since the last one.
+
+    ``x``/``y`` are in background pixels and ``t`` in seconds, sorted. The
+    same frame buffer is updated and yielded each time; copy it to keep it.
+    """
+    x, y, t = (numpy.asarray(values, dtype=float) for values in (x, y, t))
+    height, width = background.shape[:2]
+    canvas = background.copy()
+    dy, dx, coverage = disc_stamp(radius)
+    paint = numpy.array(color, dtype=numpy.float32)
+    clock, starts, ends = frame_windows(t, fps, speed, trail)
+    rows, cols = numpy.rint(y).astype(int), numpy.rint(x).astype(int)
+
+    previous = None
+    for now, start, end in zip(clock, starts, ends, strict=True):
+        px, py = cols[start:end], rows[start:end]
+        box = None
+        if end > start:
+            top, left = max(int(py.min()) - radius, 0), max(int(px.min()) - radius, 0)
+            bottom, right = min(int(py.max()) + radius + 1, height), min(int(px.max()) + radius + 1, width)
+            box = (top, left, bottom, right) if top < bottom and left < right else None
+
+        dirty = _union(previous, box)
+        if dirty is not None:
+            top, left, bottom, right = dirty
+            canvas[top:bottom, left:right] = background[top:bottom, left:right]
+        if box is not None:
+            top, left, bottom, right = box
+            fade = numpy.clip(1 - (now - t[start:end]) / trail, MIN_ALPHA, 1).astype(numpy.float32)
+            r, c = py[:, None] + dy, px[:, None] + dx
+            keep = (r >= top) & (r < bottom) & (c >= left) & (c < right)
+            alpha = numpy.zeros((bottom - top, right - left), dtype=numpy.float32)
+            # overlapping dots keep the most opaque one
+            numpy.maximum.at(
+                alpha.ravel(), ((r - top) * (right - left) + c - left)[keep], (fade[:, None] * coverage)[keep]
+            )
+            region = background[top:bottom, left:right].astype(numpy.float32)
+            canvas[top:bottom, left:right] = numpy.rint(region + (paint - region) * alpha[:, :, None])
+        previous = box
+        yield canvas, dirty
+
+
+def gif_palette(background: numpy.ndarray, color: tuple[int, int, int] = COLOR) -> Image.Image:
+    """Fixed palette: 240 colors of the background plus 16 blends of the trail color into it."""
+    quantized = Image.fromarray(background).quantize(colors=240, method=Image.Quantize.FASTOCTREE)
+    colors = numpy.array(quantized.getpalette()[: 240 * 3], dtype=float).reshape(-1, 3)
+    colors = numpy.vstack([colors, numpy.zeros((240 - len(colors), 3))])
+    mean = background.reshape(-1, 3).mean(axis=0)
+    blends = mean + (numpy.array(color) - mean) * numpy.linspace(0.25, 1, 16)[:, None]
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(numpy.rint(numpy.vstack([colors, blends])).astype(numpy.uint8).ravel().tolist())
+    return palette
+
+
+def _quantize(rgb: numpy.ndarray, palette: Image.Image) -> numpy.ndarray:
+    return numpy.asarray(Image.fromarray(rgb).quantize(palette=palette, dither=Image.Dither.NONE))
+
+
+def write_gif(
+    frames: Iterator[tuple[numpy.ndarray, Box | None]], background: numpy.ndarray, path: Path, fps: float = FPS
+) -> int:
+    """Stream the frames into a looping GIF as they are rendered. Returns the frame count.
+
+    Every frame after the first is stored as its changed box only, drawn over
+    the previous frame, so only that box is quantized and encoded and memory
+    does not grow with the length of the replay.
+    """
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return 0
+    palette = gif_palette(background)
+    colors = palette.getpalette()
+    indices = _quantize(background, palette).copy()
+    height, width = indices.shape
+    params = {"duration": round(1000 / fps), "disposal": 1}  # 1: keep the previous frame under the next box
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, "wb") as f:
+        for count, (canvas, box) in enumerate(chain([(first[0], (0, 0, height, width))], frames), start=1):
+            # an unchanged frame still needs its own delay; it redraws a single pixel
+            top, left, bottom, right = box or (0, 0, 1, 1)
+            region = numpy.ascontiguousarray(canvas[top:bottom, left:right])
+            indices[top:bottom, left:right] = _quantize(region, palette)
+            tile = Image.fromarray(numpy.ascontiguousarray(indices[top:bottom, left:right]), "P")
+            tile.putpalette(colors)
+            if count == 1:
+                header, _ = GifImagePlugin.getheader(tile, info={"loop": 0, **params})
+                f.write(b"".join(header))
+            f.write(b"".join(GifImagePlugin.getdata(tile, offset=(left, top), **params)))
+        f.write(b";")
+    return count
+
+
+def write_frames(frames: Iterator[tuple[numpy.ndarray, Box | None]], folder: Path) -> int:
+    """Write the frames as ``frame_00000.png``... into ``folder``. Returns the frame count."""
+    folder.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for count, (canvas, _box) in enumerate(frames, start=1):
+        Image.fromarray(canvas).save(folder / f"frame_{count - 1:05d}.png", compress_level=1)
+    return count
+
+
+def load_replay(
+    name: str, post_id: int, data_dir: Path = Path("data"), width: int = 1920, height: int = 1080, scale: float = 0.5
+) -> tuple[pd.DataFrame, numpy.ndarray]:
+    """Gaze of a participant's post in background pixels, sorted by time, and the decoded background."""
+    gaze = pd.read_csv(data_dir / catalog.artifact_path(name, "gaze_posts", post_id))
+    gaze = gaze.dropna(subset=["x", "y", "time_seconds"]).sort_values("time_seconds", kind="stable")
+    background = load_background(data_dir / catalog.artifact_path(name, "screenshot", post_id), scale)
+    # the screenshot may not have the screen's resolution (e.g. HiDPI captures)
+    gaze = gaze.assign(
+        x=gaze["x"] * background.shape[1] / width,
+        y=gaze["y"] * background.shape[0] / height,
+    )
+    return gaze, background
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Animated replay of the gaze trail of a post over its screenshot",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # GIF of alice's gaze on post 20, half-size, 15 fps
+  python scripts/replay.py alice --post 20
+
+  # Twice as fast, 10 fps, 2-second trail, written as PNG frames
+  python scripts/replay.py alice --post 20 --speed 2 --fps 10 --trail 2 --frames replay_frames
+        """,
+    )
+    parser.add_argument("name", type=str, help="Participant name")
+    parser.add_argument("--post", type=int, required=True, help="Post ID")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--output", "-o", type=str, default=None, help="GIF path (default: <name>/replay/...gif)")
+    parser.add_argument("--frames", type=str, default=None, help="Write a PNG frame sequence to this folder instead")
+    parser.add_argument("--fps", type=float, default=FPS, help=f"Frames per second of the replay (default: {FPS})")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed relative to real time (default: 1)")
+    parser.add_argument("--trail", type=float, default=TRAIL_SECONDS, help="Trail length in seconds (default: 1)")
+    parser.add_argument("--radius", type=int, default=RADIUS, help=f"Trail dot radius in pixels (default: {RADIUS})")
+    parser.add_argument("--scale", type=float, default=0.5, help="Scale of the frames to the screenshot (default: 0.5)")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    try:
+        gaze, background = load_replay(args.name, args.post, data_dir, args.width, args.height, args.scale)
+    except FileNotFoundError as e:
+        sys.exit(f"ERROR: {e}")
+    if gaze.empty:
+        sys.exit(f"ERROR: no gaze for {args.name} post {args.post}")
+
+    began = time.perf_counter()
+    frames = replay_frames(
+        gaze["x"], gaze["y"], gaze["time_seconds"], background, args.fps, args.speed, args.trail, args.radius
+    )
+    if args.frames:
+        target = Path(args.frames)
+        count = write_frames(frames, target)
+    else:
+        target = (
+            Path(args.output)
+            if args.output
+            else data_dir / args.name / "replay" / f"{args.name}_replay_{args.post}.gif"
+        )
+        count = write_gif(frames, background, target, args.fps)
+    elapsed = time.perf_counter() - began
+    seconds = gaze["time_seconds"].iloc[-1] - gaze["time_seconds"].iloc[0]
+    print(
+        f"{count} frames ({seconds:.1f}s of gaze) written to {target} in {elapsed:.2f}s "
+        f"({seconds / args.speed / max(elapsed, 1e-9):.1f}x real time)"
+    )
+
+
+if __name__ == "__main__":
+    main()
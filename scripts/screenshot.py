@@ -1,35 +1,146 @@
+"""
+Screen capture during a recording session.
+
+Capturing and PNG encoding are decoupled: the capturing thread grabs frames on
+a fixed schedule anchored to the session start (so encoding time never delays
+the next frame) and hands them to a pool of encoder threads. Frames whose
+32x32 grayscale thumbnail matches the last kept frame's are skipped, since
+nothing changed on screen; the frame after a changed one is always kept, in
+case the change was a new post still scrolling in. Every kept frame is stamped
+with get_current_time_iso8601(), the same clock that stamps the gaze samples
+in generate.py, and, when the Tobii SDK is available, with its system time
+stamp as well.
+"""
+
+import argparse
+import csv
 import os
-import sys
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
 
+import catalog
+import numpy
 import pyautogui
+from PIL import Image
 from utils import get_current_time_iso8601
 
 
-def take_screenshots(name: str, duration: int, slots: int = 3) -> None:
-    time.sleep(5)
-    print(duration, slots, int(duration / slots))
-    screenshot(name, 0)
-    for _ in range(1, int(duration / slots) + 1):
-        time.sleep(slots)
-        screenshot(name, _)
+try:
+    import tobii_research as tr
+except ImportError:  # capture still works without the eye tracker SDK
+    tr = None
 
 
-def screenshot(name: str, screen_number: int) -> None:
-    target_folder = f"data/{name}/screenshots"
+THUMBNAIL_SIZE = 32
+# Largest change of a thumbnail cell, in gray levels, still treated as the same screen
+MAX_DISTANCE = 1.0
+
+
+def frame_thumbnail(image: Any, size: int = THUMBNAIL_SIZE) -> numpy.ndarray:
+    """Mean gray level of each cell of a ``size`` x ``size`` grid over a PIL image."""
+    return numpy.asarray(image.convert("L").resize((size, size), Image.Resampling.BOX), dtype=numpy.float32)
 
-    current_time = get_current_time_iso8601(option=2)
-    screenshot_path = os.path.join(target_folder, f"screenshot_{current_time}.png")
-    screenshot = pyautogui.screenshot()
-    screenshot.save(screenshot_path)
 
+def frame_distance(a: numpy.ndarray, b: numpy.ndarray) -> float:
+    """Largest per-cell gray-level difference of two thumbnails."""
+    return float(numpy.abs(a - b).max())
+
+
+def screenshot_filename(current_time: str) -> str:
+    """Filename-safe name for a frame stamped with an ISO 8601 time."""
+    return "screenshot_" + current_time.rstrip("Z").replace(":", "_") + ".png"
+
+
+def _encode(image: Any, screenshot_path: str, screen_number: int) -> None:
+    image.save(screenshot_path)
     print(f"Screenshot saved to {screenshot_path}", screen_number)
 
 
+def capture_session(
+    name: str,
+    duration: float,
+    interval: float = 3.0,
+    encoders: int = 2,
+    max_distance: float = MAX_DISTANCE,
+) -> list[dict[str, Any]]:
+    """Capture the screen every ``interval`` seconds for ``duration`` seconds.
+
+    A frame is dropped when no thumbnail cell differs by more than
+    ``max_distance`` gray levels from the last kept frame, unless the frame
+    before it changed. Returns one record per kept frame and writes the same
+    records to ``screenshots/frames.csv``.
+    """
+    target_folder = f"data/{name}/screenshots"
+    frames: list[dict[str, Any]] = []
+    pending: list[Future] = []
+    last_thumbnail = None
+    changed = False
+    skipped = 0
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=encoders, thread_name_prefix="png-encoder") as pool:
+        for screen_number in range(int(duration / interval) + 1):
+            # sleep until the absolute tick so encoding never adds drift
+            delay = start + screen_number * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            current_time = get_current_time_iso8601()
+            system_time_stamp = tr.get_system_time_stamp() if tr is not None else None
+            image = pyautogui.screenshot()
+
+            thumbnail = frame_thumbnail(image)
+            unchanged = last_thumbnail is not None and frame_distance(thumbnail, last_thumbnail) <= max_distance
+            # a post that starts between two ticks may still be scrolling in at the first one
+            if unchanged and not changed:
+                skipped += 1
+                continue
+            changed = not unchanged
+            last_thumbnail = thumbnail
+
+            filename = screenshot_filename(current_time)
+            pending.append(pool.submit(_encode, image, os.path.join(target_folder, filename), screen_number))
+            frames.append({"current_time": current_time, "system_time_stamp": system_time_stamp, "filename": filename})
+
+    for future in pending:
+        future.result()
+
+    with open(os.path.join(target_folder, "frames.csv"), "a", newline="") as file_handle:
+        writer = csv.DictWriter(file_handle, fieldnames=["current_time", "system_time_stamp", "filename"])
+        if file_handle.tell() == 0:
+            writer.writeheader()
+        writer.writerows(frames)
+
+    with catalog.open_catalog(Path("data")) as conn:
+        frame_paths = [(f"{name}/screenshots/{frame['filename']}", None) for frame in frames]
+        catalog.register_files(conn, Path("data"), name, catalog.FRAME_KIND, frame_paths)
+
+    print(f"Captured {len(frames)} frames, skipped {skipped} unchanged")
+    return frames
+
+
+def take_screenshots(
+    name: str, duration: int, slots: float = 3, encoders: int = 2, max_distance: float = MAX_DISTANCE
+) -> None:
+    time.sleep(5)
+    print(duration, slots, int(duration / slots))
+    capture_session(name, duration, interval=slots, encoders=encoders, max_distance=max_distance)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        name = sys.argv[1]
-        duration = int(sys.argv[2])
-        take_screenshots(name, duration)
-    else:
-        print("Please provide a folder name as an argument.")
+    parser = argparse.ArgumentParser(description="Capture the screen during a session")
+    parser.add_argument("name", type=str, help="Participant name")
+    parser.add_argument("duration", type=int, help="Total seconds to capture")
+    parser.add_argument("--interval", type=float, default=3, help="Seconds between frames (default: 3)")
+    parser.add_argument("--encoders", type=int, default=2, help="PNG encoder threads (default: 2)")
+    parser.add_argument(
+        "--max-distance",
+        type=float,
+        default=MAX_DISTANCE,
+        help="Skip frames whose 32x32 thumbnail differs from the last kept frame by at most this many gray levels "
+        f"(default: {MAX_DISTANCE})",
+    )
+    args = parser.parse_args()
+    take_screenshots(args.name, args.duration, args.interval, args.encoders, args.max_distance)
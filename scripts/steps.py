@@ -0,0 +1,150 @@
+"""
+Content-hash build cache for the pipeline steps.
+
+Each cacheable step declares the files it reads, the files it writes and the
+code it runs. After a step succeeds, a fingerprint of its inputs, code and
+parameters is recorded in ``data/<participant>/manifest.json`` together with
+a fingerprint of its outputs. A step is up to date when the current
+fingerprints match the recorded ones, so re-running the pipeline only
+recomputes what changed. File hashes are memoized by size and mtime, so an
+unchanged tree is checked without re-reading it.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+MANIFEST_NAME = "manifest.json"
+
+# Paths are relative to data/<participant>; "{name}" is the participant name. "code" is the step's
+# script followed by every local module it imports, directly or not (checked by tools/test_steps.py).
+STEP_SPECS: dict[str, dict[str, list[str]]] = {
+    "quality": {
+        "inputs": ["gaze.csv", "times/{name}_posts_times.json"],
+        "outputs": ["quality.json"],
+        "code": ["quality.py", "fixations.py", "match.py", "utils.py", "catalog.py", "instrument.py"],
+    },
+    "process": {
+        "inputs": ["gaze.csv"],
+        "outputs": ["gaze_clean.csv"],
+        "code": ["gazeProcess.py", "utils.py", "catalog.py", "instrument.py"],
+    },
+    "match": {
+        "inputs": ["gaze_clean.csv", "times/{name}_posts_times.json", "screenshots/*.png"],
+        "outputs": ["gaze_posts/*.csv"],
+        "code": ["match.py", "utils.py", "catalog.py", "instrument.py"],
+    },
+    "visualize": {
+        "inputs": ["gaze_posts/*.csv", "screenshots/{name}_screenshot_*.png"],
+        "outputs": ["heatmaps/*.png", "scanpath/*.png"],
+        "code": [
+            "visualizations.py",
+            "fixations.py",
+            "metrics.py",
+            "catalog.py",
+            "instrument.py",
+            "visualizations/gazeHeatplot.py",
+            "visualizations/scanpathPlot.py",
+        ],
+    },
+}
+
+
+def load_manifest(data_dir: Path) -> dict[str, Any]:
+    path = data_dir / MANIFEST_NAME
+    if not path.exists():
+        return {"files": {}, "steps": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(data_dir: Path, manifest: dict[str, Any]) -> None:
+    path = data_dir / MANIFEST_NAME
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    tmp.replace(path)
+
+
+def file_hash(path: Path, manifest: dict[str, Any]) -> str:
+    """sha256 of a file, reused from the manifest while its size and mtime are unchanged."""
+    stat = path.stat()
+    key = str(path.resolve())
+    cached = manifest["files"].get(key)
+    if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+        return cached["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    manifest["files"][key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def fingerprint(base: Path, patterns: list[str], manifest: dict[str, Any]) -> dict[str, str]:
+    """Hash of every file matched by ``patterns`` under ``base``, keyed by relative path."""
+    hashes = {}
+    for pattern in patterns:
+        matches = sorted(base.glob(pattern)) if any(c in pattern for c in "*?[") else [base / pattern]
+        for path in matches:
+            rel = path.relative_to(base).as_posix()
+            hashes[rel] = file_hash(path, manifest) if path.is_file() else "missing"
+    return hashes
+
+
+def step_key(data_dir: Path, name: str, step: str, params: dict[str, Any], manifest: dict[str, Any]) -> str:
+    """Combined hash of a step's inputs, code and parameters."""
+    spec = STEP_SPECS[step]
+    inputs = [pattern.format(name=name) for pattern in spec["inputs"]]
+    payload = {
+        "inputs": fingerprint(data_dir, inputs, manifest),
+        "code": fingerprint(SCRIPTS_DIR, spec["code"], manifest),
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def output_fingerprint(data_dir: Path, name: str, step: str, manifest: dict[str, Any]) -> dict[str, str]:
+    outputs = [pattern.format(name=name) for pattern in STEP_SPECS[step]["outputs"]]
+    return fingerprint(data_dir, outputs, manifest)
+
+
+def is_up_to_date(data_dir: Path, name: str, step: str, params: dict[str, Any]) -> bool:
+    """True when ``step`` already ran on the current inputs and its outputs are intact."""
+    if step not in STEP_SPECS:
+        return False
+    manifest = load_manifest(data_dir)
+    recorded = manifest["steps"].get(step)
+    if recorded is None:
+        return False
+
+    outputs = output_fingerprint(data_dir, name, step, manifest)
+    up_to_date = (
+        bool(outputs)
+        and "missing" not in outputs.values()
+        and recorded["outputs"] == outputs
+        and recorded["key"] == step_key(data_dir, name, step, params, manifest)
+    )
+    save_manifest(data_dir, manifest)
+    return up_to_date
+
+
+def record_step(data_dir: Path, name: str, step: str, params: dict[str, Any]) -> None:
+    """Store the fingerprints of a step that just completed successfully.
+
+    Inputs are hashed after the run, so steps that rewrite their own inputs
+    (match renames screenshots) are recorded in their final state.
+    """
+    if step not in STEP_SPECS:
+        return
+    manifest = load_manifest(data_dir)
+    manifest["steps"][step] = {
+        "key": step_key(data_dir, name, step, params, manifest),
+        "params": params,
+        "outputs": output_fingerprint(data_dir, name, step, manifest),
+    }
+    save_manifest(data_dir, manifest)
@@ -0,0 +1,331 @@
+"""
+Stitch the periodic screenshots of a session into one tall content canvas.
+
+Participants scroll through the feed, so a single screenshot does not show
+everything they looked at. Consecutive frames are aligned with FFT phase
+correlation on downsampled grayscale copies, which gives the vertical scroll
+offset of every frame. Each gaze sample is then moved into content coordinates
+using the offset of the frame that was on screen at its timestamp, and the
+heatmap is accumulated on the tall canvas in fixed-height tiles so only the
+tiles that receive gaze are ever allocated. The canvas itself is never held
+whole: each tile is pasted from the frames shown on its rows, blended with its
+density and appended to the output PNGs, so memory does not grow with the
+length of the feed.
+
+Note: match.py renames the first screenshot of every post, which removes its
+timestamp from the filename; run stitching before matching to use all frames.
+"""
+
+import argparse
+import struct
+import sys
+import zlib
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import numpy
+import pandas as pd
+from match import load_json_data
+from matplotlib import colormaps, image
+from PIL import Image
+from utils import screenshot_time
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "visualizations"))
+from fixations import detect_fixations  # noqa: E402
+from gazeHeatplot import gaussian  # noqa: E402
+
+
+def list_frames(screenshot_folder: Path) -> list[tuple[datetime, Path]]:
+    """Return the timestamped screenshots of a session in capture order."""
+    frames = []
+    for path in screenshot_folder.glob("screenshot_*.png"):
+        try:
+            frames.append((screenshot_time(path.name), path))
+        except ValueError:
+            continue
+    return sorted(frames)
+
+
+def to_small_gray(img: Any, factor: int) -> numpy.ndarray:
+    """Grayscale copy of an image, downsampled by block-averaging ``factor`` x ``factor`` pixels."""
+    gray = numpy.asarray(img, dtype=numpy.float32)[:, :, :3].mean(axis=2)
+    h, w = (gray.shape[0] // factor) * factor, (gray.shape[1] // factor) * factor
+    return gray[:h, :w].reshape(h // factor, factor, w // factor, factor).mean(axis=(1, 3))
+
+
+def vertical_shift(previous: numpy.ndarray, current: numpy.ndarray) -> tuple[int, float]:
+    """Estimate how many rows the content moved up between two frames.
+
+    Uses phase correlation: the normalized cross-power spectrum of the two
+    frames has an inverse transform that peaks at their relative translation.
+    Frames are zero-padded to twice their height so shifts of up to almost a
+    full frame are not wrapped around. Returns the shift in rows of the given
+    (downsampled) arrays and the peak height, which drops towards 0 when the
+    frames do not overlap.
+    """
+    height = previous.shape[0]
+    shape = (2 * height, previous.shape[1])
+    f_prev = numpy.fft.rfft2(previous - previous.mean(), s=shape)
+    f_curr = numpy.fft.rfft2(current - current.mean(), s=shape)
+    cross = f_prev * numpy.conj(f_curr)
+    cross /= numpy.abs(cross) + 1e-12
+    correlation = numpy.fft.irfft2(cross, s=shape)
+
+    row, _col = numpy.unravel_index(numpy.argmax(correlation), correlation.shape)
+    shift = int(row) if row < height else int(row) - shape[0]
+    return shift, float(correlation.max())
+
+
+def scroll_offsets(frames: list[tuple[datetime, Path]], factor: int = 4, min_peak: float = 0.2) -> pd.DataFrame:
+    """Content offset (in full-resolution rows) of the top of every frame.
+
+    When the correlation peak is below ``min_peak`` the frames share too little
+    content to be aligned; the frame is then placed right below the previous
+    one and marked as not aligned.
+    """
+    rows = []
+    offset = 0
+    previous = None
+    for frame_time, path in frames:
+        small = to_small_gray(image.imread(path), factor)
+        shift, peak = (0, 1.0) if previous is None else vertical_shift(previous, small)
+        aligned = peak >= min_peak
+        offset += shift * factor if aligned else small.shape[0] * factor
+        rows.append(
+            {"screenshot_time": frame_time, "filename": path.name, "offset": offset, "peak": peak, "aligned": aligned}
+        )
+        previous = small
+
+    offsets = pd.DataFrame(rows)
+    # scrolling back above the first frame gives negative offsets
+    offsets["offset"] -= offsets["offset"].min()
+    return offsets
+
+
+def frame_heights(frames: list[tuple[datetime, Path]]) -> numpy.ndarray:
+    """Height in rows of every frame, read from the PNG headers."""
+    heights = []
+    for _frame_time, path in frames:
+        with Image.open(path) as img:
+            heights.append(img.height)
+    return numpy.array(heights, dtype=numpy.int64)
+
+
+def frame_on_rows(offsets: numpy.ndarray, heights: numpy.ndarray, canvas_height: int) -> numpy.ndarray:
+    """Index of the frame shown on every canvas row (later frames win), -1 where no frame is."""
+    shown = numpy.full(canvas_height, -1, dtype=numpy.int64)
+    for k, (offset, height) in enumerate(zip(offsets, heights, strict=True)):
+        shown[offset : offset + height] = k
+    return shown
+
+
+def canvas_tile(
+    frames: list[tuple[datetime, Path]], offsets: numpy.ndarray, shown: numpy.ndarray, top: int, bottom: int, width: int
+) -> numpy.ndarray:
+    """Rows ``top:bottom`` of the stitched canvas as 8-bit RGB; only the frames shown on them are decoded."""
+    tile = numpy.zeros((bottom - top, width, 3), dtype=numpy.uint8)
+    rows = shown[top:bottom]
+    for k in numpy.unique(rows[rows >= 0]):
+        with Image.open(frames[k][1]) as img:
+            pixels = numpy.asarray(img.convert("RGB"))
+        local = numpy.flatnonzero(rows == k)
+        tile[local, : pixels.shape[1]] = pixels[top + local - offsets[k], :width]
+    return tile
+
+
+def to_content_coordinates(gaze: pd.DataFrame, offsets: pd.DataFrame) -> pd.DataFrame:
+    """Add a ``content_y`` column using the offset of the frame on screen at each sample.
+
+    Samples recorded before the first frame are dropped.
+    """
+    sample_times = gaze["current_time"].to_numpy(dtype="datetime64[ns]")
+    frame_times = offsets["screenshot_time"].to_numpy(dtype="datetime64[ns]")
+    frame = numpy.searchsorted(frame_times, sample_times, side="right") - 1
+
+    mapped = gaze[frame >= 0].copy()
+    mapped["frame"] = frame[frame >= 0]
+    mapped["content_y"] = mapped["y"].to_numpy() + offsets["offset"].to_numpy()[mapped["frame"].to_numpy()]
+    return mapped
+
+
+def accumulate_tiled(
+    gazepoints: list[tuple[int, int, float]],
+    width: int,
+    tile_height: int = 1024,
+    gaussianwh: int = 200,
+    gaussiansd: float | None = None,
+) -> dict[int, numpy.ndarray]:
+    """Accumulate Gaussian kernels on a canvas split in horizontal tiles.
+
+    Returns a dict mapping tile row index to a (tile_height, width) density
+    block; tiles that receive no kernel are never allocated. Kernels are
+    centred on the gazepoint and clipped at the canvas edges.
+    """
+    gsd = gaussianwh / 6 if gaussiansd is None else gaussiansd
+    gaus = gaussian(gaussianwh, gsd)
+    half = gaussianwh // 2
+    tiles: dict[int, numpy.ndarray] = {}
+
+    for px, py, weight in gazepoints:
+        x0, y0 = int(px) - half, int(py) - half
+        kx0, kx1 = max(0, -x0), min(gaussianwh, width - x0)
+        if kx0 >= kx1:
+            continue
+        top = max(0, y0)
+        bottom = y0 + gaussianwh
+        for tile in range(top // tile_height, (bottom - 1) // tile_height + 1):
+            block = tiles.get(tile)
+            if block is None:
+                block = tiles[tile] = numpy.zeros((tile_height, width), dtype=float)
+            row0 = max(top, tile * tile_height)
+            row1 = min(bottom, (tile + 1) * tile_height)
+            block[row0 - tile * tile_height : row1 - tile * tile_height, x0 + kx0 : x0 + kx1] += (
+                gaus[row0 - y0 : row1 - y0, kx0:kx1] * weight
+            )
+    return tiles
+
+
+def density_range(tiles: dict[int, numpy.ndarray]) -> tuple[float, float] | None:
+    """Lower bound (mean of the non-zero density) and span of the colour scale, None without density.
+
+    Like draw_heatmap, values below the lower bound are left transparent. The
+    mean and maximum are kept as running values over the tiles.
+    """
+    total, count, peak = 0.0, 0, 0.0
+    for block in tiles.values():
+        positive = block[block > 0]
+        total += float(positive.sum())
+        count += positive.size
+        peak = max(peak, float(positive.max(initial=0)))
+    if count == 0:
+        return None
+    lowbound = total / count
+    return lowbound, max(peak - lowbound, 1e-12)
+
+
+def blend_tile(tile: numpy.ndarray, block: numpy.ndarray, lowbound: float, span: float, alpha: float) -> numpy.ndarray:
+    """The jet colour of the density blended over the visible part of an 8-bit canvas tile."""
+    visible = block >= lowbound
+    if not visible.any():
+        return tile
+    base = tile.astype(numpy.float32) / 255
+    colour = colormaps["jet"]((block - lowbound) / span)[:, :, :3]
+    blended = numpy.where(visible[:, :, numpy.newaxis], base * (1 - alpha) + colour * alpha, base)
+    return numpy.rint(blended * 255).astype(numpy.uint8)
+
+
+def stitched_tiles(
+    frames: list[tuple[datetime, Path]],
+    offsets: numpy.ndarray,
+    heights: numpy.ndarray,
+    width: int,
+    tiles: dict[int, numpy.ndarray],
+    tile_height: int,
+    alpha: float = 0.5,
+) -> Iterator[tuple[numpy.ndarray, numpy.ndarray]]:
+    """Yield the canvas and heatmap rows of every tile, top to bottom, one tile in memory at a time."""
+    canvas_height = int((offsets + heights).max())
+    shown = frame_on_rows(offsets, heights, canvas_height)
+    scale = density_range(tiles)
+    for top in range(0, canvas_height, tile_height):
+        bottom = min(top + tile_height, canvas_height)
+        tile = canvas_tile(frames, offsets, shown, top, bottom, width)
+        block = tiles.get(top // tile_height)
+        if block is None or scale is None:
+            yield tile, tile
+        else:
+            yield tile, blend_tile(tile, block[: bottom - top], *scale, alpha)
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png_rows(
+    paths: list[Path], width: int, height: int, blocks: Iterable[tuple[numpy.ndarray, ...]], level: int = 6
+) -> None:
+    """Stream 8-bit RGB images to PNG files block of rows by block; the i-th array of each item goes to paths[i]."""
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(path, "wb")) for path in paths]
+        compressors = [zlib.compressobj(level) for _ in paths]
+        for f in files:
+            f.write(b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        for arrays in blocks:
+            for f, compressor, rows in zip(files, compressors, arrays, strict=True):
+                # every scanline starts with its filter type, 0 (none)
+                scanlines = numpy.hstack([numpy.zeros((len(rows), 1), numpy.uint8), rows.reshape(len(rows), -1)])
+                data = compressor.compress(scanlines.tobytes())
+                if data:
+                    f.write(_png_chunk(b"IDAT", data))
+        for f, compressor in zip(files, compressors, strict=True):
+            f.write(_png_chunk(b"IDAT", compressor.flush()) + _png_chunk(b"IEND", b""))
+
+
+def post_window(json_data: list[Any], post_id: int) -> tuple[datetime, datetime]:
+    """Absolute start and end time of a post from the times JSON."""
+    for obj in json_data:
+        if int(obj["postID"]) == post_id:
+            initial_date = datetime.strptime(obj["initialDate"], "%Y-%m-%dT%H:%M:%S.%fZ")
+            return (
+                initial_date + timedelta(seconds=obj["PostStartTime"]),
+                initial_date + timedelta(seconds=obj["PostEndTime"]),
+            )
+    raise ValueError(f"post {post_id} not found in the times JSON")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stitch scrolled screenshots and draw a tall-feed heatmap")
+    parser.add_argument("name", type=str, help="Participant name")
+    parser.add_argument("--post", type=int, default=None, help="Only use frames and gaze of this post")
+    parser.add_argument("--factor", type=int, default=4, help="Downsampling factor for offset estimation")
+    parser.add_argument("--tile-height", type=int, default=1024, help="Rows per density tile")
+    parser.add_argument("--fixations", action="store_true", help="Weight kernels by fixation duration")
+    args = parser.parse_args()
+
+    root = Path("data") / args.name
+    out_dir = root / "stitched"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    suffix = "" if args.post is None else f"_{args.post}"
+
+    frames = list_frames(root / "screenshots")
+    gaze = pd.read_csv(root / "gaze_clean.csv")
+    gaze["current_time"] = pd.to_datetime(gaze["current_time"], format="%Y-%m-%dT%H:%M:%S.%fZ")
+
+    if args.post is not None:
+        start, end = post_window(load_json_data(str(root / f"times/{args.name}_posts_times.json")), args.post)
+        frames = [(t, p) for t, p in frames if start <= t <= end]
+        gaze = gaze[(gaze["current_time"] >= start) & (gaze["current_time"] <= end)]
+    if not frames:
+        sys.exit(f"ERROR: no timestamped screenshots found for {args.name}")
+
+    offsets = scroll_offsets(frames, args.factor)
+    offsets.to_csv(out_dir / f"{args.name}_offsets{suffix}.csv", index=False)
+    heights = frame_heights(frames)
+    with Image.open(frames[0][1]) as first:
+        width = first.width
+    rows = offsets["offset"].to_numpy(dtype=numpy.int64)
+    canvas_height = int((rows + heights).max())
+
+    mapped = to_content_coordinates(gaze, offsets)
+    if args.fixations:
+        fixations = detect_fixations(mapped["x"], mapped["content_y"], mapped["time_seconds"])
+        gazepoints = list(zip(fixations["x"], fixations["y"], fixations["duration"] * 1000, strict=True))
+    else:
+        gazepoints = list(zip(mapped["x"], mapped["content_y"], [1] * len(mapped), strict=True))
+
+    tiles = accumulate_tiled(gazepoints, width, args.tile_height)
+    write_png_rows(
+        [out_dir / f"{args.name}_canvas{suffix}.png", out_dir / f"{args.name}_heatmap{suffix}.png"],
+        width,
+        canvas_height,
+        stitched_tiles(frames, rows, heights, width, tiles, args.tile_height),
+    )
+    print(f"Stitched {len(frames)} frames into a {width}x{canvas_height} canvas ({len(tiles)} tiles used)")
+
+
+if __name__ == "__main__":
+    main()
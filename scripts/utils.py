@@ -17,6 +17,18 @@ def get_current_time_iso8601(option: int = 1) -> str:
     return now.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
 
 
+def screenshot_time(filename: str) -> datetime:
+    """Parse the capture time out of a screenshot filename.
+
+    Accepts 'screenshot_<YYYY-MM-DDTHH_MM_SS>.png' and the millisecond variant
+    'screenshot_<YYYY-MM-DDTHH_MM_SS.fff>.png'. Raises ValueError otherwise.
+    """
+    timestamp_str = filename.replace("screenshot_", "").replace(".png", "").replace("_", ":")
+    if "." in timestamp_str:
+        return datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S.%f")
+    return datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S")
+
+
 def try_float(value: str) -> float:
     try:
         return float(value)
@@ -1,7 +1,24 @@
 import argparse
-import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any
+
+import matplotlib
+
+
+matplotlib.use("Agg")
+
+import catalog  # noqa: E402
+import metrics  # noqa: E402
+import pandas as pd  # noqa: E402
+from instrument import flush, traced  # noqa: E402
+from matplotlib import image as mpimg, pyplot  # noqa: E402
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "visualizations"))
+from gazeHeatplot import draw_heatmap, gaussian, gazepoints_from_samples  # noqa: E402
+from scanpathPlot import draw_scanpath  # noqa: E402
 
 
 def extract_post_id(filename: str) -> int:
@@ -9,53 +26,172 @@ def extract_post_id(filename: str) -> int:
     return int(filename.split("_")[-1].replace(".csv", ""))
 
 
-def create_visualizations(post_ids: list[int], name: str, root: Path, width: int = 1920, height: int = 1080) -> None:
-    """Generate heatmap and scanpath visualizations for each post."""
+def post_paths(name: str, post_id: int, root: Path) -> dict[str, str]:
+    """Input and output paths of one post's visualizations."""
+    return {
+        "input_csv": str(root / f"gaze_posts/{name}_gaze_{post_id}.csv"),
+        "screenshot": str(root / f"screenshots/{name}_screenshot_{post_id}.png"),
+        "heatmap": str(root / f"heatmaps/{name}_heatmap_{post_id}.png"),
+        "scanpath": str(root / f"scanpath/{name}_scanpath_{post_id}.png"),
+    }
+
+
+@traced("visualizations.render_post", rows=lambda data, *_, **__: len(data))
+def render_post(
+    data: pd.DataFrame,
+    screenshot: Any,
+    heatmap_file: str,
+    scanpath_file: str,
+    width: int = 1920,
+    height: int = 1080,
+    fixations: bool = False,
+) -> dict[str, Any]:
+    """Render the heatmap and scanpath of one post from already loaded inputs.
+
+    ``screenshot`` is the decoded background image shared by both plots.
+    Returns the scanpath metrics (see metrics.scanpath_metrics).
+    """
+    gaze_data = gazepoints_from_samples(data["x"], data["y"], data["time_seconds"], use_fixations=fixations)
+    fig = draw_heatmap(gaze_data, (width, height), savefilename=heatmap_file, img=screenshot)
+    pyplot.close(fig)
+
+    plot_x, _plot_y, _times = draw_scanpath(data, screenshot, scanpath_file)
+    return metrics.scanpath_metrics(data, len(plot_x))
+
+
+def create_visualizations(
+    post_ids: list[int],
+    name: str,
+    root: Path,
+    width: int = 1920,
+    height: int = 1080,
+    fixations: bool = False,
+    frames: dict[Any, pd.DataFrame] | None = None,
+) -> list[int]:
+    """Generate heatmap and scanpath visualizations for each post in this process.
+
+    When ``frames`` maps post IDs to gaze frames (the in-memory pipeline), they
+    are used instead of reading the per-post CSVs. A failing post does not stop
+    the others; the IDs of the failed posts are returned.
+    """
+    failed = []
     for post_id in post_ids:
-        input_csv = str(root / f"gaze_posts/{name}_gaze_{post_id}.csv")
-        screenshot_path = str(root / f"screenshots/{name}_screenshot_{post_id}.png")
-        heatmap_file = str(root / f"heatmaps/{name}_heatmap_{post_id}.png")
-        scanpath_file = str(root / f"scanpath/{name}_scanpath_{post_id}.png")
-
-        subprocess.run(
-            [
-                sys.executable,
-                "scripts/visualizations/gazeHeatplot.py",
-                input_csv,
-                str(width),
-                str(height),
-                "-b",
-                screenshot_path,
-                "-o",
-                heatmap_file,
-            ],
-            check=False,
-        )
-        subprocess.run(
-            [
-                sys.executable,
-                "scripts/visualizations/scanpathPlot.py",
-                "-g",
-                input_csv,
-                "-i",
-                screenshot_path,
-                "-o",
-                scanpath_file,
-            ],
-            check=False,
-        )
+        paths = post_paths(name, post_id, root)
+        try:
+            data = frames[post_id] if frames is not None else pd.read_csv(paths["input_csv"])
+            screenshot = mpimg.imread(paths["screenshot"])
+            scan = render_post(data, screenshot, paths["heatmap"], paths["scanpath"], width, height, fixations)
+        except Exception as e:
+            print(f"ERROR: visualizations for {name} post {post_id} failed: {e}")
+            failed.append(post_id)
+            continue
+
+        metrics.record_scanpath(name, post_id, scan, root.parent)
+        print(name, post_id)
+    return failed
+
+
+def record_renders(name: str, post_ids: list[int], data_dir: Path = Path("data")) -> None:
+    """Record the heatmaps and scanpaths of ``name`` that were written in the catalogue."""
+    with catalog.open_catalog(data_dir) as conn:
+        catalog.register(conn, data_dir, name, "heatmap", post_ids)
+        catalog.register(conn, data_dir, name, "scanpath", post_ids)
+
+
+def post_ids_with_gaze(name: str, data_dir: Path = Path("data")) -> list[int]:
+    """Post IDs of ``name`` with per-post gaze, from the catalogue when it matches the gaze_posts folder."""
+    with catalog.open_catalog(data_dir) as conn:
+        files = catalog.listed_files(conn, data_dir, name, "gaze_posts")
+    return sorted(extract_post_id(path.name) for path in files)
+
+
+def _init_worker(gaussianwh: int = 200) -> None:
+    """Process-pool initializer: build the Gaussian kernel once per worker."""
+    gaussian(gaussianwh, gaussianwh / 6)
+
+
+def _render_task(task: dict[str, Any]) -> None:
+    """Render one (participant, post) task inside a worker process."""
+    # each screenshot belongs to one task, so the worker decodes it itself and only its path travels
+    screenshot = mpimg.imread(task["screenshot"])
+    data = pd.read_csv(task["input_csv"])
+    scan = render_post(
+        data, screenshot, task["heatmap"], task["scanpath"], task["width"], task["height"], task["fixations"]
+    )
+    # each worker upserts its own row; WAL lets the others keep writing
+    metrics.record_scanpath(task["name"], task["post_id"], scan, Path(task["data_dir"]))
+    # pool workers exit without running atexit handlers
+    flush()
+
+
+def render_parallel(
+    posts: list[tuple[str, int]],
+    data_dir: Path,
+    jobs: int,
+    width: int = 1920,
+    height: int = 1080,
+    fixations: bool = False,
+) -> list[tuple[str, int]]:
+    """Render every (participant, post) pair on a pool of ``jobs`` worker processes; returns the failed pairs."""
+    tasks = [
+        {
+            **post_paths(name, post_id, data_dir / name),
+            "name": name,
+            "post_id": post_id,
+            "data_dir": str(data_dir),
+            "width": width,
+            "height": height,
+            "fixations": fixations,
+        }
+        for name, post_id in posts
+    ]
+    failed = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        futures = {pool.submit(_render_task, task): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), start=1):
+            task = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"ERROR: visualizations for {task['name']} post {task['post_id']} failed: {e}")
+                failed.append((task["name"], task["post_id"]))
+                continue
+            print(f"[{done}/{len(tasks)}] {task['name']} post {task['post_id']} rendered")
+    return failed
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Generate heatmap and scanpath visualizations")
-    parser.add_argument("name", type=str, help="Participant name")
+    parser.add_argument("name", type=str, nargs="+", help="Participant name(s)")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument(
+        "--fixations", action="store_true", help="Weight heatmaps by fixation duration instead of raw samples"
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1, help="Worker processes; >1 renders (participant, post) tasks in parallel"
+    )
     args = parser.parse_args()
 
-    root = Path("data") / args.name
-    gaze_posts_dir = root / "gaze_posts"
+    data_dir = Path("data")
+    post_ids = {name: post_ids_with_gaze(name, data_dir) for name in args.name}
+    if args.jobs > 1:
+        posts = [(name, post_id) for name in args.name for post_id in post_ids[name]]
+        failed = render_parallel(posts, data_dir, args.jobs, args.width, args.height, args.fixations)
+    else:
+        failed = [
+            (name, post_id)
+            for name in args.name
+            for post_id in create_visualizations(
+                post_ids[name], name, data_dir / name, args.width, args.height, args.fixations
+            )
+        ]
 
-    post_ids = [extract_post_id(f.name) for f in gaze_posts_dir.glob("*.csv")]
-    create_visualizations(post_ids, args.name, root)
+    for name in args.name:
+        record_renders(name, post_ids[name], data_dir)
+    # a non-zero exit keeps the pipeline from caching the step, so the failed posts are retried
+    if failed:
+        sys.exit(f"ERROR: {len(failed)} post(s) failed: " + ", ".join(f"{name} {post_id}" for name, post_id in failed))
 
 
 if __name__ == "__main__":
@@ -1,14 +1,22 @@
 import argparse
 import contextlib
 import csv
+import functools
 import os
+import sys
+from pathlib import Path
 from typing import Any
 
 import numpy
 from matplotlib import image, pyplot
 
 
-def draw_display(dispsize: tuple[int, int], imagefile: str | None = None) -> tuple[Any, Any]:
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from fixations import FIX_MAX_STEP, FIX_MIN_DURATION, detect_fixations  # noqa: E402
+from instrument import traced  # noqa: E402
+
+
+def draw_display(dispsize: tuple[int, int], imagefile: str | None = None, img: Any = None) -> tuple[Any, Any]:
     """Returns a matplotlib.pyplot Figure and its axes, with a size of
     dispsize, a black background colour, and optionally with an image drawn
     onto it
@@ -25,6 +33,10 @@ def draw_display(dispsize: tuple[int, int], imagefile: str | None = None) -> tup
                     may be smaller than the display size, the function
                     assumes that the image was presented at the centre of
                     the display (default = None)
+    img		-	an already decoded image array (as returned by
+                    matplotlib.image.imread); takes precedence over
+                    imagefile so callers can decode a screenshot once
+                    and reuse it (default = None)
 
     returns
     fig, ax		-	matplotlib.pyplot Figure and its axes: field of zeros
@@ -34,14 +46,14 @@ def draw_display(dispsize: tuple[int, int], imagefile: str | None = None) -> tup
 
     # construct screen (black background)
     screen = numpy.zeros((dispsize[1], dispsize[0], 3), dtype="float32")
-    # if an image location has been passed, draw the image
-    if imagefile is not None:
+    # if an image location has been passed, load the image
+    if img is None and imagefile is not None:
         # check if the path to the image exists
         if not os.path.isfile(imagefile):
             raise Exception(f"ERROR in draw_display: imagefile not found at '{imagefile}'")
-        # load image
-
         img = image.imread(imagefile)
+    # if an image is available, draw the image
+    if img is not None:
         img = img[:, :, :3]  # Keep only the first three channels (RGB)
 
         # width and height of the image
@@ -67,6 +79,7 @@ def draw_display(dispsize: tuple[int, int], imagefile: str | None = None) -> tup
     return fig, ax
 
 
+@functools.lru_cache(maxsize=8)
 def gaussian(x: int, sx: float, y: int | None = None, sy: float | None = None) -> Any:
     """Returns an array of numpy arrays (a matrix) containing values between
     1 and 0 in a 2D Gaussian distribution
@@ -78,6 +91,9 @@ def gaussian(x: int, sx: float, y: int | None = None, sy: float | None = None) -
     keyword argments
     y		-- height in pixels (default = x)
     sy		-- height standard deviation (default = sx)
+
+    The matrix is cached per argument set and returned read-only, so repeated
+    heatmaps in one process share a single kernel.
     """
 
     # square Gaussian if only x values are passed
@@ -88,61 +104,39 @@ def gaussian(x: int, sx: float, y: int | None = None, sy: float | None = None) -
     # centers
     xo = x / 2
     yo = y / 2
-    # matrix of zeros
-    mat = numpy.zeros([y, x], dtype=float)
     # gaussian matrix
-    for i in range(x):
-        for j in range(y):
-            mat[j, i] = numpy.exp(
-                -1.0 * (((float(i) - xo) ** 2 / (2 * sx * sx)) + ((float(j) - yo) ** 2 / (2 * sy * sy)))
-            )
+    i = numpy.arange(x, dtype=float)[numpy.newaxis, :]
+    j = numpy.arange(y, dtype=float)[:, numpy.newaxis]
+    mat = numpy.exp(-1.0 * (((i - xo) ** 2 / (2 * sx * sx)) + ((j - yo) ** 2 / (2 * sy * sy))))
+    mat.setflags(write=False)
 
     return mat
 
 
-def draw_heatmap(
+@traced("gazeHeatplot.heatmap_density", rows=lambda gazepoints, *_, **__: len(gazepoints))
+def heatmap_density(
     gazepoints: list[tuple[int, int, int]],
     dispsize: tuple[int, int],
-    imagefile: str | None = None,
-    alpha: float = 0.5,
-    savefilename: str | None = None,
     gaussianwh: int = 200,
     gaussiansd: float | None = None,
 ) -> Any:
-    """Draws a heatmap of the provided fixations, optionally drawn over an
-    image, and optionally allocating more weight to fixations with a higher
-    duration.
+    """Returns the accumulated Gaussian density of the provided gazepoints as
+    a matrix with a size of dispsize (rows = height, columns = width)
 
     arguments
 
-    gazepoints		-	a list of gazepoint tuples (x, y)
+    gazepoints		-	a list of gazepoint tuples (x, y, weight)
 
     dispsize		-	tuple or list indicating the size of the display,
                     e.g. (1024,768)
 
     keyword arguments
 
-    imagefile		-	full path to an image file over which the heatmap
-                    is to be laid, or None for no image; NOTE: the image
-                    may be smaller than the display size, the function
-                    assumes that the image was presented at the centre of
-                    the display (default = None)
-    alpha		-	float between 0 and 1, indicating the transparancy of
-                    the heatmap, where 0 is completely transparant and 1
-                    is completely untransparant (default = 0.5)
-    savefilename	-	full path to the file in which the heatmap should be
-                    saved, or None to not save the file (default = None)
-
-    returns
-
-    fig			-	a matplotlib.pyplot Figure instance, containing the
-                    heatmap
+    gaussianwh		-	width and height of the Gaussian kernel (default = 200)
+    gaussiansd		-	standard deviation of the Gaussian kernel, or None
+                    for gaussianwh / 6 (default = None)
     """
 
-    # IMAGE
-    fig, ax = draw_display(dispsize, imagefile=imagefile)
-
-    # HEATMAP
     # Gaussian
     gwh = gaussianwh
     gsdwh = gwh / 6 if (gaussiansd is None) else gaussiansd
@@ -181,10 +175,68 @@ def draw_heatmap(
             heatmap[int(y) : int(y + gwh), int(x) : int(x + gwh)] += gaus * gazepoints[i][2]
     # resize heatmap
     strt = int(strt)
-    heatmap = heatmap[strt : dispsize[1] + strt, strt : dispsize[0] + strt]
+    return heatmap[strt : dispsize[1] + strt, strt : dispsize[0] + strt]
+
+
+@traced("gazeHeatplot.draw_heatmap", rows=lambda gazepoints, *_, **__: len(gazepoints))
+def draw_heatmap(
+    gazepoints: list[tuple[int, int, int]],
+    dispsize: tuple[int, int],
+    imagefile: str | None = None,
+    alpha: float = 0.5,
+    savefilename: str | None = None,
+    gaussianwh: int = 200,
+    gaussiansd: float | None = None,
+    img: Any = None,
+    density: Any = None,
+) -> Any:
+    """Draws a heatmap of the provided fixations, optionally drawn over an
+    image, and optionally allocating more weight to fixations with a higher
+    duration.
+
+    arguments
+
+    gazepoints		-	a list of gazepoint tuples (x, y, weight)
+
+    dispsize		-	tuple or list indicating the size of the display,
+                    e.g. (1024,768)
+
+    keyword arguments
+
+    imagefile		-	full path to an image file over which the heatmap
+                    is to be laid, or None for no image; NOTE: the image
+                    may be smaller than the display size, the function
+                    assumes that the image was presented at the centre of
+                    the display (default = None)
+    alpha		-	float between 0 and 1, indicating the transparancy of
+                    the heatmap, where 0 is completely transparant and 1
+                    is completely untransparant (default = 0.5)
+    savefilename	-	full path to the file in which the heatmap should be
+                    saved, or None to not save the file (default = None)
+    img		-	an already decoded background image, used instead of
+                    imagefile (default = None)
+    density		-	a precomputed density grid (as returned by
+                    heatmap_density) to draw instead of accumulating the
+                    gazepoints, e.g. from another density engine
+                    (default = None)
+
+    returns
+
+    fig			-	a matplotlib.pyplot Figure instance, containing the
+                    heatmap
+    """
+
+    # IMAGE
+    fig, ax = draw_display(dispsize, imagefile=imagefile, img=img)
+
+    # HEATMAP
+    if density is None:
+        heatmap = heatmap_density(gazepoints, dispsize, gaussianwh=gaussianwh, gaussiansd=gaussiansd)
+    else:
+        heatmap = numpy.array(density, dtype=float)
     # remove zeros
     lowbound = numpy.mean(heatmap[heatmap > 0])
-    heatmap[heatmap < lowbound] = numpy.NaN
+    heatmap[heatmap < lowbound] = numpy.nan
     # draw heatmap on top of image
     ax.imshow(heatmap, cmap="jet", alpha=alpha)
 
@@ -198,76 +250,133 @@ def draw_heatmap(
     return fig
 
 
+def gazepoints_from_samples(
+    x: Any,
+    y: Any,
+    t: Any = None,
+    use_fixations: bool = False,
+    max_step: float = FIX_MAX_STEP,
+    min_duration: float = FIX_MIN_DURATION,
+) -> list[tuple[int, int, int]]:
+    """Build the (x, y, weight) gazepoint tuples expected by draw_heatmap.
+
+    Raw samples get a weight of 1 each; in fixation mode the samples are first
+    collapsed into fixations and the weight is the fixation duration in ms.
+    """
+    if not use_fixations:
+        return [(int(px), int(py), 1) for px, py in zip(x, y, strict=True)]
+
+    fixations = detect_fixations(x, y, t, max_step=max_step, min_duration=min_duration)
+    # weight in the third slot is the fixation duration in milliseconds
+    return [
+        (int(fx), int(fy), max(1, round(d * 1000)))
+        for fx, fy, d in zip(fixations["x"], fixations["y"], fixations["duration"], strict=True)
+    ]
+
+
 ##################
 #     Parsing    #
 ##################
 
-parser = argparse.ArgumentParser(description="Parameters required for processing.")
-
-# required args
-parser.add_argument("input-path", type=str, help="path to the csv input")
-parser.add_argument("display-width", type=int, help="an integer representing the display width")
-parser.add_argument("display-height", type=int, help="an integer representing the display height")
-
-# optional args
-parser.add_argument(
-    "-a",
-    "--alpha",
-    type=float,
-    default="0.5",
-    required=False,
-    help="alpha for the gaze overlay",
-)
-parser.add_argument("-o", "--output-name", type=str, required=False, help="name for the output file")
-parser.add_argument(
-    "-b",
-    "--background-image",
-    type=str,
-    default=None,
-    required=False,
-    help="path to the background image",
-)
-
-# advanced optional args
-parser.add_argument(
-    "-n",
-    "--n-gaussian-matrix",
-    type=int,
-    default="200",
-    required=False,
-    help="width and height of gaussian matrix",
-)
-parser.add_argument(
-    "-sd",
-    "--standard-deviation",
-    type=float,
-    default=None,
-    required=False,
-    help="standard deviation of gaussian distribution",
-)
-
-
-args = vars(parser.parse_args())
-
-input_path = args["input-path"]
-display_width = args["display-width"]
-display_height = args["display-height"]
-alpha = args["alpha"]
-output_name = args["output_name"] if args["output_name"] is not None else "output"
-background_image = args["background_image"]
-ngaussian = args["n_gaussian_matrix"]
-sd = args["standard_deviation"]
-
-
-with open(input_path) as f:
-    reader = csv.reader(f)
-    raw = list(reader)[1:]
-
-    gaza_data: list[Any] = []
-    if len(raw[0]) == 2:
-        gaze_data = [(int(q[0]), int(q[1]), 1) for q in raw]
-    else:
-        gaze_data = [(int(q[0]), int(q[1]), 1) for q in raw]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parameters required for processing.")
+
+    # required args
+    parser.add_argument("input-path", type=str, help="path to the csv input")
+    parser.add_argument("display-width", type=int, help="an integer representing the display width")
+    parser.add_argument("display-height", type=int, help="an integer representing the display height")
+
+    # optional args
+    parser.add_argument(
+        "-a",
+        "--alpha",
+        type=float,
+        default="0.5",
+        required=False,
+        help="alpha for the gaze overlay",
+    )
+    parser.add_argument("-o", "--output-name", type=str, required=False, help="name for the output file")
+    parser.add_argument(
+        "-b",
+        "--background-image",
+        type=str,
+        default=None,
+        required=False,
+        help="path to the background image",
+    )
+
+    # advanced optional args
+    parser.add_argument(
+        "-n",
+        "--n-gaussian-matrix",
+        type=int,
+        default="200",
+        required=False,
+        help="width and height of gaussian matrix",
+    )
+    parser.add_argument(
+        "-sd",
+        "--standard-deviation",
+        type=float,
+        default=None,
+        required=False,
+        help="standard deviation of gaussian distribution",
+    )
+
+    # fixation input mode
+    parser.add_argument(
+        "-f",
+        "--fixations",
+        action="store_true",
+        help="collapse samples into fixations and weight each kernel by fixation duration (ms)",
+    )
+    parser.add_argument(
+        "--max-step",
+        type=float,
+        default=FIX_MAX_STEP,
+        required=False,
+        help="largest sample-to-sample step in pixels that stays within a fixation",
+    )
+    parser.add_argument(
+        "--min-duration",
+        type=float,
+        default=FIX_MIN_DURATION,
+        required=False,
+        help="shortest fixation in seconds kept in fixation mode",
+    )
+
+    args = vars(parser.parse_args())
+
+    input_path = args["input-path"]
+    display_width = args["display-width"]
+    display_height = args["display-height"]
+    alpha = args["alpha"]
+    output_name = args["output_name"] if args["output_name"] is not None else "output"
+    background_image = args["background_image"]
+    ngaussian = args["n_gaussian_matrix"]
+    sd = args["standard_deviation"]
+
+    with open(input_path) as f:
+        reader = csv.reader(f)
+        rows = list(reader)
+    header, raw = rows[0], rows[1:]
+
+    times = None
+    if args["fixations"]:
+        if "time_seconds" not in header:
+            sys.exit("ERROR: fixation mode needs a 'time_seconds' column in the input csv")
+        t_col = header.index("time_seconds")
+        times = [float(q[t_col]) for q in raw]
+
+    gaze_data = gazepoints_from_samples(
+        [float(q[0]) for q in raw],
+        [float(q[1]) for q in raw],
+        times,
+        use_fixations=args["fixations"],
+        max_step=args["max_step"],
+        min_duration=args["min_duration"],
+    )
 
     draw_heatmap(
         gaze_data,
@@ -278,3 +387,7 @@ with open(input_path) as f:
         gaussianwh=ngaussian,
         gaussiansd=sd,
     )
+
+
+if __name__ == "__main__":
+    main()
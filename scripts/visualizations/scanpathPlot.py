@@ -1,34 +1,28 @@
 import argparse
 import math
-import os
+import sys
+from pathlib import Path
 from typing import Any
 
 import matplotlib.pyplot as plt
 import pandas as pd
 
 
-def euclidean_distance(x1: float, y1: float, x2: float, y2: float) -> float:
-    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from instrument import traced  # noqa: E402
+from metrics import record_scanpath, scanpath_metrics  # noqa: E402
 
 
-def main(args: Any) -> None:
-    # Load data
-    data = pd.read_csv(args.gaze_csv)
-    image = plt.imread(args.image_path)
+def euclidean_distance(x1: float, y1: float, x2: float, y2: float) -> float:
+    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
 
-    parts = args.image_path.split("/")
-    name_post_id_part = parts[-1]  # Assumes format is '.../screenshots/{name}_screenshot_{post_id}.png'
-    name_part, _ = name_post_id_part.split("_screenshot_")
-    post_id_part = _.split(".")[0]
 
-    fig, ax = plt.subplots(figsize=(8, 6))
-    ax.imshow(image)
-    # Initialize plot
-    ax.set_xlim([0, 1920])
-    ax.set_ylim([1080, 0])
+@traced("scanpathPlot.compute_scanpath", rows=lambda data, *_, **__: len(data))
+def compute_scanpath(data: pd.DataFrame, radius: float = 450) -> tuple[list[Any], list[Any], list[Any]]:
+    """Group consecutive gaze samples into scanpath points.
 
-    # Setup variables for plotting
-    radius = 450
+    Returns the x and y coordinates of each point and the time accumulated on it.
+    """
     last_x = data["x"].iloc[0]
     last_y = data["y"].iloc[0]
     accumulated_time = 0
@@ -71,6 +65,25 @@ def main(args: Any) -> None:
     plot_x.append(last_x)
     plot_y.append(last_y)
     times.append(accumulated_time if accumulated_time > 0 else 1)
+    return plot_x, plot_y, times
+
+
+@traced("scanpathPlot.draw_scanpath", rows=lambda data, *_, **__: len(data))
+def draw_scanpath(
+    data: pd.DataFrame, image: Any, savefilename: str | None = None
+) -> tuple[list[Any], list[Any], list[Any]]:
+    """Draw the scanpath of ``data`` over an already decoded ``image``.
+
+    The figure is saved to ``savefilename`` when given and always closed.
+    Returns the scanpath points as computed by compute_scanpath.
+    """
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.imshow(image)
+    # Initialize plot
+    ax.set_xlim([0, 1920])
+    ax.set_ylim([1080, 0])
+
+    plot_x, plot_y, times = compute_scanpath(data)
 
     # Normalize times for circle sizes
     max_time = max(times) if max(times) > 0 else 1
@@ -98,15 +111,25 @@ def main(args: Any) -> None:
     ax.set_xticks([])
     ax.set_yticks([])
 
-    if not os.path.isfile("scans.csv"):
-        with open("scans.csv", "w") as f:
-            f.write("userName,postID,length_plot_x\n")
-    with open("scans.csv", "a") as f:
-        f.write(f"{name_part},{post_id_part},{len(plot_x)}\n")
-    print(name_part, post_id_part)
-
-    plt.savefig(args.output_scanpath, dpi=150, bbox_inches="tight")
+    if savefilename is not None:
+        plt.savefig(savefilename, dpi=150, bbox_inches="tight")
     plt.close(fig)
+    return plot_x, plot_y, times
+
+
+def main(args: Any) -> None:
+    # Load data
+    data = pd.read_csv(args.gaze_csv)
+    image = plt.imread(args.image_path)
+
+    parts = args.image_path.split("/")
+    name_post_id_part = parts[-1]  # Assumes format is '.../screenshots/{name}_screenshot_{post_id}.png'
+    name_part, _ = name_post_id_part.split("_screenshot_")
+    post_id_part = _.split(".")[0]
+
+    plot_x, _plot_y, _times = draw_scanpath(data, image, args.output_scanpath)
+    record_scanpath(name_part, post_id_part, scanpath_metrics(data, len(plot_x)), Path(args.data_dir))
+    print(name_part, post_id_part)
 
 
 if __name__ == "__main__":
@@ -132,6 +155,12 @@ if __name__ == "__main__":
         required=True,
         help="Output path for the generated scanpath image.",
     )
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        default="data",
+        help="Data directory whose catalogue stores the scanpath metrics (default: data).",
+    )
 
     args = parser.parse_args()
     main(args)
@@ -5,35 +5,52 @@ Supports running individual pipeline steps or full pipeline for multiple partici
 """
 
 import argparse
+import json
+import os
 import subprocess
 import sys
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
 
-def run_command(cmd: list[str], description: str, verbose: bool = False) -> bool:
-    """Run a command and return success status."""
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from instrument import span, tracing  # noqa: E402
+from quality import QUALITY_FILE, THRESHOLDS  # noqa: E402
+from steps import STEP_SPECS, is_up_to_date, record_step  # noqa: E402
+
+
+def run_command(cmd: list[str], description: str, verbose: bool = False, out: Callable[..., None] = print) -> bool:
+    """Run a command and return success status.
+
+    Messages go through ``out`` (print by default) so parallel jobs can collect
+    them; output is only streamed live when verbose and printing directly.
+    """
+    live = verbose and out is print
     if verbose:
-        print(f"\nRunning: {' '.join(cmd)}")
+        out(f"\nRunning: {' '.join(cmd)}")
 
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=not verbose,
-            text=True,
-            check=True,
-        )
-        if not verbose and result.stdout:
-            print(result.stdout)
+        with span(f"batch_process.{description}", command=" ".join(cmd)):
+            result = subprocess.run(
+                cmd,
+                capture_output=not live,
+                text=True,
+                check=True,
+            )
+        if not live and result.stdout:
+            out(result.stdout)
         return True
     except subprocess.CalledProcessError as e:
-        print(f"ERROR: {description} failed")
-        if not verbose:
-            print(f"Exit code: {e.returncode}")
+        out(f"ERROR: {description} failed")
+        if not live:
+            out(f"Exit code: {e.returncode}")
             if e.stdout:
-                print(f"Output: {e.stdout}")
+                out(f"Output: {e.stdout}")
             if e.stderr:
-                print(f"Error: {e.stderr}")
+                out(f"Error: {e.stderr}")
         return False
 
 
@@ -45,38 +62,68 @@ def process_participant(
     height: int = 1080,
     verbose: bool = False,
     continue_on_error: bool = False,
+    force: bool = False,
+    thresholds: dict[str, float] | None = None,
+    on_bad_quality: str = "skip",
+    out: Callable[..., None] = print,
+    progress: Callable[[str, str, bool], None] | None = None,
 ) -> dict[str, Any]:
-    """Process a single participant through specified pipeline steps."""
+    """Process a single participant through specified pipeline steps.
+
+    Steps whose outputs are up to date with their inputs (see scripts/steps.py)
+    are skipped unless ``force`` is set. When the 'quality' step finds the
+    session past its ``thresholds``, the remaining steps are skipped, or with
+    ``on_bad_quality="flag"`` run and the participant flagged. Output goes
+    through ``out`` and, when given, ``progress(participant, step, success)``
+    is called after every step.
+    """
     results: dict[str, Any] = {
         "participant": participant,
         "steps": {},
+        "quality": [],
+        "skipped": False,
     }
+    thresholds = thresholds or {option: default for option, (_, _, default) in THRESHOLDS.items()}
 
-    print(f"\n{'=' * 60}")
-    print(f"Processing participant: {participant}")
-    print(f"Steps: {', '.join(steps)}")
-    print(f"{'=' * 60}")
+    out(f"\n{'=' * 60}")
+    out(f"Processing participant: {participant}")
+    out(f"Steps: {', '.join(steps)}")
+    out(f"{'=' * 60}")
 
     data_dir = Path("data") / participant
     gaze_file = data_dir / "gaze.csv"
     gaze_clean_file = data_dir / "gaze_clean.csv"
 
     for step in steps:
-        print(f"\n--- Step: {step} ---")
+        out(f"\n--- Step: {step} ---")
+
+        params: dict[str, Any] = {}
+        if step == "process":
+            params = {"width": width, "height": height}
+        elif step == "quality":
+            params = {"width": width, "height": height, **thresholds}
+        if not force and step in STEP_SPECS and is_up_to_date(data_dir, participant, step, params):
+            out(f"⏭️  Step '{step}' is up to date, skipped")
+            results["steps"][step] = True
+            if progress is not None:
+                progress(participant, step, True)
+            if step == "quality" and not passes_quality(results, data_dir, on_bad_quality, out):
+                break
+            continue
 
         if step == "generate":
             if duration is None:
-                print("ERROR: --duration required for 'generate' step")
+                out("ERROR: --duration required for 'generate' step")
                 results["steps"][step] = False
                 continue
 
             cmd = ["python", "scripts/generate.py", str(duration), participant]
-            success = run_command(cmd, "Data generation", verbose)
+            success = run_command(cmd, "Data generation", verbose, out)
             results["steps"][step] = success
 
         elif step == "process":
             if not gaze_file.exists():
-                print(f"ERROR: Raw gaze file not found: {gaze_file}")
+                out(f"ERROR: Raw gaze file not found: {gaze_file}")
                 results["steps"][step] = False
                 continue
 
@@ -88,53 +135,120 @@ def process_participant(
                 str(width),
                 str(height),
             ]
-            success = run_command(cmd, "Gaze processing", verbose)
+            success = run_command(cmd, "Gaze processing", verbose, out)
+            results["steps"][step] = success
+
+        elif step == "quality":
+            if not gaze_file.exists():
+                out(f"ERROR: Raw gaze file not found: {gaze_file}")
+                results["steps"][step] = False
+                continue
+
+            cmd = ["python", "scripts/quality.py", participant, "--width", str(width), "--height", str(height)]
+            for option, limit in thresholds.items():
+                cmd += [f"--{option.replace('_', '-')}", str(limit)]
+            success = run_command(cmd, "Quality report", verbose, out)
             results["steps"][step] = success
 
         elif step == "match":
             if not gaze_clean_file.exists():
-                print(f"ERROR: Processed gaze file not found: {gaze_clean_file}")
-                print("Run 'process' step first")
+                out(f"ERROR: Processed gaze file not found: {gaze_clean_file}")
+                out("Run 'process' step first")
                 results["steps"][step] = False
                 continue
 
             cmd = ["python", "scripts/match.py", participant]
-            success = run_command(cmd, "Data matching", verbose)
+            success = run_command(cmd, "Data matching", verbose, out)
             results["steps"][step] = success
 
         elif step == "visualize":
             gaze_posts_dir = data_dir / "gaze_posts"
             if not gaze_posts_dir.exists():
-                print(f"ERROR: Gaze posts directory not found: {gaze_posts_dir}")
-                print("Run 'match' step first")
+                out(f"ERROR: Gaze posts directory not found: {gaze_posts_dir}")
+                out("Run 'match' step first")
                 results["steps"][step] = False
                 continue
 
             cmd = ["python", "scripts/visualizations.py", participant]
-            success = run_command(cmd, "Visualization generation", verbose)
+            success = run_command(cmd, "Visualization generation", verbose, out)
             results["steps"][step] = success
 
         elif step == "screenshot":
             if duration is None:
-                print("ERROR: --duration required for 'screenshot' step")
+                out("ERROR: --duration required for 'screenshot' step")
                 results["steps"][step] = False
                 continue
 
             cmd = ["python", "scripts/screenshot.py", participant, str(duration)]
-            success = run_command(cmd, "Screenshot capture", verbose)
+            success = run_command(cmd, "Screenshot capture", verbose, out)
             results["steps"][step] = success
 
+        if progress is not None:
+            progress(participant, step, results["steps"][step])
+
         if not results["steps"][step]:
-            print(f"⚠️  Step '{step}' failed for {participant}")
+            out(f"⚠️  Step '{step}' failed for {participant}")
             if not continue_on_error:
-                print("Stopping processing for this participant")
+                out("Stopping processing for this participant")
                 break
         else:
-            print(f"✅ Step '{step}' completed successfully")
+            record_step(data_dir, participant, step, params)
+            out(f"✅ Step '{step}' completed successfully")
+            if step == "quality" and not passes_quality(results, data_dir, on_bad_quality, out):
+                break
 
     return results
 
 
+def quality_failures(data_dir: Path) -> list[str]:
+    """Threshold failures recorded in a participant's quality report (see scripts/quality.py)."""
+    with open(data_dir / QUALITY_FILE) as f:
+        return list(json.load(f)["failures"])
+
+
+def passes_quality(results: dict[str, Any], data_dir: Path, on_bad_quality: str, out: Callable[..., None]) -> bool:
+    """Record the quality failures in ``results``; False when the remaining steps should be skipped."""
+    results["quality"] = quality_failures(data_dir)
+    if not results["quality"]:
+        return True
+    out(f"🚩 Session below quality thresholds: {'; '.join(results['quality'])}")
+    if on_bad_quality == "flag":
+        return True
+    out("Skipping the remaining steps for this participant")
+    results["skipped"] = True
+    return False
+
+
+def process_parallel(participants: list[str], jobs: int, **kwargs: Any) -> list[dict[str, Any]]:
+    """Process participants concurrently, keeping each participant's steps in order.
+
+    Each job's output is collected and printed as one block when the job
+    finishes; one progress line per step is streamed as it completes. Results
+    are returned in the order of ``participants``.
+    """
+    lock = threading.Lock()
+
+    def report(participant: str, step: str, success: bool) -> None:
+        with lock:
+            status = "✅" if success else "⚠️"
+            print(f"[progress] {status} {participant}: {step}", flush=True)
+
+    def job(participant: str) -> dict[str, Any]:
+        lines: list[str] = []
+
+        def collect(*values: Any) -> None:
+            lines.append(" ".join(str(value) for value in values))
+
+        try:
+            return process_participant(participant, out=collect, progress=report, **kwargs)
+        finally:
+            with lock:
+                print("\n".join(lines), flush=True)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(job, participants))
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Batch process multiple participants through the eye-tracking pipeline",
@@ -142,6 +256,7 @@ def main() -> None:
         epilog="""
 Pipeline Steps:
   generate   - Collect eye-tracking data (requires --duration)
+  quality    - Data-quality report of the raw gaze; sessions past the thresholds are skipped or flagged
   process    - Clean and process raw gaze data
   match      - Match gaze data with posts
   visualize  - Generate heatmaps and scanpaths
@@ -157,6 +272,12 @@ Examples:
   # Collect data for new participants (60 second duration)
   python batch_process.py --participants new_user --steps generate screenshot --duration 60
 
+  # Check the data quality first and skip sessions with more than 20% track loss
+  python batch_process.py --participants alice bob --steps quality process match visualize --max-track-loss 0.2
+
+  # Process four participants at a time
+  python batch_process.py --participants alice bob charlie dave --steps process match visualize --jobs 4
+
   # Run all steps with custom resolution
   python batch_process.py --participants alice --steps process match visualize --width 2560 --height 1440
         """,
@@ -174,7 +295,7 @@ Examples:
         "--steps",
         "-s",
         nargs="+",
-        choices=["generate", "process", "match", "visualize", "screenshot"],
+        choices=["generate", "quality", "process", "match", "visualize", "screenshot"],
         required=True,
         help="Pipeline steps to run",
     )
@@ -213,11 +334,49 @@ Examples:
         help="Continue processing even if a step fails",
     )
 
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-run steps even if their outputs are up to date",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Participants processed concurrently, capped at the CPU count (default: 1)",
+    )
+
+    parser.add_argument(
+        "--on-bad-quality",
+        choices=["skip", "flag"],
+        default="skip",
+        help="Sessions failing the 'quality' step: skip their remaining steps or only flag them (default: skip)",
+    )
+
+    for option, (metric, kind, default) in THRESHOLDS.items():
+        parser.add_argument(
+            f"--{option.replace('_', '-')}",
+            type=float,
+            default=default,
+            help=f"Quality threshold: {kind} {metric} (default: {default})",
+        )
+
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Write a Chrome trace-event JSON of every step to this file and print a summary table",
+    )
+
     args = parser.parse_args()
 
     # Validate duration requirement
     if ("generate" in args.steps or "screenshot" in args.steps) and args.duration is None:
         parser.error("--duration is required when using 'generate' or 'screenshot' steps")
+    if args.jobs > 1 and ("generate" in args.steps or "screenshot" in args.steps):
+        parser.error("'generate' and 'screenshot' record live sessions and cannot run with --jobs")
 
     print("\n" + "=" * 60)
     print("BATCH PROCESSING")
@@ -227,25 +386,32 @@ Examples:
     if args.duration:
         print(f"Duration: {args.duration} seconds")
     print(f"Resolution: {args.width}x{args.height}")
+    jobs = max(1, min(args.jobs, os.cpu_count() or 1, len(args.participants)))
+    if jobs > 1:
+        print(f"Jobs: {jobs}")
     print("=" * 60)
 
-    all_results = []
+    options = {
+        "steps": args.steps,
+        "duration": args.duration,
+        "width": args.width,
+        "height": args.height,
+        "verbose": args.verbose,
+        "continue_on_error": args.continue_on_error,
+        "force": args.force,
+        "thresholds": {option: getattr(args, option) for option in THRESHOLDS},
+        "on_bad_quality": args.on_bad_quality,
+    }
+    with tracing(args.trace):
+        if jobs > 1:
+            all_results = process_parallel(args.participants, jobs, **options)
+        else:
+            all_results = [process_participant(participant, **options) for participant in args.participants]
+
+    # Count successes and failures
     total_success = 0
     total_failed = 0
-
-    for participant in args.participants:
-        results = process_participant(
-            participant,
-            args.steps,
-            args.duration,
-            args.width,
-            args.height,
-            args.verbose,
-            args.continue_on_error,
-        )
-        all_results.append(results)
-
-        # Count successes and failures
+    for results in all_results:
         for _step, success in results["steps"].items():
             if success:
                 total_success += 1
@@ -264,7 +430,12 @@ Examples:
         total_count = len(steps)
 
         status = "✅" if success_count == total_count else "⚠️"
+        if result["quality"]:
+            status = "⏭️" if result["skipped"] else "🚩"
         print(f"{status} {participant}: {success_count}/{total_count} steps succeeded")
+        if result["quality"]:
+            action = "skipped" if result["skipped"] else "flagged"
+            print(f"   {action} for quality: {'; '.join(result['quality'])}")
 
     print("\n" + "-" * 60)
     print(f"Total steps succeeded: {total_success}")
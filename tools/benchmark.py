@@ -0,0 +1,265 @@
+"""
+Benchmark suite for the pipeline stages at growing session sizes.
+
+Generates synthetic sessions (tools/synthetic.py) at each scale, where 1x is
+the size of the example session (12 posts, ~31k samples at 60 Hz) and Nx has
+N times as many posts and samples, then runs every stage on them. Each stage
+runs in a fresh process so its peak RSS is its own. Results are appended to a
+JSONL file tagged with the git commit, so runs from different commits can be
+compared with --compare.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from synthetic import generate_session
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+sys.path.insert(0, str(REPO_ROOT / "scripts" / "visualizations"))
+import instrument  # noqa: E402
+
+
+STAGES = ["process", "process_vectorized", "match", "heatmap", "scanpath"]
+BASE_POSTS = 12
+
+
+def git_commit() -> str:
+    """Short hash of HEAD, with '+dirty' when tracked files have uncommitted changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("+dirty" if dirty else "")
+
+
+def _rendered_posts(base: Path, name: str, limit: int) -> list[tuple[Any, Any]]:
+    """(gaze frame, screenshot) of the first ``limit`` matched posts."""
+    import match
+    import pandas as pd
+    from matplotlib import image
+
+    json_data = match.load_json_data(str(base / f"times/{name}_posts_times.json"))
+    screenshots = match.process_screenshots(str(base / "screenshots"), json_data)
+    posts = []
+    for post_id, filename in zip(screenshots["postID"], screenshots["filename"], strict=True):
+        gaze_file = base / f"gaze_posts/{name}_gaze_{post_id}.csv"
+        if not gaze_file.exists():
+            raise FileNotFoundError(f"{gaze_file} not found; run the match stage first")
+        posts.append((pd.read_csv(gaze_file), image.imread(base / "screenshots" / filename)))
+        if len(posts) == limit:
+            break
+    return posts
+
+
+def run_stage(stage: str, base: Path, name: str, width: int, height: int, render_posts: int) -> dict[str, Any]:
+    """Run one stage on the session in ``base``; called in a fresh worker process.
+
+    Inputs are loaded before the stage span starts, so only the stage itself
+    is measured.
+    """
+    import gazeProcess
+    import match
+    from gazeHeatplot import draw_heatmap, gazepoints_from_samples
+    from matplotlib import pyplot
+    from scanpathPlot import draw_scanpath
+
+    instrument.keep_events()
+    rss_before = instrument.peak_rss_mb()
+    gaze_file, clean_file = str(base / "gaze.csv"), str(base / "gaze_clean.csv")
+    root = f"{base}/"
+
+    if stage == "process":
+        with instrument.span(f"benchmark.{stage}") as record:
+            gazeProcess.process_gaze_data(gaze_file, clean_file, width, height)
+            with open(gaze_file) as f:
+                record["rows"] = sum(1 for _ in f) - 1
+
+    elif stage == "process_vectorized":
+        with instrument.span(f"benchmark.{stage}") as record:
+            record["rows"] = len(gazeProcess.clean_gaze_frame(gaze_file, width, height))
+
+    elif stage == "match":
+        if not os.path.exists(clean_file):
+            raise FileNotFoundError(f"{clean_file} not found; run the process stage first")
+        with instrument.span(f"benchmark.{stage}") as record:
+            df = match.load_gaze_data(clean_file)
+            record["rows"] = len(df)
+            json_data = match.load_json_data(root + f"times/{name}_posts_times.json")
+            df = match.process_gaze_data(df, json_data)
+            screenshot_df = match.process_screenshots(root + "screenshots/", json_data)
+            match.save_split_files(match.assign_screenshot_filenames(df, screenshot_df), root + "gaze_posts/", name)
+
+    elif stage in ("heatmap", "scanpath"):
+        posts = _rendered_posts(base, name, render_posts)
+        with instrument.span(f"benchmark.{stage}", rows=sum(len(data) for data, _ in posts)):
+            for data, screenshot in posts:
+                if stage == "heatmap":
+                    gazepoints = gazepoints_from_samples(data["x"], data["y"], data["time_seconds"])
+                    pyplot.close(draw_heatmap(gazepoints, (width, height), img=screenshot))
+                else:
+                    draw_scanpath(data, screenshot)
+
+    else:
+        raise ValueError(f"unknown stage {stage!r}")
+
+    event = instrument.events()[-1]
+    return {
+        "stage": stage,
+        "rows": event["args"].get("rows"),
+        "seconds": round(event["dur"] / 1e6, 4),
+        "rows_per_s": event["args"].get("rows_per_s"),
+        "peak_rss_mb": event["args"]["peak_rss_mb"],
+        "rss_growth_mb": round(event["args"]["peak_rss_mb"] - rss_before, 1),
+        "tracemalloc_peak_mb": event["args"].get("tracemalloc_peak_mb"),
+    }
+
+
+def run_benchmarks(
+    scales: list[int],
+    stages: list[str],
+    work_dir: Path,
+    output_file: Path,
+    render_posts: int = 3,
+    width: int = 1920,
+    height: int = 1080,
+) -> list[dict[str, Any]]:
+    """Generate (or reuse) a session per scale, run the stages and append the results to ``output_file``."""
+    commit = git_commit()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for scale in scales:
+        name = f"bench_{scale}x"
+        base = work_dir / name
+        if not (base / "gaze.csv").exists():
+            summary = generate_session(name, work_dir, posts=BASE_POSTS * scale, width=width, height=height)
+            print(f"Generated {name}: {summary['rows']} samples, {summary['posts']} posts")
+
+        for stage in stages:
+            # a fresh process per stage keeps the peak RSS of earlier stages out of the measurement
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_stage, stage, base, name, width, height, render_posts).result()
+            result.update(
+                {
+                    "commit": commit,
+                    "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "scale": scale,
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cpus": os.cpu_count(),
+                }
+            )
+            results.append(result)
+            with open(output_file, "a") as f:
+                f.write(json.dumps(result) + "\n")
+            rate = f"{result['rows_per_s']:.0f} rows/s" if result["rows_per_s"] else "-"
+            print(f"{scale:>4}x {stage:<20} {result['seconds']:>9.3f}s {rate:>16} {result['peak_rss_mb']:>8.1f} MB")
+    return results
+
+
+def compare(results_file: Path, base_commit: str, head_commit: str) -> str:
+    """Table of the latest rows/s and peak RSS per (stage, scale) of two commits, with the speedup."""
+    latest: dict[tuple[str, str, int], dict[str, Any]] = {}
+    with open(results_file) as f:
+        for line in f:
+            result = json.loads(line)
+            if result["commit"] in (base_commit, head_commit):
+                latest[(result["commit"], result["stage"], result["scale"])] = result
+
+    keys = sorted({(stage, scale) for _commit, stage, scale in latest}, key=lambda key: (STAGES.index(key[0]), key[1]))
+    header = f"{'stage':<20} {'scale':>5} {'base s':>9} {'head s':>9} {'speedup':>8} {'base MB':>8} {'head MB':>8}"
+    lines = [header, "-" * len(header)]
+    for stage, scale in keys:
+        base, head = latest.get((base_commit, stage, scale)), latest.get((head_commit, stage, scale))
+        if base is None or head is None:
+            continue
+        speedup = base["seconds"] / head["seconds"] if head["seconds"] else float("inf")
+        lines.append(
+            f"{stage:<20} {scale:>4}x {base['seconds']:>9.3f} {head['seconds']:>9.3f} {speedup:>7.2f}x "
+            f"{base['peak_rss_mb']:>8.1f} {head['peak_rss_mb']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline stages on synthetic sessions",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # All stages at 1x, 10x and 100x
+  python tools/benchmark.py
+
+  # Quick run, reusing the generated sessions next time
+  python tools/benchmark.py --scales 1 10 --stages process_vectorized match --work-dir bench_data
+
+  # Compare two commits recorded in the results file
+  python tools/benchmark.py --compare 1a2b3c4 5d6e7f8
+        """,
+    )
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=[1, 10, 100], help="Session scales (default: 1 10 100)"
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run (default: all)")
+    parser.add_argument(
+        "--output", type=str, default="benchmark_results.jsonl", help="Results file, appended to (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--work-dir", type=str, default=None, help="Keep generated sessions here and reuse them (default: a temp dir)"
+    )
+    parser.add_argument(
+        "--render-posts", type=int, default=3, help="Posts rendered by the heatmap and scanpath stages (default: 3)"
+    )
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument(
+        "--tracemalloc", action="store_true", help="Also record the Python allocation peak of each stage (slower)"
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASE", "HEAD"),
+        help="Compare two commits in the results file instead of running stages",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(Path(args.output), *args.compare))
+        return
+
+    if args.tracemalloc:
+        # inherited by the spawned stage processes
+        os.environ[instrument.TRACEMALLOC_ENV] = "1"
+
+    options = {"render_posts": args.render_posts, "width": args.width, "height": args.height}
+    if args.work_dir is not None:
+        Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+        run_benchmarks(args.scales, args.stages, Path(args.work_dir), Path(args.output), **options)
+    else:
+        with tempfile.TemporaryDirectory(prefix="eyetracker_bench_") as work_dir:
+            run_benchmarks(args.scales, args.stages, Path(work_dir), Path(args.output), **options)
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
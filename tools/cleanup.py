@@ -2,12 +2,42 @@
 Cleanup utility for managing experimental data.
 
 Provides options to clean screenshots, processed data, visualizations, or all data
-for specified participants.
+for specified participants, and a retention mode (--budget) that evicts
+regenerable artifacts, least recently used first, until the data fits a byte budget.
 """
 
 import argparse
+import fnmatch
+import os
+import re
 import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import catalog  # noqa: E402
+from catalog import DATASET_DIR, NON_PARTICIPANT_DIRS  # noqa: E402
+
+
+# Artifacts the pipeline can regenerate, relative to data/<participant>/. Everything
+# else (gaze.csv, screenshots, times, manifest) is source data and is never evicted.
+# aois.json is a source too: layout.py writes it, but it may have been edited by hand.
+# The cohort-wide folders (dataset, gaze index, similarity cache) are all regenerable.
+DERIVED_PATTERNS = [
+    "gaze_clean.csv",
+    "gaze_posts/*.csv",
+    "heatmaps/*.png",
+    "scanpath/*.png",
+    "events.csv",
+    "quality.json",
+    "replay/*.gif",
+    "stitched/*.png",
+    "stitched/*.csv",
+]
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
 
 
 def cleanup_screenshots(participant_name: str, data_dir: str = "data") -> int:
@@ -88,6 +118,135 @@ def cleanup_all(participant_name: str, data_dir: str = "data") -> int:
     return file_count
 
 
+def parse_size(text: str) -> int:
+    """Bytes in a size like '500M', '1.5G' or '2048' (binary units, optional trailing B)."""
+    found = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)I?B?\s*", text.upper())
+    if not found:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+    return int(float(found.group(1)) * SIZE_UNITS[found.group(2)])
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def scan_files(root: Path) -> list[dict[str, Any]]:
+    """Size and last use (latest of atime and mtime) of every file under ``root``."""
+    files = []
+    pending = [str(root)]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append(
+                        {
+                            "path": Path(entry.path),
+                            "size": stat.st_size,
+                            "used_ns": max(stat.st_atime_ns, stat.st_mtime_ns),
+                        }
+                    )
+    return files
+
+
+def is_derived(rel: Path) -> bool:
+    """Whether a file (relative to the data directory) can be regenerated by the pipeline."""
+    if rel.parts[0] in NON_PARTICIPANT_DIRS:
+        return True
+    return any(fnmatch.fnmatch(Path(*rel.parts[1:]).as_posix(), pattern) for pattern in DERIVED_PATTERNS)
+
+
+def owner(rel: Path) -> str | None:
+    """Participant a file (relative to the data directory) belongs to; None for cohort-wide caches."""
+    if rel.parts[0] == DATASET_DIR:
+        return rel.parts[1].removeprefix("participant=")
+    if rel.parts[0] in NON_PARTICIPANT_DIRS:
+        return None
+    return rel.parts[0]
+
+
+def scan_data(data_dir: Path, participants: list[str] | None = None, jobs: int = 8) -> list[dict[str, Any]]:
+    """Every file of the participant folders and their gaze dataset partitions, scanned in parallel.
+
+    Each participant folder and dataset partition is listed by its own thread.
+    Without ``participants``, the cohort-wide caches (gaze index, similarity
+    matrices) are scanned too.
+    """
+    names = participants or catalog.participant_names(data_dir)
+    roots = [data_dir / name for name in names] + [data_dir / DATASET_DIR / f"participant={name}" for name in names]
+    if not participants:
+        roots += [data_dir / name for name in sorted(NON_PARTICIPANT_DIRS - {DATASET_DIR})]
+    roots = [root for root in roots if root.is_dir()]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        files = [file for found in pool.map(scan_files, roots) for file in found]
+    for file in files:
+        rel = file["path"].relative_to(data_dir)
+        file["participant"] = owner(rel)
+        file["derived"] = is_derived(rel)
+    return files
+
+
+def plan_eviction(files: list[dict[str, Any]], budget: int) -> list[dict[str, Any]]:
+    """Derived files to delete, least recently used first, until the total fits ``budget``."""
+    total = sum(file["size"] for file in files)
+    evicted = []
+    for file in sorted((file for file in files if file["derived"]), key=lambda file: file["used_ns"]):
+        if total <= budget:
+            break
+        evicted.append(file)
+        total -= file["size"]
+    return evicted
+
+
+def enforce_budget(
+    budget: int, data_dir: str = "data", participants: list[str] | None = None, dry_run: bool = False
+) -> int:
+    """Evict derived artifacts until the scanned data fits ``budget`` bytes; returns the files deleted."""
+    data_path = Path(data_dir)
+    files = scan_data(data_path, participants)
+    total = sum(file["size"] for file in files)
+    derived = sum(file["size"] for file in files if file["derived"])
+    print(f"Scanned {len(files)} files: {format_size(total)} ({format_size(derived)} regenerable)")
+    print(f"Budget: {format_size(budget)}")
+
+    evicted = plan_eviction(files, budget)
+    freed = sum(file["size"] for file in evicted)
+    for file in evicted:
+        if dry_run:
+            print(f"Would delete: {file['path']} ({format_size(file['size'])})")
+            continue
+        file["path"].unlink(missing_ok=True)
+        print(f"Deleted: {file['path']}")
+
+    if not dry_run:
+        # drop the dataset partition and cache directories left empty, deepest first
+        cohort_dirs = [data_path / name for name in NON_PARTICIPANT_DIRS]
+        emptied = {
+            parent
+            for file in evicted
+            for parent in file["path"].parents
+            if any(parent.is_relative_to(root) and parent != root for root in cohort_dirs)
+        }
+        for folder in sorted(emptied, key=lambda path: len(path.parts), reverse=True):
+            if folder.is_dir() and not any(folder.iterdir()):
+                folder.rmdir()
+        with catalog.open_catalog(data_path) as conn:
+            for name in sorted({file["participant"] for file in evicted} - {None}):
+                catalog.prune_missing(conn, data_path, name)
+
+    remaining = total - freed
+    print(f"{'Would free' if dry_run else 'Freed'} {format_size(freed)}; {format_size(remaining)} in use")
+    if remaining > budget:
+        print(f"WARNING: source data alone exceeds the budget by {format_size(remaining - budget)}")
+    return len(evicted)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Cleanup utility for eye-tracking experiment data",
@@ -105,6 +264,9 @@ Examples:
 
   # Clean processed data but keep raw data
   python cleanup.py --participants alice --processed
+
+  # Keep the whole data directory under 20 GB by evicting old heatmaps, scanpaths, etc.
+  python cleanup.py --budget 20G
         """,
     )
 
@@ -112,8 +274,7 @@ Examples:
         "--participants",
         "-p",
         nargs="+",
-        required=True,
-        help="Participant name(s) to clean data for",
+        help="Participant name(s) to clean data for (default with --budget: every participant)",
     )
 
     parser.add_argument(
@@ -144,6 +305,12 @@ Examples:
         action="store_true",
         help="Delete entire participant directory",
     )
+    group.add_argument(
+        "--budget",
+        type=parse_size,
+        metavar="SIZE",
+        help="Evict regenerable artifacts, least recently used first, until the data fits SIZE (e.g. 500M, 20G)",
+    )
 
     parser.add_argument(
         "--dry-run",
@@ -152,10 +319,17 @@ Examples:
     )
 
     args = parser.parse_args()
+    if args.participants is None and args.budget is None:
+        parser.error("--participants is required unless --budget is given")
 
     if args.dry_run:
         print("DRY RUN MODE - No files will be deleted\n")
 
+    if args.budget is not None:
+        count = enforce_budget(args.budget, args.data_dir, args.participants, args.dry_run)
+        print(f"\n{'Would delete' if args.dry_run else 'Deleted'} {count} file(s)")
+        return
+
     total_deleted = 0
 
     for participant in args.participants:
@@ -164,7 +338,7 @@ Examples:
         print(f"{'=' * 60}")
 
         if args.dry_run:
-            # Just show what exists
+            # Just show what exists; counted on disk, since uncatalogued files are deleted too
             participant_dir = Path(args.data_dir) / participant
             if participant_dir.exists():
                 file_count = sum(1 for _ in participant_dir.rglob("*") if _.is_file())
@@ -183,6 +357,12 @@ Examples:
         elif args.all:
             count = cleanup_all(participant, args.data_dir)
 
+        with catalog.open_catalog(Path(args.data_dir)) as conn:
+            if args.all:
+                conn.execute("DELETE FROM participants WHERE name = ?", (participant,))
+            else:
+                catalog.prune_missing(conn, Path(args.data_dir), participant)
+
         print(f"\nDeleted {count} file(s) for {participant}")
         total_deleted += count
 
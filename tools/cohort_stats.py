@@ -0,0 +1,151 @@
+"""
+Cohort attention statistics joined with the survey answers.
+
+For every (participant, post) the matched gaze is reduced to attention
+metrics with grouped array operations over the whole cohort at once:
+
+- viewing_time: seconds between the first and last gaze sample on the post
+- dwell: summed fixation duration, in seconds
+- fixations and mean_fixation: fixation count and mean duration
+- scanpath_length: distance between consecutive fixations, in pixels
+- dispersion: RMS distance of the gaze samples from their centroid, in pixels
+
+These are joined to the survey fields of the times JSON (``truth``,
+``confidence``, ``PostTimeSpent``, ``SurveyTimeSpent``) into one tidy table,
+one row per participant and post, followed by summary aggregates per post,
+per truth answer and the rank correlations between gaze and survey answers.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy
+import pandas as pd
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import catalog  # noqa: E402
+from aoi import load_cohort_gaze  # noqa: E402
+from dataset import DATASET_NAME, read_gaze  # noqa: E402
+from fixations import detect_fixations  # noqa: E402
+
+
+SURVEY_FIELDS = ["truth", "confidence", "PostTimeSpent", "SurveyTimeSpent"]
+METRICS = ["viewing_time", "dwell", "fixations", "mean_fixation", "scanpath_length", "dispersion"]
+
+
+def load_survey(names: list[str], data_dir: Path = Path("data")) -> pd.DataFrame:
+    """One row per (participant, post) with the survey fields of the times JSONs."""
+    rows = []
+    for name in names:
+        path = data_dir / catalog.artifact_path(name, "times")
+        if not path.is_file():
+            continue
+        with open(path) as f:
+            rows += [
+                {"participant": name, "post_id": int(post["postID"]), **{key: post.get(key) for key in SURVEY_FIELDS}}
+                for post in json.load(f)
+            ]
+    return pd.DataFrame(rows, columns=["participant", "post_id", *SURVEY_FIELDS])
+
+
+def load_dataset_gaze(names: list[str], data_dir: Path = Path("data")) -> pd.DataFrame:
+    """Matched gaze of ``names`` from the Parquet dataset, in the layout of aoi.load_cohort_gaze."""
+    gaze = read_gaze(data_dir / DATASET_NAME, names, columns=["participant", "post_id", "x", "y", "time_seconds"])
+    return gaze.rename(columns={"post_id": "postID"}).astype({"participant": str})
+
+
+def gaze_stats(gaze: pd.DataFrame) -> pd.DataFrame:
+    """Attention metrics per (participant, post) of a cohort gaze frame, computed in group-bys."""
+    gaze = gaze.sort_values(["participant", "postID", "time_seconds"], kind="stable").reset_index(drop=True)
+    keys = gaze.groupby(["participant", "postID"], sort=False).ngroup().to_numpy()
+    grouped = gaze.groupby(keys)
+    stats = grouped.agg(
+        participant=("participant", "first"),
+        post_id=("postID", "first"),
+        samples=("x", "size"),
+        first=("time_seconds", "min"),
+        last=("time_seconds", "max"),
+        var_x=("x", "var"),
+        var_y=("y", "var"),
+    )
+    stats["viewing_time"] = stats["last"] - stats["first"]
+    stats["dispersion"] = numpy.sqrt(stats["var_x"].fillna(0) + stats["var_y"].fillna(0))
+
+    fixations = detect_fixations(gaze["x"], gaze["y"], gaze["time_seconds"], groups=keys)
+    fixation_keys = keys[fixations["first"]]
+    steps = numpy.hypot(numpy.diff(fixations["x"]), numpy.diff(fixations["y"]))
+    # a step only counts between two fixations of the same participant and post
+    same = fixation_keys[1:] == fixation_keys[:-1]
+    groups = len(stats)
+    stats["fixations"] = numpy.bincount(fixation_keys, minlength=groups)
+    stats["dwell"] = numpy.bincount(fixation_keys, weights=fixations["duration"], minlength=groups)
+    stats["scanpath_length"] = numpy.bincount(fixation_keys[1:][same], weights=steps[same], minlength=groups)
+    stats["mean_fixation"] = stats["dwell"] / stats["fixations"].replace(0, numpy.nan)
+    return stats[["participant", "post_id", "samples", *METRICS]].reset_index(drop=True)
+
+
+def cohort_table(gaze: pd.DataFrame, survey: pd.DataFrame) -> pd.DataFrame:
+    """Survey answers with the gaze metrics of the same participant and post (NaN where there is no gaze)."""
+    stats = gaze_stats(gaze) if len(gaze) else pd.DataFrame(columns=["participant", "post_id", "samples", *METRICS])
+    table = survey.merge(stats, on=["participant", "post_id"], how="outer")
+    return table.sort_values(["participant", "post_id"], kind="stable").reset_index(drop=True)
+
+
+def summaries(table: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Aggregates of the tidy table: per post, per truth answer, and gaze/survey rank correlations."""
+    per_post = table.groupby("post_id").agg(
+        participants=("participant", "nunique"),
+        **{metric: (metric, "mean") for metric in METRICS},
+        truth=("truth", "mean"),
+        confidence=("confidence", "mean"),
+    )
+    per_truth = table.groupby("truth").agg(
+        answers=("participant", "size"), **{metric: (metric, "mean") for metric in METRICS}
+    )
+    numeric = table[METRICS + ["truth", "confidence"]].apply(pd.to_numeric, errors="coerce")
+    correlations = numeric.corr(method="spearman").loc[METRICS, ["truth", "confidence"]]
+    return {"per post": per_post, "per truth answer": per_truth, "spearman correlation": correlations}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Per-(participant, post) attention metrics joined with the survey answers",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Every participant with matched gaze, summaries printed
+  python tools/cohort_stats.py --output cohort_stats.csv
+
+  # Read the gaze from the Parquet cohort dataset instead of the CSVs
+  python tools/cohort_stats.py --from-dataset --output cohort_stats.csv
+        """,
+    )
+    parser.add_argument("names", nargs="*", help="Participants (default: every participant with a times JSON)")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the tidy table to this CSV file")
+    parser.add_argument(
+        "--from-dataset", action="store_true", help="Read the gaze from data/gaze_dataset (needs the dataset extra)"
+    )
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    names = args.names or sorted(path.parent.name for path in data_dir.glob("*/times"))
+    try:
+        gaze = load_dataset_gaze(names, data_dir) if args.from_dataset else load_cohort_gaze(names, data_dir)
+    except ImportError as e:
+        sys.exit(f"ERROR: {e}")
+    table = cohort_table(gaze, load_survey(names, data_dir))
+
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"{len(table)} rows written to {args.output}\n")
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.3f}".format):
+        for title, summary in summaries(table).items():
+            print(f"== {title} ==\n{summary}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Group difference heatmaps with a cluster-based permutation test.
+
+Splits the participants who saw a post into two groups by a survey field of
+the times JSON (by default ``truth``: answers above 0 versus below 0), builds
+one gaze density grid per participant and maps the difference between the
+group means. Significance comes from a cluster-based permutation test:
+
+1. a Welch t statistic per pixel, thresholded into clusters of connected
+   pixels whose mass is the sum of their t values;
+2. the group labels are permuted and the largest cluster mass of each
+   permutation forms the null distribution;
+3. the p value of an observed cluster is the share of permutations with a
+   larger maximum mass.
+
+Densities are computed on a downsampled grid (a 2-D histogram blurred by two
+Gaussian matrix products) and normalized per participant. Permutations are
+evaluated in batches, each batch as matrix products of a label matrix with
+all the densities, and the batches are spread across a process pool that
+memory-maps the densities from one file.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import matplotlib
+
+
+matplotlib.use("Agg")
+
+import numpy  # noqa: E402
+import pandas as pd  # noqa: E402
+from matplotlib import image as mpimg, pyplot  # noqa: E402
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import catalog  # noqa: E402
+
+
+def gaussian_matrix(n: int, sd: float) -> numpy.ndarray:
+    """(n, n) matrix whose product with a vector blurs it with a Gaussian of ``sd`` cells."""
+    offsets = numpy.arange(n)[:, numpy.newaxis] - numpy.arange(n)[numpy.newaxis, :]
+    return numpy.exp(-(offsets**2) / (2 * sd**2))
+
+
+def density_grid(
+    x: Any, y: Any, width: int = 1920, height: int = 1080, factor: int = 4, sd: float = 200 / 6
+) -> numpy.ndarray:
+    """Gaze density on a (height / factor, width / factor) grid, blurred by ``sd`` pixels and summing to 1."""
+    rows, cols = height // factor, width // factor
+    hist, _, _ = numpy.histogram2d(y, x, bins=(rows, cols), range=((0, height), (0, width)))
+    grid = gaussian_matrix(rows, sd / factor) @ hist @ gaussian_matrix(cols, sd / factor)
+    total = grid.sum()
+    return grid / total if total > 0 else grid
+
+
+def welch_t(densities: numpy.ndarray, groups: numpy.ndarray) -> numpy.ndarray:
+    """Per-pixel Welch t of group 1 minus group 0, for a batch of label rows.
+
+    ``densities`` is (participants, pixels) and ``groups`` (batch, participants)
+    of 0/1 labels; returns (batch, pixels). Pixels without variance get t = 0.
+    """
+    groups = groups.astype(densities.dtype)
+    n1 = groups.sum(axis=1, keepdims=True)
+    n0 = len(densities) - n1
+    sum1 = groups @ densities
+    squares1 = groups @ densities**2
+    sum0 = densities.sum(axis=0) - sum1
+    squares0 = (densities**2).sum(axis=0) - squares1
+    mean1, mean0 = sum1 / n1, sum0 / n0
+    var1 = numpy.maximum(squares1 - n1 * mean1**2, 0) / (n1 - 1)
+    var0 = numpy.maximum(squares0 - n0 * mean0**2, 0) / (n0 - 1)
+    scale = numpy.sqrt(var1 / n1 + var0 / n0)
+    return numpy.divide(mean1 - mean0, scale, out=numpy.zeros_like(scale), where=scale > 1e-12)
+
+
+def label_clusters(mask: numpy.ndarray) -> numpy.ndarray:
+    """4-connected components of a 2-D mask; labels are pixel indices, -1 outside the mask.
+
+    Every pixel repeatedly takes the smallest label among itself and its
+    neighbours, with pointer jumping (label of its label) to shorten the chains.
+    """
+    height, width = mask.shape
+    background = height * width
+    labels = numpy.where(mask, numpy.arange(background).reshape(height, width), background)
+    while True:
+        spread = labels.copy()
+        numpy.minimum(spread[1:], labels[:-1], out=spread[1:])
+        numpy.minimum(spread[:-1], labels[1:], out=spread[:-1])
+        numpy.minimum(spread[:, 1:], labels[:, :-1], out=spread[:, 1:])
+        numpy.minimum(spread[:, :-1], labels[:, 1:], out=spread[:, :-1])
+        spread[~mask] = background
+        flat = spread.ravel()
+        inside = flat < background
+        flat[inside] = numpy.minimum(flat[inside], flat[flat[inside]])
+        if numpy.array_equal(spread, labels):
+            return numpy.where(mask, labels, -1)
+        labels = spread
+
+
+def clusters(t_map: numpy.ndarray, threshold: float) -> list[dict[str, Any]]:
+    """Positive and negative clusters of ``|t| > threshold`` with their mass (sum of t) and size."""
+    found = []
+    for sign in (1, -1):
+        labels = label_clusters(sign * t_map > threshold)
+        inside = labels >= 0
+        if not inside.any():
+            continue
+        ids, index, sizes = numpy.unique(labels[inside], return_inverse=True, return_counts=True)
+        masses = numpy.bincount(index, weights=t_map[inside])
+        found += [
+            {"label": int(label), "mass": float(mass), "size": int(size)}
+            for label, mass, size in zip(ids, masses, sizes, strict=True)
+        ]
+    return found
+
+
+def max_cluster_mass(t_map: numpy.ndarray, threshold: float) -> float:
+    return max((abs(cluster["mass"]) for cluster in clusters(t_map, threshold)), default=0.0)
+
+
+def _null_chunk(
+    densities_file: str,
+    labels: numpy.ndarray,
+    shape: tuple[int, int],
+    count: int,
+    batch: int,
+    threshold: float,
+    seed: Any,
+) -> list[float]:
+    """Maximum cluster masses of ``count`` label permutations; runs in a pool worker."""
+    densities = numpy.load(densities_file, mmap_mode="r")
+    rng = numpy.random.default_rng(seed)
+    masses = []
+    for start in range(0, count, batch):
+        permuted = rng.permuted(numpy.tile(labels, (min(batch, count - start), 1)), axis=1)
+        for t_map in welch_t(densities, permuted):
+            masses.append(max_cluster_mass(t_map.reshape(shape), threshold))
+    return masses
+
+
+def permutation_test(
+    densities: numpy.ndarray,
+    labels: numpy.ndarray,
+    permutations: int = 1000,
+    threshold: float = 2.0,
+    jobs: int = 1,
+    batch: int = 32,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """Observed t map, its clusters with permutation p values, and the null maxima.
+
+    ``densities`` is (participants, rows, cols) and ``labels`` the 0/1 group of each participant.
+    """
+    shape = densities.shape[1:]
+    flat = numpy.ascontiguousarray(densities.reshape(len(densities), -1))
+    # densities summing to 1 are tiny; scale to a mean of 1 so the variances stay well conditioned
+    flat = flat * flat.shape[1]
+    labels = numpy.asarray(labels, dtype=numpy.int8)
+    t_map = welch_t(flat, labels[numpy.newaxis])[0].reshape(shape)
+
+    chunks = max(1, min(permutations, jobs * 4))
+    counts = [permutations // chunks + (i < permutations % chunks) for i in range(chunks)]
+    seeds = numpy.random.SeedSequence(seed).spawn(chunks)
+    with tempfile.TemporaryDirectory(prefix="eyetracker_diff_") as tmp:
+        densities_file = str(Path(tmp) / "densities.npy")
+        numpy.save(densities_file, flat)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(_null_chunk, densities_file, labels, shape, count, batch, threshold, chunk_seed)
+                for count, chunk_seed in zip(counts, seeds, strict=True)
+            ]
+            null = numpy.array([mass for future in futures for mass in future.result()])
+
+    found = clusters(t_map, threshold)
+    for cluster in found:
+        cluster["p"] = float((1 + numpy.count_nonzero(null >= abs(cluster["mass"]))) / (1 + len(null)))
+    return {"t": t_map, "clusters": sorted(found, key=lambda c: -abs(c["mass"])), "null": null}
+
+
+def load_groups(
+    post_id: int, field: str, split: float, data_dir: Path = Path("data")
+) -> tuple[list[str], numpy.ndarray]:
+    """Participants with gaze on ``post_id`` and their group: 1 when ``field`` > split, 0 when below."""
+    names, labels = [], []
+    for gaze_file in sorted(data_dir.glob(f"*/gaze_posts/*_gaze_{post_id}.csv")):
+        name = gaze_file.parent.parent.name
+        times = data_dir / catalog.artifact_path(name, "times")
+        if not times.is_file() or gaze_file.name != f"{name}_gaze_{post_id}.csv":
+            continue
+        with open(times) as f:
+            answers = {int(post["postID"]): post.get(field) for post in json.load(f)}
+        value = answers.get(post_id)
+        if value is None or value == split:
+            continue
+        names.append(name)
+        labels.append(int(value > split))
+    return names, numpy.array(labels, dtype=numpy.int8)
+
+
+def draw_difference(
+    difference: numpy.ndarray,
+    significant: numpy.ndarray,
+    output: str,
+    width: int,
+    height: int,
+    screenshot: Any = None,
+    title: str = "",
+) -> None:
+    """Difference of the group mean densities over the screenshot, significant clusters outlined."""
+    fig, ax = pyplot.subplots(figsize=(12, 7))
+    if screenshot is not None:
+        ax.imshow(screenshot, extent=(0, width, height, 0))
+    limit = float(numpy.abs(difference).max()) or 1.0
+    shown = ax.imshow(difference, cmap="bwr", vmin=-limit, vmax=limit, alpha=0.6, extent=(0, width, height, 0))
+    if significant.any():
+        rows, cols = significant.shape
+        xs = (numpy.arange(cols) + 0.5) * width / cols
+        ys = (numpy.arange(rows) + 0.5) * height / rows
+        ax.contour(xs, ys, significant, levels=[0.5], colors="black", linewidths=1.5)
+    fig.colorbar(shown, ax=ax, fraction=0.025, label="group 1 - group 0 density")
+    ax.set_title(title)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    fig.savefig(output, dpi=150, bbox_inches="tight")
+    pyplot.close(fig)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Difference heatmap between two participant groups with a cluster permutation test",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Judged true (truth > 0) versus false (truth < 0) for post 20
+  python tools/difference_map.py --post 20
+
+  # High versus low confidence, 5000 permutations on 8 processes
+  python tools/difference_map.py --post 20 --field confidence --split 3 --permutations 5000 --jobs 8
+        """,
+    )
+    parser.add_argument("--post", type=int, required=True, help="Post ID")
+    parser.add_argument("--field", type=str, default="truth", help="Survey field that splits the groups")
+    parser.add_argument("--split", type=float, default=0, help="Group 1 is field > split, group 0 field < split")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--permutations", type=int, default=1000, help="Label permutations (default: 1000)")
+    parser.add_argument("--threshold", type=float, default=2.0, help="Cluster-forming |t| threshold (default: 2.0)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level of the clusters")
+    parser.add_argument("--top", type=int, default=10, help="Clusters listed, largest mass first (default: 10)")
+    parser.add_argument("--downsample", type=int, default=4, help="Grid cell size in screen pixels (default: 4)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the permutations")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Output PNG (default: difference_<post>.png)")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    names, labels = load_groups(args.post, args.field, args.split, data_dir)
+    sizes = numpy.bincount(labels, minlength=2)
+    print(f"Post {args.post}: {sizes[1]} with {args.field} > {args.split:g}, {sizes[0]} below")
+    if sizes.min() < 2:
+        sys.exit("ERROR: each group needs at least 2 participants")
+
+    densities = numpy.stack(
+        [
+            density_grid(gaze["x"], gaze["y"], args.width, args.height, args.downsample)
+            for gaze in (
+                pd.read_csv(data_dir / catalog.artifact_path(name, "gaze_posts", args.post), usecols=["x", "y"])
+                for name in names
+            )
+        ]
+    )
+    result = permutation_test(densities, labels, args.permutations, args.threshold, args.jobs, seed=args.seed)
+
+    significant = numpy.zeros(densities.shape[1:], dtype=bool)
+    print(f"{'cluster':>8} {'mass':>10} {'pixels':>8} {'p':>7}")
+    for cluster in result["clusters"][: args.top]:
+        pixels = cluster["size"] * args.downsample**2
+        print(f"{cluster['label']:>8} {cluster['mass']:>10.1f} {pixels:>8} {cluster['p']:>7.4f}")
+    components = {sign: label_clusters(sign * result["t"] > args.threshold) for sign in (1, -1)}
+    for cluster in result["clusters"]:
+        if cluster["p"] < args.alpha:
+            significant |= components[1 if cluster["mass"] > 0 else -1] == cluster["label"]
+
+    screenshot_file = data_dir / catalog.artifact_path(names[0], "screenshot", args.post)
+    screenshot = mpimg.imread(screenshot_file) if screenshot_file.is_file() else None
+    difference = densities[labels == 1].mean(axis=0) - densities[labels == 0].mean(axis=0)
+    output = args.output or f"difference_{args.post}.png"
+    title = f"Post {args.post}: {args.field} > {args.split:g} minus {args.field} < {args.split:g}"
+    draw_difference(difference, significant, output, args.width, args.height, screenshot, title)
+    print(
+        f"{len(result['clusters'])} clusters, 95th percentile of the null maximum mass: "
+        f"{numpy.percentile(result['null'], 95):.1f}"
+    )
+    print(f"Difference map written to {output}")
+
+
+if __name__ == "__main__":
+    main()
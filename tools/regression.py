@@ -0,0 +1,291 @@
+"""
+Golden-output regression harness for the optimized engines.
+
+Runs each reference implementation and its optimized counterpart on the same
+inputs and compares the results:
+
+- gaze cleaning: process_gaze_data/process_nans vs clean_gaze_frame (exact)
+- post matching: match.process_gaze_data loop vs its vectorized mode (exact)
+- heatmap density: the cached-Gaussian heatmap_density vs a frozen copy of the
+  original draw_heatmap accumulation (per-pixel tolerance)
+- heatmap image: draw_heatmap accumulating itself vs draw_heatmap(density=...)
+  on the frozen density (per-pixel tolerance)
+- stitched density: stitch.accumulate_tiled vs the frozen density, reported
+  only: it clips kernels at the canvas edges, while the original drops every
+  kernel whose corner falls above or left of the screen
+
+Every post also gets a few gazepoints on and beyond the screen edges, since
+recorded gaze (unlike synthetic sessions) has off-screen samples. Tabular
+outputs must be identical; grids and images pass when every pixel is within
+``atol + rtol * max(reference)``. Timings are reported next to the diffs.
+Exits with status 1 when any checked pair differs.
+"""
+
+import argparse
+import contextlib
+import io
+import math
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy
+import pandas as pd
+from matplotlib import image as mpimg, pyplot
+from synthetic import generate_session
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts" / "visualizations"))
+import gazeProcess  # noqa: E402
+import match  # noqa: E402
+from gazeHeatplot import draw_heatmap, gazepoints_from_samples, heatmap_density  # noqa: E402
+from stitch import accumulate_tiled  # noqa: E402
+
+
+# (x, y) as fractions of the screen: corners, edges, and beyond every edge
+EDGE_POINTS = [
+    (0, 0),
+    (1, 1),
+    (0.5, 0),
+    (0, 0.5),
+    (1, 0.5),
+    (0.5, 1),
+    (-0.005, 0.45),
+    (0.45, -0.01),
+    (1.01, 0.3),
+    (0.3, 1.03),
+    (-0.1, -0.1),
+    (1.2, 1.2),
+]
+
+
+def edge_gazepoints(width: int, height: int) -> list[tuple[int, int, int]]:
+    """Gazepoints on and beyond the screen edges, as in recorded gaze."""
+    return [(math.floor(fx * width), math.floor(fy * height), 1) for fx, fy in EDGE_POINTS]
+
+
+def frozen_density(
+    gazepoints: list[tuple[int, int, int]], dispsize: tuple[int, int], gaussianwh: int = 200, gaussiansd: Any = None
+) -> numpy.ndarray:
+    """The heatmap accumulation of the original draw_heatmap, kept verbatim as the reference.
+
+    Note its edge handling: a kernel whose corner falls above or left of the
+    screen raises a shape mismatch, which is suppressed, so that point adds nothing.
+    """
+    gwh = gaussianwh
+    gsdwh = gwh / 6 if (gaussiansd is None) else gaussiansd
+    # the uncached kernel of the original gaussian()
+    i = numpy.arange(gwh, dtype=float)[numpy.newaxis, :]
+    j = numpy.arange(gwh, dtype=float)[:, numpy.newaxis]
+    gaus = numpy.exp(-1.0 * (((i - gwh / 2) ** 2 / (2 * gsdwh * gsdwh)) + ((j - gwh / 2) ** 2 / (2 * gsdwh * gsdwh))))
+    strt = gwh / 2
+    heatmapsize = int(dispsize[1] + 2 * strt), int(dispsize[0] + 2 * strt)
+    heatmap = numpy.zeros(heatmapsize, dtype=float)
+    for i in range(0, len(gazepoints)):
+        x = strt + gazepoints[i][0] - int(gwh / 2)
+        y = strt + gazepoints[i][1] - int(gwh / 2)
+        if (not 0 < x < dispsize[0]) or (not 0 < y < dispsize[1]):
+            hadj = [0, gwh]
+            vadj = [0, gwh]
+            if x < 0:
+                hadj[0] = int(abs(x))
+                x = 0
+            elif dispsize[0] < x:
+                hadj[1] = gwh - int(x - dispsize[0])
+            if y < 0:
+                vadj[0] = int(abs(y))
+                y = 0
+            elif dispsize[1] < y:
+                vadj[1] = gwh - int(y - dispsize[1])
+            with contextlib.suppress(IndexError, ValueError):
+                heatmap[int(y) : int(y) + vadj[1], int(x) : int(x) + hadj[1]] += (
+                    gaus[vadj[0] : vadj[1], hadj[0] : hadj[1]] * gazepoints[i][2]
+                )
+        else:
+            heatmap[int(y) : int(y + gwh), int(x) : int(x + gwh)] += gaus * gazepoints[i][2]
+    strt = int(strt)
+    return heatmap[strt : dispsize[1] + strt, strt : dispsize[0] + strt]
+
+
+def timed(func: Callable[..., Any], *args: Any, **kwargs: Any) -> tuple[Any, float]:
+    """Result and wall time of a call, with its printing silenced."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def compare_frames(reference: pd.DataFrame, candidate: pd.DataFrame) -> tuple[bool, str]:
+    """Exact comparison of two tables: columns, dtypes and every value."""
+    try:
+        pd.testing.assert_frame_equal(reference, candidate, check_exact=True)
+    except AssertionError as e:
+        return False, str(e).strip().splitlines()[0]
+    return True, f"{len(reference)} rows identical"
+
+
+def compare_grids(reference: Any, candidate: Any, atol: float, rtol: float) -> tuple[bool, str]:
+    """Per-pixel comparison: every pixel within ``atol + rtol * max(|reference|)``."""
+    reference = numpy.asarray(reference, dtype=float)
+    candidate = numpy.asarray(candidate, dtype=float)
+    if reference.shape != candidate.shape:
+        return False, f"shape {reference.shape} != {candidate.shape}"
+    tolerance = atol + rtol * float(numpy.abs(reference).max(initial=0))
+    diff = numpy.abs(reference - candidate)
+    off = int(numpy.count_nonzero(diff > tolerance))
+    detail = f"max diff {diff.max(initial=0):.3g} (tol {tolerance:.3g}), {off}/{diff.size} pixels off"
+    return off == 0, detail
+
+
+def tiles_to_grid(tiles: dict[int, numpy.ndarray], tile_height: int, height: int, width: int) -> numpy.ndarray:
+    """Assemble the tiles of accumulate_tiled into a (height, width) grid."""
+    grid = numpy.zeros((height, width), dtype=float)
+    for tile, block in tiles.items():
+        top = tile * tile_height
+        if top < height:
+            grid[top : min(top + tile_height, height)] = block[: height - top]
+    return grid
+
+
+def render(
+    gazepoints: list[tuple[int, int, int]], dispsize: tuple[int, int], screenshot: Any, density: Any = None
+) -> Any:
+    """Decoded RGBA pixels of the heatmap figure, drawn from ``density`` or, without it, the gazepoints."""
+    fig = draw_heatmap(gazepoints, dispsize, img=screenshot, density=density)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    pyplot.close(fig)
+    buffer.seek(0)
+    return mpimg.imread(buffer, format="png")
+
+
+def check_session(
+    base: Path, name: str, width: int, height: int, atol: float, rtol: float, posts: int
+) -> list[dict[str, Any]]:
+    """Run every reference/optimized pair on one participant folder."""
+    checks = []
+
+    def record(
+        check: str, ok: bool, detail: str, reference_s: float, candidate_s: float, report_only: bool = False
+    ) -> None:
+        checks.append(
+            {
+                "check": check,
+                "ok": ok,
+                "detail": detail,
+                "reference_s": reference_s,
+                "candidate_s": candidate_s,
+                "report_only": report_only,
+            }
+        )
+
+    with tempfile.TemporaryDirectory(prefix="eyetracker_regression_") as tmp:
+        reference_file = str(Path(tmp) / "gaze_clean.csv")
+        _, reference_s = timed(gazeProcess.process_gaze_data, str(base / "gaze.csv"), reference_file, width, height)
+        clean, candidate_s = timed(gazeProcess.clean_gaze_frame, str(base / "gaze.csv"), width, height)
+        reference_clean = pd.read_csv(reference_file, dtype=str, keep_default_na=False)
+        candidate_file = str(Path(tmp) / "gaze_clean_candidate.csv")
+        gazeProcess.write_clean_frame(clean, candidate_file)
+        candidate_clean = pd.read_csv(candidate_file, dtype=str, keep_default_na=False)
+        record("gaze_clean", *compare_frames(reference_clean, candidate_clean), reference_s, candidate_s)
+
+        json_data = match.load_json_data(str(base / f"times/{name}_posts_times.json"))
+        gaze = match.load_gaze_data(reference_file)
+        matched, reference_s = timed(match.process_gaze_data, gaze.copy(), json_data)
+        matched_fast, candidate_s = timed(match.process_gaze_data, gaze.copy(), json_data, vectorized=True)
+        record("match.postID", *compare_frames(matched, matched_fast), reference_s, candidate_s)
+
+    screenshots = match.process_screenshots(str(base / "screenshots"), json_data)
+    screenshot_files = dict(zip(screenshots["postID"], screenshots["filename"], strict=True))
+    dispsize = (width, height)
+    for post_id, post in list(match.split_posts(matched).items())[:posts]:
+        gazepoints = gazepoints_from_samples(post["x"], post["y"]) + edge_gazepoints(width, height)
+        reference, reference_s = timed(frozen_density, gazepoints, dispsize)
+        candidate, candidate_s = timed(heatmap_density, gazepoints, dispsize)
+        record(f"density post {post_id}", *compare_grids(reference, candidate, atol, rtol), reference_s, candidate_s)
+        tiles, stitched_s = timed(accumulate_tiled, gazepoints, width, 1024)
+        stitched = tiles_to_grid(tiles, 1024, height, width)
+        record(
+            f"stitched density post {post_id}",
+            *compare_grids(reference, stitched, atol, rtol),
+            reference_s,
+            stitched_s,
+            report_only=True,
+        )
+
+        if post_id not in screenshot_files:
+            continue
+        screenshot = mpimg.imread(base / "screenshots" / screenshot_files[post_id])
+        reference_img, reference_s = timed(render, gazepoints, dispsize, screenshot, reference)
+        candidate_img, candidate_s = timed(render, gazepoints, dispsize, screenshot)
+        record(
+            f"heatmap image post {post_id}",
+            *compare_grids(reference_img, candidate_img, 1.5 / 255, 0.0),
+            reference_s,
+            candidate_s,
+        )
+    return checks
+
+
+def report(checks: list[dict[str, Any]]) -> str:
+    header = f"{'check':<28} {'status':<7} {'reference s':>11} {'optimized s':>11} {'speedup':>8}  diff"
+    lines = [header, "-" * len(header)]
+    for check in checks:
+        speedup = check["reference_s"] / check["candidate_s"] if check["candidate_s"] else float("inf")
+        # report-only pairs are known to differ from the reference and never fail the run
+        status = "ok" if check["ok"] else "differs" if check["report_only"] else "FAIL"
+        lines.append(
+            f"{check['check']:<28} {status:<7} {check['reference_s']:>11.3f} "
+            f"{check['candidate_s']:>11.3f} {speedup:>7.1f}x  {check['detail']}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the optimized engines against the reference implementations",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # On a synthetic session
+  python tools/regression.py
+
+  # On recorded participants (needs gaze.csv, the times JSON and unrenamed screenshots)
+  python tools/regression.py --participants alice bob --posts 5
+        """,
+    )
+    parser.add_argument("--participants", "-p", nargs="+", default=None, help="Participants in --data-dir to check")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument("--posts", type=int, default=3, help="Posts per participant for the heatmap checks")
+    parser.add_argument("--atol", type=float, default=1e-9, help="Absolute per-pixel tolerance for densities")
+    parser.add_argument(
+        "--rtol", type=float, default=1e-9, help="Tolerance relative to the reference maximum for densities"
+    )
+    args = parser.parse_args()
+
+    options = {"width": args.width, "height": args.height, "atol": args.atol, "rtol": args.rtol, "posts": args.posts}
+    checks = []
+    if args.participants:
+        for name in args.participants:
+            checks += check_session(Path(args.data_dir) / name, name, **options)
+    else:
+        with tempfile.TemporaryDirectory(prefix="eyetracker_regression_") as tmp:
+            generate_session("regression", Path(tmp), width=args.width, height=args.height)
+            checks += check_session(Path(tmp) / "regression", "regression", **options)
+
+    print(report(checks))
+    failed = [check["check"] for check in checks if not check["ok"] and not check["report_only"]]
+    if failed:
+        print(f"\n{len(failed)} check(s) failed: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\nAll {sum(not check['report_only'] for check in checks)} checks passed")
+
+
+if __name__ == "__main__":
+    main()
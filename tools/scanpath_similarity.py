@@ -0,0 +1,249 @@
+"""
+Pairwise scanpath similarity between the participants who saw the same post.
+
+Every participant's fixations on a post (fixations.detect_fixations) are
+encoded as a string of regions, the cells of a screen grid (``--grid``) or
+the post's AOIs (``--aois``). Two N x N matrices are computed per post:
+
+- edit: 1 - Levenshtein distance / length of the longer string, the order in
+  which the regions were visited;
+- vector: cosine similarity of the dwell-per-region vectors, how the viewing
+  time was spread, regardless of order.
+
+Edit distances are computed for batches of pairs at once. The dynamic
+programming runs one row at a time over the whole batch, and the in-row
+dependency is folded into a running minimum. Batches are spread over a
+process pool, so hundreds of participants (tens of thousands of pairs per
+post) stay tractable.
+
+Matrices are cached in ``data/similarity/<grid|aois>_<post id>.npz`` under a key of the
+parameters and the sha256 of every participant's gaze for the post, taken
+from the data catalogue, so only posts whose inputs changed are recomputed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy
+import pandas as pd
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import catalog  # noqa: E402
+from aoi import AOI_FILE, load_aois, load_cohort_gaze, load_participant_aois  # noqa: E402
+from attention import aoi_regions, grid_regions  # noqa: E402
+from fixations import detect_fixations  # noqa: E402
+
+
+# Bump when the encoding or the measures change, so cached matrices are recomputed.
+SIMILARITY_VERSION = 1
+CACHE_DIR = catalog.SIMILARITY_DIR
+BATCH_PAIRS = 1024
+
+
+def encode_scanpaths(gaze: pd.DataFrame, regions: numpy.ndarray, region_count: int) -> dict[tuple[str, int], Any]:
+    """Region string (int array) and dwell-per-region vector of every participant and post."""
+    gaze = gaze.assign(region=regions).sort_values(["participant", "postID", "time_seconds"], kind="stable")
+    keys = gaze.groupby(["participant", "postID"], sort=False).ngroup().to_numpy()
+    fixations = detect_fixations(gaze["x"], gaze["y"], gaze["time_seconds"], groups=keys)
+    first = fixations["first"]
+    fixation_keys = keys[first]
+    fixation_regions = gaze["region"].to_numpy()[first]
+    dwell = numpy.zeros((int(keys.max()) + 1 if len(keys) else 0, region_count))
+    numpy.add.at(dwell, (fixation_keys, fixation_regions), fixations["duration"])
+
+    names = gaze.groupby(["participant", "postID"], sort=False).size().index
+    bounds = numpy.searchsorted(fixation_keys, numpy.arange(len(names) + 1))
+    return {
+        (participant, int(post_id)): {
+            "string": fixation_regions[bounds[k] : bounds[k + 1]],
+            "dwell": dwell[k],
+        }
+        for k, (participant, post_id) in enumerate(names)
+    }
+
+
+def edit_distances(strings: numpy.ndarray, lengths: numpy.ndarray, pairs: numpy.ndarray) -> numpy.ndarray:
+    """Levenshtein distance of every ``(i, j)`` row of ``pairs``; ``strings`` is (n, L) padded with -1.
+
+    Rows of the DP table are computed for all pairs at once. Within a row,
+    ``D[j] = min(candidate[j], D[j - 1] + 1)`` unrolls to
+    ``j + cumulative min(candidate[k] - k)``, so each row is a few array operations.
+    """
+    length_a, length_b = lengths[pairs[:, 0]], lengths[pairs[:, 1]]
+    width = int(length_b.max(initial=0))
+    a, b = strings[pairs[:, 0]], strings[pairs[:, 1], :width]
+    columns = numpy.arange(width + 1, dtype=numpy.int32)
+    row = numpy.broadcast_to(columns, (len(pairs), width + 1)).copy()
+    candidate = numpy.empty_like(row)
+    distances = numpy.where(length_a == 0, length_b, 0)
+    rows = numpy.arange(len(pairs))
+    for i in range(1, int(length_a.max(initial=0)) + 1):
+        candidate[:, 0] = i
+        numpy.minimum(row[:, 1:] + 1, row[:, :-1] + (a[:, i - 1 : i] != b), out=candidate[:, 1:])
+        candidate -= columns
+        numpy.minimum.accumulate(candidate, axis=1, out=row)
+        row += columns
+        done = length_a == i
+        distances[done] = row[rows[done], length_b[done]]
+    return distances
+
+
+def _edit_chunk(strings: numpy.ndarray, lengths: numpy.ndarray, pairs: numpy.ndarray) -> numpy.ndarray:
+    """Edit similarity of a batch of pairs; runs in a pool worker."""
+    longest = numpy.maximum(lengths[pairs[:, 0]], lengths[pairs[:, 1]])
+    distances = edit_distances(strings, lengths, pairs)
+    return 1 - numpy.divide(distances, longest, out=numpy.zeros(len(pairs)), where=longest > 0)
+
+
+def similarity_matrices(
+    scanpaths: list[dict[str, Any]], jobs: int = 1, batch: int = BATCH_PAIRS
+) -> dict[str, numpy.ndarray]:
+    """Edit and vector similarity matrices of a list of scanpaths from encode_scanpaths."""
+    n = len(scanpaths)
+    lengths = numpy.array([len(path["string"]) for path in scanpaths], dtype=numpy.int64)
+    strings = numpy.full((n, int(lengths.max(initial=0))), -1, dtype=numpy.int64)
+    for k, path in enumerate(scanpaths):
+        strings[k, : lengths[k]] = path["string"]
+
+    upper = numpy.transpose(numpy.triu_indices(n, k=1))
+    # pairs of similar lengths share a batch, so little of each batch's DP is padding
+    upper = upper[numpy.argsort(numpy.maximum(lengths[upper[:, 0]], lengths[upper[:, 1]]), kind="stable")]
+    chunks = [upper[start : start + batch] for start in range(0, len(upper), batch)]
+    if jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_edit_chunk, [strings] * len(chunks), [lengths] * len(chunks), chunks))
+    else:
+        results = [_edit_chunk(strings, lengths, chunk) for chunk in chunks]
+    edit = numpy.eye(n)
+    if chunks:
+        edit[upper[:, 0], upper[:, 1]] = numpy.concatenate(results)
+        edit[upper[:, 1], upper[:, 0]] = edit[upper[:, 0], upper[:, 1]]
+
+    dwell = numpy.array([path["dwell"] for path in scanpaths]).reshape(n, -1)
+    norms = numpy.linalg.norm(dwell, axis=1, keepdims=True)
+    unit = numpy.divide(dwell, norms, out=numpy.zeros_like(dwell), where=norms > 0)
+    return {"edit": edit, "vector": unit @ unit.T}
+
+
+def cache_key(
+    conn: sqlite3.Connection, data_dir: Path, participants: list[str], post_id: int, params: dict[str, Any]
+) -> str:
+    """Hash of the parameters and the catalogued sha256 of every participant's gaze for the post."""
+    hashes = {}
+    for name in participants:
+        rel = catalog.artifact_path(name, "gaze_posts", post_id)
+        catalog.register_files(conn, data_dir, name, "gaze_posts", [(rel, post_id)])
+        row = conn.execute("SELECT sha256 FROM artifacts WHERE path = ?", (rel,)).fetchone()
+        hashes[name] = row["sha256"] if row is not None else "missing"
+    payload = {"version": SIMILARITY_VERSION, "params": params, "gaze": hashes}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def post_similarity(
+    post_id: int,
+    scanpaths: dict[str, dict[str, Any]],
+    data_dir: Path,
+    params: dict[str, Any],
+    jobs: int = 1,
+    aoi_files: list[Path] | None = None,
+) -> dict[str, Any]:
+    """Matrices of one post, from the cache when its key is unchanged."""
+    participants = sorted(scanpaths)
+    cache = data_dir / CACHE_DIR / f"{params['encoding']}_{post_id}.npz"
+    with catalog.open_catalog(data_dir) as conn:
+        key = cache_key(conn, data_dir, participants, post_id, params)
+    if aoi_files:
+        # AOI edits change the encoding without touching the gaze
+        key = hashlib.sha256((key + "".join(path.read_text() for path in aoi_files)).encode()).hexdigest()
+    if cache.is_file():
+        cached = numpy.load(cache)
+        if str(cached["key"]) == key:
+            return {"participants": list(cached["participants"]), "edit": cached["edit"], "vector": cached["vector"]}
+
+    matrices = similarity_matrices([scanpaths[name] for name in participants], jobs)
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    numpy.savez_compressed(cache, key=key, participants=numpy.array(participants), **matrices)
+    return {"participants": participants, **matrices, "computed": True}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pairwise edit and vector scanpath similarity of the participants of every post",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Every participant, 5x5 grid strings, matrices cached in data/similarity/
+  python tools/scanpath_similarity.py
+
+  # AOI strings, CSV matrices per post, 8 processes
+  python tools/scanpath_similarity.py --aois --output similarity_csv --jobs 8
+        """,
+    )
+    parser.add_argument("names", nargs="*", help="Participants (default: every participant with gaze_posts/)")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--posts", type=int, nargs="+", default=None, help="Only these post IDs")
+    parser.add_argument("--grid", type=str, default="5x5", help="Screen grid COLUMNSxROWS (default: 5x5)")
+    parser.add_argument("--aois", action="store_true", help=f"Encode fixations by AOI ({AOI_FILE}) instead of cell")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the matrices as CSVs to this folder")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    names = args.names or sorted(path.parent.name for path in data_dir.glob("*/gaze_posts"))
+    aoi_files: list[Path] = []
+    if args.aois:
+        aois = load_aois(data_dir / AOI_FILE) if (data_dir / AOI_FILE).is_file() else {}
+        participant_aois = load_participant_aois(names, data_dir)
+        posts = set(aois).union(*participant_aois.values())
+        gaze = load_cohort_gaze(names, data_dir, posts if args.posts is None else posts & set(args.posts))
+        regions, region_names = aoi_regions(gaze, aois, participant_aois, args.width, args.height)
+        candidates = [data_dir / AOI_FILE, *(data_dir / name / AOI_FILE for name in names)]
+        aoi_files = [path for path in candidates if path.is_file()]
+        params: dict[str, Any] = {"encoding": "aois", "width": args.width, "height": args.height}
+    else:
+        columns, rows = (int(value) for value in args.grid.lower().split("x"))
+        gaze = load_cohort_gaze(names, data_dir, args.posts)
+        regions, region_names = grid_regions(gaze["x"], gaze["y"], args.width, args.height, (columns, rows))
+        params = {"encoding": "grid", "grid": [columns, rows], "width": args.width, "height": args.height}
+    if gaze.empty:
+        sys.exit("ERROR: no matched gaze found")
+
+    encoded = encode_scanpaths(gaze, regions, len(region_names))
+    by_post: dict[int, dict[str, dict[str, Any]]] = {}
+    for (participant, post_id), scanpath in encoded.items():
+        by_post.setdefault(post_id, {})[participant] = scanpath
+
+    if args.output:
+        Path(args.output).mkdir(parents=True, exist_ok=True)
+    print(f"{'post':>6} {'participants':>12} {'edit':>6} {'vector':>7}  most similar pair (edit)")
+    for post_id in sorted(by_post):
+        result = post_similarity(post_id, by_post[post_id], data_dir, params, args.jobs, aoi_files)
+        participants, edit, vector = result["participants"], result["edit"], result["vector"]
+        n = len(participants)
+        if n >= 2:
+            i, j = numpy.triu_indices(n, k=1)
+            best = int(numpy.argmax(edit[i, j]))
+            pair = f"{participants[i[best]]} / {participants[j[best]]} ({edit[i[best], j[best]]:.2f})"
+            edit_mean, vector_mean = f"{edit[i, j].mean():.2f}", f"{vector[i, j].mean():.2f}"
+        else:
+            pair, edit_mean, vector_mean = "-", "-", "-"
+        status = "" if result.get("computed") else " [cached]"
+        print(f"{post_id:>6} {n:>12} {edit_mean:>6} {vector_mean:>7}  {pair}{status}")
+        if args.output:
+            for measure, matrix in (("edit", edit), ("vector", vector)):
+                frame = pd.DataFrame(matrix, index=participants, columns=participants)
+                frame.to_csv(Path(args.output) / f"{measure}_{post_id}.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Synthetic gaze-session generator.
+
+Writes a participant folder with the same layout and formats the recording
+scripts produce: ``gaze.csv`` (as generate.py saves it), the times JSON
+(as the experiment server exports it) and timestamped screenshots (as
+screenshot.py names them). Gaze follows a fixation/saccade model with blinks
+and single-eye losses, so every stage sees realistic NaN runs.
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import numpy
+import pandas as pd
+from matplotlib import image
+
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+LEAD_IN = 1.0  # seconds of eye-tracker warm-up (all NaN) before the experiment starts
+
+
+def iso(moment: datetime) -> str:
+    """Millisecond ISO 8601 string, like utils.get_current_time_iso8601()."""
+    return moment.strftime(ISO_FORMAT)[:-3] + "Z"
+
+
+def post_schedule(
+    posts: int, post_seconds: float, survey_seconds: float, first_post_id: int = 0
+) -> list[dict[str, Any]]:
+    """Post and survey windows, in seconds from the experiment start, one post after another."""
+    schedule = []
+    start = 0.05
+    for index in range(posts):
+        post_end = start + post_seconds
+        survey_end = post_end + 0.01 + survey_seconds
+        schedule.append(
+            {
+                "postID": first_post_id + index,
+                "PostStartTime": round(start, 3),
+                "PostEndTime": round(post_end, 3),
+                "PostTimeSpent": round(post_end - start, 3),
+                "SurveyStartTime": round(post_end + 0.01, 3),
+                "SurveyEndTime": round(survey_end, 3),
+                "SurveyTimeSpent": round(survey_seconds, 3),
+            }
+        )
+        start = survey_end + 0.05
+    return schedule
+
+
+def gaze_samples(
+    n: int,
+    rng: numpy.random.Generator,
+    fixation_ms: tuple[float, float] = (150, 450),
+    rate: float = 60,
+    jitter: float = 0.004,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Normalized (0-1) x and y of ``n`` samples: fixations at random centres with small jitter."""
+    shortest = max(1, int(fixation_ms[0] / 1000 * rate))
+    lengths = rng.integers(shortest, max(shortest + 1, int(fixation_ms[1] / 1000 * rate)), n // shortest + 1)
+    fixation = numpy.repeat(numpy.arange(len(lengths)), lengths)[:n]
+    centres = rng.uniform(0.05, 0.95, size=(len(lengths), 2))
+    x = centres[fixation, 0] + rng.normal(0, jitter, n)
+    y = centres[fixation, 1] + rng.normal(0, jitter, n)
+    return numpy.clip(x, 0, 1), numpy.clip(y, 0, 1)
+
+
+def loss_mask(n: int, rng: numpy.random.Generator, ratio: float, run_length: int) -> numpy.ndarray:
+    """Boolean mask covering about ``ratio`` of ``n`` samples with runs of ``run_length`` samples."""
+    mask = numpy.zeros(n, dtype=bool)
+    runs = int(n * ratio / max(run_length, 1))
+    if runs == 0:
+        return mask
+    starts = rng.integers(0, max(1, n - run_length), runs)
+    mask[(starts[:, numpy.newaxis] + numpy.arange(run_length)).ravel()] = True
+    return mask
+
+
+def feed_screenshot(post_id: int, frame: int, width: int, height: int) -> numpy.ndarray:
+    """A feed-like RGB frame: grey cards on a light background, laid out from the post id."""
+    rng = numpy.random.default_rng(post_id * 1000 + frame)
+    img = numpy.full((height, width, 3), 0.94, dtype=numpy.float32)
+    top = int(rng.integers(0, height // 8))
+    while top < height:
+        card = int(rng.integers(height // 6, height // 2))
+        left = width // 4
+        img[top : min(top + card, height), left : 3 * width // 4] = rng.uniform(0.5, 1.0, 3)
+        img[top + 10 : min(top + 40, height), left + 10 : left + width // 5] = 0.2
+        top += card + int(rng.integers(10, 40))
+    return img
+
+
+def generate_session(
+    name: str,
+    root: Path = Path("data"),
+    posts: int = 12,
+    post_seconds: float = 25.0,
+    survey_seconds: float = 18.0,
+    rate: float = 60.0,
+    nan_ratio: float = 0.05,
+    blink_ms: float = 150.0,
+    screenshots_per_post: int = 1,
+    width: int = 1920,
+    height: int = 1080,
+    seed: int = 0,
+    start: datetime | None = None,
+) -> dict[str, Any]:
+    """Write a synthetic session for ``name`` under ``root`` and return a summary of it.
+
+    ``nan_ratio`` is split between blinks (both eyes lost for ``blink_ms``)
+    and shorter single-eye losses. The recording starts ``LEAD_IN`` seconds
+    before the experiment with the eyes not yet detected and ends with valid
+    samples, like the real sessions.
+    """
+    rng = numpy.random.default_rng(seed)
+    start = start or datetime(2024, 6, 23, 21, 44, 46, 515000)
+    base = root / name
+    for subdir in ["gaze_posts", "times", "screenshots", "heatmaps", "scanpath"]:
+        (base / subdir).mkdir(parents=True, exist_ok=True)
+
+    schedule = post_schedule(posts, post_seconds, survey_seconds)
+    duration = LEAD_IN + schedule[-1]["SurveyEndTime"] + 1.0
+    n = int(duration * rate)
+    time_seconds = numpy.round(numpy.arange(n) / rate, 6)
+
+    x, y = gaze_samples(n, rng, rate=rate)
+    offset = rng.normal(0, 0.01, size=(2, n))
+    left_x, left_y, right_x, right_y = x - offset[0], y - offset[1], x + offset[0], y + offset[1]
+
+    blinks = loss_mask(n, rng, nan_ratio * 0.8, int(blink_ms / 1000 * rate))
+    single = loss_mask(n, rng, nan_ratio * 0.2, max(1, int(blink_ms / 3000 * rate)))
+    which = rng.random(n) < 0.5
+    left_lost = blinks | (single & which)
+    right_lost = blinks | (single & ~which)
+    lead_in = time_seconds < LEAD_IN
+    tail = numpy.arange(n) >= n - int(rate)
+    left_lost = (left_lost | lead_in) & ~tail
+    right_lost = (right_lost | lead_in) & ~tail
+    for values, lost in ((left_x, left_lost), (left_y, left_lost), (right_x, right_lost), (right_y, right_lost)):
+        values[lost] = numpy.nan
+
+    moments = pd.to_datetime(start) + pd.to_timedelta(time_seconds, unit="s")
+    gaze = pd.DataFrame(
+        {
+            "time_seconds": time_seconds,
+            "current_time": moments.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z",
+            "left_x": left_x,
+            "left_y": left_y,
+            "right_x": right_x,
+            "right_y": right_y,
+        }
+    )
+    gaze.to_csv(base / "gaze.csv", index=False, na_rep="nan")
+
+    initial_date = start + timedelta(seconds=LEAD_IN)
+    times = [
+        {"userName": name, "truth": int(rng.integers(-2, 3)), "confidence": int(rng.integers(1, 6)), **post}
+        for post in schedule
+    ]
+    for entry in times:
+        entry["initialDate"] = iso(initial_date)
+    with open(base / f"times/{name}_posts_times.json", "w") as f:
+        json.dump(times, f, indent=4)
+
+    for post in schedule:
+        window = post["PostEndTime"] - post["PostStartTime"]
+        for frame in range(screenshots_per_post):
+            shot = initial_date + timedelta(
+                seconds=post["PostStartTime"] + window * (frame + 0.5) / screenshots_per_post
+            )
+            filename = "screenshot_" + iso(shot).rstrip("Z").replace(":", "_") + ".png"
+            image.imsave(base / "screenshots" / filename, feed_screenshot(post["postID"], frame, width, height))
+
+    return {
+        "name": name,
+        "rows": n,
+        "posts": posts,
+        "screenshots": posts * screenshots_per_post,
+        "duration": duration,
+        "nan_ratio": float(numpy.mean(numpy.isnan(left_x) | numpy.isnan(right_x))),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic eye-tracking session")
+    parser.add_argument("name", type=str, help="Participant name")
+    parser.add_argument("--data-dir", type=str, default="data", help="Base data directory (default: data)")
+    parser.add_argument("--posts", type=int, default=12, help="Number of posts (default: 12)")
+    parser.add_argument("--post-seconds", type=float, default=25.0, help="Seconds on each post (default: 25)")
+    parser.add_argument("--survey-seconds", type=float, default=18.0, help="Seconds on each survey (default: 18)")
+    parser.add_argument("--rate", type=float, default=60.0, help="Sample rate in Hz (default: 60)")
+    parser.add_argument("--nan-ratio", type=float, default=0.05, help="Fraction of lost samples (default: 0.05)")
+    parser.add_argument("--blink-ms", type=float, default=150.0, help="Blink length in ms (default: 150)")
+    parser.add_argument("--screenshots-per-post", type=int, default=1, help="Frames captured per post (default: 1)")
+    parser.add_argument("--width", type=int, default=1920, help="Screen width in pixels")
+    parser.add_argument("--height", type=int, default=1080, help="Screen height in pixels")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    summary = generate_session(
+        args.name,
+        Path(args.data_dir),
+        posts=args.posts,
+        post_seconds=args.post_seconds,
+        survey_seconds=args.survey_seconds,
+        rate=args.rate,
+        nan_ratio=args.nan_ratio,
+        blink_ms=args.blink_ms,
+        screenshots_per_post=args.screenshots_per_post,
+        width=args.width,
+        height=args.height,
+        seed=args.seed,
+    )
+    print(
+        f"Generated {summary['name']}: {summary['rows']} samples over {summary['duration']:.0f}s, "
+        f"{summary['posts']} posts, {summary['screenshots']} screenshots, {summary['nan_ratio']:.1%} lost"
+    )
+
+
+if __name__ == "__main__":
+    main()
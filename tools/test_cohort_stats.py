@@ -0,0 +1,52 @@
+"""The CSV and Parquet-dataset read paths of tools/cohort_stats.py give the same metrics."""
+
+import sys
+from pathlib import Path
+
+import numpy
+import pandas as pd
+import pytest
+
+
+pytest.importorskip("pyarrow")
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from aoi import load_cohort_gaze  # noqa: E402
+from cohort_stats import gaze_stats, load_dataset_gaze  # noqa: E402
+from dataset import export_participant  # noqa: E402
+from synthetic import gaze_samples  # noqa: E402
+
+
+def write_gaze_posts(data_dir: Path, name: str, posts: int, seed: int) -> None:
+    """Per-post gaze CSVs as match.py writes them, with Tobii-like timestamps far from zero."""
+    rng = numpy.random.default_rng(seed)
+    folder = data_dir / name / "gaze_posts"
+    folder.mkdir(parents=True)
+    start = 97.354072
+    for post_id in range(posts):
+        n = 600
+        x, y = gaze_samples(n, rng)
+        # 60 Hz with clock jitter, microsecond resolution like the recordings
+        t = numpy.round(start + numpy.cumsum(rng.normal(1 / 60, 0.0015, n)), 6)
+        start = t[-1] + 20
+        pd.DataFrame(
+            {
+                "x": (x * 1920).astype(int),
+                "y": (y * 1080).astype(int),
+                "time_seconds": t,
+                "current_time": pd.Timestamp("2024-06-23 21:46:23") + pd.to_timedelta(t, unit="s"),
+                "postID": post_id,
+            }
+        ).to_csv(folder / f"{name}_gaze_{post_id}.csv", index=False)
+
+
+def test_dataset_and_csv_give_identical_gaze_stats(tmp_path: Path) -> None:
+    names = ["alice", "bob", "carol"]
+    for seed, name in enumerate(names):
+        write_gaze_posts(tmp_path, name, posts=8, seed=seed)
+        export_participant(name, tmp_path)
+
+    from_csv = gaze_stats(load_cohort_gaze(names, tmp_path))
+    from_dataset = gaze_stats(load_dataset_gaze(names, tmp_path))
+    assert len(from_csv) == 24
+    pd.testing.assert_frame_equal(from_csv, from_dataset, check_exact=True, check_dtype=False)
@@ -0,0 +1,64 @@
+"""label_clusters of tools/difference_map.py against a breadth-first search."""
+
+import sys
+from collections import deque
+from pathlib import Path
+
+import numpy
+import pytest
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from difference_map import label_clusters  # noqa: E402
+
+
+def bfs_labels(mask: numpy.ndarray) -> numpy.ndarray:
+    """4-connected components labelled by their smallest pixel index, -1 outside the mask."""
+    height, width = mask.shape
+    labels = numpy.full(mask.shape, -1)
+    for start in zip(*numpy.nonzero(mask), strict=True):
+        if labels[start] >= 0:
+            continue
+        component, queue = [start], deque([start])
+        labels[start] = 0
+        while queue:
+            r, c = queue.popleft()
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < height and 0 <= nc < width and mask[nr, nc] and labels[nr, nc] < 0:
+                    labels[nr, nc] = 0
+                    component.append((nr, nc))
+                    queue.append((nr, nc))
+        smallest = min(r * width + c for r, c in component)
+        for pixel in component:
+            labels[pixel] = smallest
+    return labels
+
+
+def spiral(size: int) -> numpy.ndarray:
+    """Nested rings joined into one winding component, a slow case for label propagation."""
+    mask = numpy.zeros((size, size), dtype=bool)
+    top, left, bottom, right = 0, 0, size - 1, size - 1
+    while top <= bottom and left <= right:
+        mask[top, left : right + 1] = True
+        mask[top : bottom + 1, right] = True
+        if top + 2 <= bottom:
+            mask[bottom, left : right + 1] = True
+        if left + 2 <= right and top + 2 <= bottom:
+            mask[top + 2 : bottom + 1, left] = True
+        top, left, bottom, right = top + 2, left + 2, bottom - 2, right - 2
+        if top <= bottom:
+            mask[top - 1, left] = True
+    return mask
+
+
+@pytest.mark.parametrize("density", [0.1, 0.45, 0.6, 0.9])
+def test_random_masks(density: float) -> None:
+    rng = numpy.random.default_rng(int(density * 100))
+    for shape in [(1, 1), (1, 17), (13, 1), (24, 31), (40, 40)]:
+        mask = rng.random(shape) < density
+        numpy.testing.assert_array_equal(label_clusters(mask), bfs_labels(mask))
+
+
+def test_winding_and_empty_masks() -> None:
+    for mask in [spiral(21), spiral(32), ~spiral(21), numpy.zeros((5, 7), dtype=bool), numpy.ones((6, 4), dtype=bool)]:
+        numpy.testing.assert_array_equal(label_clusters(mask), bfs_labels(mask))
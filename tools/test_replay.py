@@ -0,0 +1,36 @@
+"""The streamed GIF of scripts/replay.py decodes to the rendered frames."""
+
+import sys
+from pathlib import Path
+
+import numpy
+from PIL import Image, ImageSequence
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import replay  # noqa: E402
+
+
+def test_gif_frames_match_rendered_frames(tmp_path: Path) -> None:
+    rng = numpy.random.default_rng(0)
+    background = rng.integers(0, 256, (90, 160, 3), dtype=numpy.uint8)
+    t = numpy.arange(120) / 60
+    # a pause in the middle leaves frames without any change
+    t[60:] += 1.5
+    x, y = 80 + 60 * numpy.sin(t * 3), 45 + 30 * numpy.cos(t * 2)
+
+    palette = replay.gif_palette(background)
+    expected = [
+        numpy.asarray(Image.fromarray(canvas).quantize(palette=palette, dither=Image.Dither.NONE).convert("RGB"))
+        for canvas, _box in replay.replay_frames(x, y, t, background, radius=4, trail=0.5)
+    ]
+    count = replay.write_gif(
+        replay.replay_frames(x, y, t, background, radius=4, trail=0.5), background, tmp_path / "r.gif"
+    )
+
+    with Image.open(tmp_path / "r.gif") as gif:
+        frames = [numpy.asarray(frame.convert("RGB")) for frame in ImageSequence.Iterator(gif)]
+    assert count == len(expected) == len(frames)
+    assert all((frame == want).all() for frame, want in zip(frames, expected, strict=True))
+    assert replay.write_gif(iter([]), background, tmp_path / "empty.gif") == 0
+    assert not (tmp_path / "empty.gif").exists()
@@ -0,0 +1,33 @@
+"""edit_distances of tools/scanpath_similarity.py against a reference Levenshtein distance."""
+
+import sys
+from pathlib import Path
+
+import numpy
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from scanpath_similarity import edit_distances  # noqa: E402
+
+
+def levenshtein(a: list[int], b: list[int]) -> int:
+    previous = list(range(len(b) + 1))
+    for i, left in enumerate(a, start=1):
+        current = [i]
+        for j, right in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (left != right)))
+        previous = current
+    return previous[-1]
+
+
+def test_edit_distances_match_levenshtein() -> None:
+    rng = numpy.random.default_rng(0)
+    # short alphabets give many matches, empty strings the edge cases
+    lengths = numpy.concatenate(([0, 0, 1], rng.integers(1, 30, 37)))
+    strings = numpy.full((len(lengths), int(lengths.max())), -1, dtype=numpy.int64)
+    for k, length in enumerate(lengths):
+        strings[k, :length] = rng.integers(0, 2 if k % 2 else 6, length)
+    pairs = numpy.array([(i, j) for i in range(len(lengths)) for j in range(len(lengths))])
+
+    expected = [levenshtein(list(strings[i, : lengths[i]]), list(strings[j, : lengths[j]])) for i, j in pairs]
+    numpy.testing.assert_array_equal(edit_distances(strings, lengths, pairs), expected)
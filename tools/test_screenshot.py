@@ -0,0 +1,70 @@
+"""Frame skipping of scripts/screenshot.py on rendered feed cards."""
+
+import sys
+import types
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+# capture runs without a display here; every test feeds the frames itself
+sys.modules.setdefault("pyautogui", types.SimpleNamespace(screenshot=None))
+import screenshot  # noqa: E402
+
+
+def feed_card(text: str, media: tuple[int, int, int]) -> Image.Image:
+    """A 1920x1080 screen with one feed post: header, two lines of text and a media block."""
+    image = Image.new("RGB", (1920, 1080), (240, 242, 245))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((560, 60, 1360, 1020), fill="white")
+    draw.ellipse((580, 80, 640, 140), fill=(200, 200, 200))
+    draw.text((660, 95), "Page name · 2 h", fill="black")
+    draw.text((590, 170), text, fill="black")
+    draw.text((590, 200), text[::-1], fill="black")
+    draw.rectangle((560, 240, 1360, 900), fill=media)
+    return image
+
+
+def test_distinct_posts_are_not_unchanged() -> None:
+    first = feed_card("Scientists confirm coffee improves memory", (70, 110, 200))
+    second = feed_card("Local council approves new bike lanes today", (80, 115, 195))
+    distance = screenshot.frame_distance(screenshot.frame_thumbnail(first), screenshot.frame_thumbnail(second))
+    assert distance > screenshot.MAX_DISTANCE
+    same = screenshot.frame_distance(screenshot.frame_thumbnail(first), screenshot.frame_thumbnail(first.copy()))
+    assert same == 0
+
+
+def test_capture_keeps_first_frame_of_each_post(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    first = feed_card("Scientists confirm coffee improves memory", (70, 110, 200))
+    second = feed_card("Local council approves new bike lanes today", (80, 115, 195))
+    screens = [first, first, first, second, second, second]
+    ticks = iter(range(len(screens)))
+    encode = screenshot._encode
+    kept = []
+
+    def grab() -> Image.Image:
+        tick = next(ticks)
+        image = screens[tick].copy()
+        image.info["tick"] = tick
+        return image
+
+    def record(image: Image.Image, path: str, screen_number: int) -> None:
+        kept.append(image.info["tick"])
+        encode(image, path, screen_number)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(screenshot.pyautogui, "screenshot", grab)
+    monkeypatch.setattr(screenshot, "_encode", record)
+    # one distinct timestamp (and so filename) per tick
+    stamps = iter(f"2024-05-01T10:00:{second:02d}.000Z" for second in range(len(screens)))
+    monkeypatch.setattr(screenshot, "get_current_time_iso8601", lambda: next(stamps))
+    (tmp_path / "data" / "alice" / "screenshots").mkdir(parents=True)
+
+    frames = screenshot.capture_session("alice", duration=0.05, interval=0.01, encoders=1)
+
+    # each post's first frame and the frame after it are kept, the rest are skipped
+    assert sorted(kept) == [0, 1, 3, 4]
+    assert len(frames) == 4
+    assert len(list((tmp_path / "data" / "alice" / "screenshots").glob("*.png"))) == 4
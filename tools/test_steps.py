@@ -0,0 +1,40 @@
+"""The code of every cached step in scripts/steps.py covers the local modules its script imports."""
+
+import ast
+import sys
+from pathlib import Path
+
+import pytest
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import steps  # noqa: E402
+
+
+def local_imports(path: Path) -> set[str]:
+    """Paths (relative to scripts/) of the scripts/ modules imported by ``path``."""
+    found = set()
+    for node in ast.walk(ast.parse(path.read_text())):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            for folder in [steps.SCRIPTS_DIR, steps.SCRIPTS_DIR / "visualizations"]:
+                if (folder / f"{module}.py").is_file():
+                    found.add((folder / f"{module}.py").relative_to(steps.SCRIPTS_DIR).as_posix())
+    return found
+
+
+@pytest.mark.parametrize("step", sorted(steps.STEP_SPECS))
+def test_step_code_covers_imports(step: str) -> None:
+    code = steps.STEP_SPECS[step]["code"]
+    needed, pending = set(), [code[0]]
+    while pending:
+        script = pending.pop()
+        if script not in needed:
+            needed.add(script)
+            pending += local_imports(steps.SCRIPTS_DIR / script)
+    assert sorted(needed - set(code)) == []